@@ -0,0 +1,123 @@
+import zlib
+from abc import ABC, abstractmethod
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from api import config
+
+
+def latent_click_rate(group_id: str) -> float:
+    """The simulated click-through rate of a group, a fixed value in [CLICK_RATE_MIN, CLICK_RATE_MAX)
+    derived from its id so that every run and every worker agree on it.
+    """
+    unit = zlib.crc32(group_id.encode()) / 2**32
+    return config.CLICK_RATE_MIN + unit * (config.CLICK_RATE_MAX - config.CLICK_RATE_MIN)
+
+
+class AllocationPolicy(ABC):
+    """How each tick splits impressions between the groups of a campaign, when the campaign
+    is done and which of its groups win it.
+
+    `step` works on a batch of campaigns laid out as in `ImpressionScheduler.tick`: one
+    flat array per counter, each campaign's groups contiguous from its entry in `starts`.
+    """
+    name = ""
+
+    @abstractmethod
+    def step(self,
+             rng: np.random.Generator,
+             impressions: np.ndarray,
+             clicks: np.ndarray,
+             starts: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Draw this tick's impressions
+
+        Args:
+            rng (np.random.Generator): the impression random generator
+            impressions (np.ndarray): int64 impressions of every group in the batch
+            clicks (np.ndarray): int64 clicks of every group in the batch
+            starts (np.ndarray): the index of each campaign's first group
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: the impressions to add to each group, and for each campaign
+                whether it's complete once they are added
+        """
+
+    @abstractmethod
+    def champions(self, impressions: Dict[str, int], clicks: Dict[str, int]) -> List[str]:
+        """Get the ids of the winning groups of a completed campaign, ties included"""
+
+
+class UniformPolicy(AllocationPolicy):
+    """Every group gets an independent random number of impressions until all of them reach
+    the target, and the groups with the most impressions win.
+    """
+    name = "uniform"
+
+    def step(self, rng, impressions, clicks, starts):
+        increments = rng.integers(config.IMPRESSION_INCREMENT_MIN,
+                                  config.IMPRESSION_INCREMENT_MAX + 1,
+                                  size=impressions.size)
+        complete = np.minimum.reduceat(impressions + increments, starts) >= config.IMPRESSION_TARGET
+        return increments, complete
+
+    def champions(self, impressions, clicks):
+        best = max(impressions.values())
+        return [gid for gid, n in impressions.items() if n == best]
+
+
+class ThompsonPolicy(AllocationPolicy):
+    """Thompson sampling over a Beta posterior of each group's click rate. A campaign gets the
+    same impressions per tick as under the uniform policy, split in proportion to each group's
+    probability of having the best click rate, estimated from `samples` posterior draws. The
+    campaign stops as soon as one group is the best with probability `confidence`, or once it
+    spent the uniform policy's budget, and the group with the best posterior mean wins.
+
+    A campaign never stops before each of its groups got `min_impressions`: until then, a group
+    gets at least IMPRESSION_INCREMENT_MIN per tick. Otherwise a single group, always the best,
+    would win at tick 1 without a single impression.
+    """
+    name = "thompson"
+
+    def __init__(self,
+                 confidence: float = config.SIM_BANDIT_CONFIDENCE,
+                 samples: int = config.SIM_BANDIT_SAMPLES,
+                 min_impressions: int = config.SIM_BANDIT_MIN_IMPRESSIONS):
+        self.confidence = confidence
+        self.samples = samples
+        self.min_impressions = min_impressions
+
+    def step(self, rng, impressions, clicks, starts):
+        sizes = np.diff(np.append(starts, impressions.size))
+        draws = rng.beta(1 + clicks, 1 + impressions - clicks, size=(self.samples, impressions.size))
+        best = np.repeat(np.maximum.reduceat(draws, starts, axis=1), sizes, axis=1)
+        p_best = (draws == best).mean(axis=0)
+
+        explored = np.minimum.reduceat(impressions, starts) >= self.min_impressions
+        confident = (np.maximum.reduceat(p_best, starts) >= self.confidence) & explored
+        budget = np.repeat(np.where(confident, 0, sizes * (config.IMPRESSION_INCREMENT_MIN + config.IMPRESSION_INCREMENT_MAX) // 2), sizes)
+        increments = np.rint(p_best * budget).astype(np.int64)
+        # Exploration floor for the groups still under min_impressions
+        floor = (impressions < self.min_impressions) & (budget > 0)
+        increments[floor] = np.maximum(increments[floor], config.IMPRESSION_INCREMENT_MIN)
+
+        spent = np.add.reduceat(impressions + increments, starts) >= sizes * config.IMPRESSION_TARGET
+        return increments, confident | spent
+
+    def champions(self, impressions, clicks):
+        means = {gid: (clicks.get(gid, 0) + 1) / (n + 2) for gid, n in impressions.items()}
+        best = max(means.values())
+        return [gid for gid, mean in means.items() if mean == best]
+
+
+def create_policy(name: str = config.SIM_ALLOCATION_POLICY) -> AllocationPolicy:
+    """Create the allocation policy configured by SIM_ALLOCATION_POLICY ("uniform" or "thompson")
+
+    Raises:
+        ValueError: if the policy is unknown
+    """
+    if name == UniformPolicy.name:
+        return UniformPolicy()
+    if name == ThompsonPolicy.name:
+        return ThompsonPolicy()
+    raise ValueError(f"Unknown allocation policy \"{name}\"")
@@ -0,0 +1,66 @@
+import uuid
+import zlib
+from collections import OrderedDict
+from threading import Lock
+from typing import Dict, Hashable, NamedTuple, Optional, Tuple
+
+
+# Distinguishes ETags of this process from ETags handed out before a restart,
+# when the store versions start counting from zero again
+_EPOCH = uuid.uuid4().hex[:8]
+
+
+class CachedResponse(NamedTuple):
+    versions: Tuple[int, ...] # the store versions the body was built from
+    body: bytes
+    headers: Dict[str, str]
+
+
+def make_etag(key: Hashable, versions: Tuple[int, ...]) -> str:
+    """Build a strong ETag for a representation of `key` at the given store versions"""
+    key_hash = zlib.crc32(repr(key).encode())
+    return f'"{_EPOCH}-{"-".join(map(str, versions))}-{key_hash:08x}"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Check an If-None-Match header against the current ETag"""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+class VersionedResponseCache:
+    """An LRU cache of serialized list responses.
+
+    Entries are tagged with the versions of the stores they were built from, and an
+    entry is only served while those versions are unchanged, so only writes invalidate it.
+    """
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, CachedResponse]" = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key: Hashable, versions: Tuple[int, ...]) -> Optional[CachedResponse]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.versions != versions:
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key: Hashable, versions: Tuple[int, ...], body: bytes, headers: Dict[str, str]) -> CachedResponse:
+        entry = CachedResponse(versions, body, headers)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
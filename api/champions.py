@@ -0,0 +1,138 @@
+import heapq
+from datetime import datetime
+from itertools import count
+from threading import Lock
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from shared.models import Champion
+
+
+class ChampionLeaderboard:
+    """Champion groups ranked by their best impression count across finished campaigns.
+
+    Entries live in a binary max-heap (scores negated for heapq) with a hash index from
+    group id to its live entry. Replacing or removing a group only marks its old heap
+    entry dead, and the heap is rebuilt once dead entries outnumber live ones. Top-k walks
+    the heap as a tree with a frontier heap, so it costs O(k log k) plus the dead entries
+    it meets, instead of a scan over every champion.
+    """
+
+    def __init__(self):
+        self._heap: List[list] = [] # [-impressions, seq, Champion, alive]
+        self._entries: Dict[str, list] = {} # {group id: live heap entry}
+        self._seq = count() # breaks ties in favour of the earlier champion
+        self._dead = 0
+        self._lock = Lock()
+        self._listeners: List[Callable[[Tuple[str, ...]], None]] = []
+
+    def subscribe(self, listener: Callable[[Tuple[str, ...]], None]):
+        """Call `listener(group_ids)` after champions are recorded or removed"""
+        self._listeners.append(listener)
+
+    def _notify(self, group_id: str):
+        for listener in self._listeners:
+            listener((group_id,))
+
+    def record(self, group_id: str, campaign_id: str, impressions: int) -> bool:
+        """Record a group as champion of a finished campaign. A group keeps only its best result.
+
+        Returns:
+            bool: True if the leaderboard changed
+        """
+        with self._lock:
+            current = self._entries.get(group_id)
+            if current is not None:
+                if current[2].impressions >= impressions:
+                    return False
+                self._kill(current)
+
+            self._push(Champion(group_id=group_id, campaign_id=campaign_id, impressions=impressions, selected_at=datetime.now()))
+        self._notify(group_id)
+        return True
+
+    def load(self, restored: Iterable[Champion], seqs: Optional[Iterable[int]] = None):
+        """Bulk load champions, e.g. from storage or written by another process, in their original selection order.
+        Listeners are not called.
+        """
+        with self._lock:
+            for champion in sorted(restored, key=lambda c: c.selected_at):
+                current = self._entries.get(champion.group_id)
+                if current is not None:
+                    self._kill(current)
+                self._push(champion)
+
+    def _push(self, champion: Champion):
+        entry = [-champion.impressions, next(self._seq), champion, True]
+        self._entries[champion.group_id] = entry
+        heapq.heappush(self._heap, entry)
+
+    def remove(self, group_id: str) -> bool:
+        """Drop a group from the leaderboard, e.g. when it gets disabled
+
+        Returns:
+            bool: True if the group was a champion
+        """
+        with self._lock:
+            entry = self._entries.pop(group_id, None)
+            if entry is None:
+                return False
+            self._kill(entry)
+        self._notify(group_id)
+        return True
+
+    def unload(self, group_ids: Iterable[str]):
+        """Bulk remove champions, e.g. removed by another process. Listeners are not called."""
+        with self._lock:
+            for group_id in group_ids:
+                entry = self._entries.pop(group_id, None)
+                if entry is not None:
+                    self._kill(entry)
+
+    def get(self, group_id: str) -> Optional[Champion]:
+        entry = self._entries.get(group_id)
+        return None if entry is None else entry[2]
+
+    def top(self, k: Optional[int] = None) -> List[Champion]:
+        """Get the k best champions, best first. Ties go to the earlier champion.
+
+        Args:
+            k (int, optional): number of champions, None for all of them
+        """
+        with self._lock:
+            heap = self._heap
+            if k is None:
+                return [entry[2] for entry in sorted(self._entries.values())]
+
+            found = []
+            frontier = [(heap[0], 0)] if heap else []
+            while frontier and len(found) < k:
+                entry, i = heapq.heappop(frontier)
+                if entry[3]:
+                    found.append(entry[2])
+                for child in (2 * i + 1, 2 * i + 2):
+                    if child < len(heap):
+                        heapq.heappush(frontier, (heap[child], child))
+            return found
+
+    def __contains__(self, group_id: str) -> bool:
+        return group_id in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self._entries))
+
+    def clear(self):
+        with self._lock:
+            self._heap.clear()
+            self._entries.clear()
+            self._dead = 0
+
+    def _kill(self, entry: list):
+        entry[3] = False
+        self._dead += 1
+        if self._dead > len(self._entries):
+            self._heap = [e for e in self._heap if e[3]]
+            heapq.heapify(self._heap)
+            self._dead = 0
@@ -0,0 +1,383 @@
+import json
+from abc import ABC, abstractmethod
+from array import array
+from collections.abc import MutableMapping
+from datetime import datetime, timedelta
+from threading import Lock
+from time import sleep
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from api.store import IndexedStore
+from shared.models import MEDIA, Creative, CreativeGroup, CreativeGroupStatusStrEnum, CreativeTypeStrEnum, EnablingStateEnum
+
+try:
+    import orjson
+except ImportError: # orjson is optional, the json module decodes the same rows slower
+    orjson = None
+
+
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+# Persisted rows decoded per JSON call, so a recovery never holds every row as dicts at once
+DECODE_CHUNK = 10_000
+
+
+class _Enum:
+    """Enum members to small ints and back"""
+
+    def __init__(self, enum: type):
+        self.members = list(enum)
+        self.codes = {member: code for code, member in enumerate(self.members)}
+
+
+class Codec(ABC):
+    """Turns one model into a row of column values and back. `encode` returns None for an
+    entity the columns can't hold exactly, which is then kept as a model.
+    """
+
+    model: type
+    columns: Dict[str, str] # {column name: array typecode, or "" for a list of Python objects}
+    plain: Tuple[str, ...] # the columns holding the model's field of the same name as is
+
+    @abstractmethod
+    def encode(self, entity) -> Optional[Tuple]:
+        """The row of an entity, None if the columns can't hold it exactly"""
+
+    @abstractmethod
+    def encode_json(self, fields: Dict[str, Any]) -> Optional[Tuple]:
+        """Like `encode`, from the decoded JSON of a model instead of the model, so a persisted
+        entity goes into the columns without being validated. Returns None unless `fields`
+        holds every field of the model, with the types the model would have dumped.
+        """
+
+    @abstractmethod
+    def decode(self, key: str, row: List):
+        """The model of the entity stored under `key` as `row`"""
+
+    @staticmethod
+    def encode_time(value: datetime) -> Optional[int]:
+        """Microseconds since 1970 of a naive datetime, None for an aware one"""
+        return None if value.tzinfo is not None else (value - _EPOCH) // _MICROSECOND
+
+    @classmethod
+    def encode_iso_time(cls, value: Any) -> Optional[int]:
+        """`encode_time` of an ISO 8601 string, None if it isn't one"""
+        try:
+            return cls.encode_time(datetime.fromisoformat(value))
+        except (TypeError, ValueError):
+            return None
+
+    @staticmethod
+    def decode_time(value: int) -> datetime:
+        return _EPOCH + timedelta(microseconds=value)
+
+
+class CreativeCodec(Codec):
+    """A creative as its type, enabling state and media flags in 3 bytes, and its update time
+    in 8. The filename is only kept when it isn't the one derived from the title, and the
+    media model is rebuilt from the type, as every creative made by the API has one.
+    """
+
+    model = Creative
+    columns = {"title": "", "filename": "", "type": "b", "enabling_state": "b", "auto_endcard": "b", "updated_at": "q"}
+    plain = ("title",)
+    _types = _Enum(CreativeTypeStrEnum)
+    _states = _Enum(EnablingStateEnum)
+    _fields = Creative.model_fields.keys() # looked up once, the model's property is slow
+
+    def encode(self, entity: Creative) -> Optional[Tuple]:
+        field, extension = MEDIA.get(entity.type, (None, None))
+        media = {name: getattr(entity, name) for name in ("image", "video", "html")}
+        the_media = media.pop(field, None) if field is not None else None
+        updated_at = self.encode_time(entity.updated_at)
+        if the_media is None or the_media.filename != entity.filename or any(media.values()) or updated_at is None:
+            return None
+        filename = None if entity.filename == f"{entity.title}.{extension}" else entity.filename
+        auto_endcard = the_media.auto_endcard if field == "video" else False
+        return (entity.title, filename, self._types.codes[entity.type], self._states.codes[entity.enabling_state],
+                auto_endcard, updated_at)
+
+    def encode_json(self, fields: Dict[str, Any]) -> Optional[Tuple]:
+        if fields.keys() != self._fields:
+            return None
+        title, filename, the_type = fields["title"], fields["filename"], fields["type"]
+        field, extension = MEDIA.get(the_type, (None, None))
+        if field is None or type(title) is not str or not title or type(filename) is not str:
+            return None
+        the_media = fields[field]
+        auto_endcard = the_media.get("auto_endcard") if type(the_media) is dict and field == "video" else False
+        if the_media != ({"filename": filename, "auto_endcard": auto_endcard} if field == "video" else {"filename": filename}) \
+                or type(auto_endcard) is not bool or any(fields[name] is not None for name in ("image", "video", "html") if name != field):
+            return None
+        enabling_state = self._states.codes.get(fields["enabling_state"])
+        updated_at = self.encode_iso_time(fields["updated_at"])
+        if enabling_state is None or updated_at is None:
+            return None
+        return (title, None if filename == f"{title}.{extension}" else filename, self._types.codes[the_type], enabling_state,
+                auto_endcard, updated_at)
+
+    def decode(self, key: str, row: List) -> Creative:
+        title, filename, the_type, enabling_state, auto_endcard, updated_at = row
+        the_type = self._types.members[the_type]
+        field, extension = MEDIA[the_type]
+        filename = filename or f"{title}.{extension}"
+        media = {"filename": filename, "auto_endcard": bool(auto_endcard)} if field == "video" else {"filename": filename}
+        return Creative(id=key, title=title, filename=filename, type=the_type, enabling_state=self._states.members[enabling_state],
+                        updated_at=self.decode_time(updated_at), **{field: media})
+
+
+class CreativeGroupCodec(Codec):
+    """A group with its creative ids as 4-byte slots of the creatives' store, in one array"""
+
+    model = CreativeGroup
+    columns = {"title": "", "description": "", "creative_ids": "", "enabling_state": "b", "status": "b",
+               "impressions": "q", "updated_at": "q"}
+    plain = ("title", "description", "impressions")
+    _states = _Enum(EnablingStateEnum)
+    _statuses = _Enum(CreativeGroupStatusStrEnum)
+    _fields = CreativeGroup.model_fields.keys()
+
+    def __init__(self, creatives: "CompactStore"):
+        """
+        Args:
+            creatives (CompactStore): the store the creative ids refer to
+        """
+        self._creatives = creatives._items
+
+    def encode(self, entity: CreativeGroup) -> Optional[Tuple]:
+        updated_at = self.encode_time(entity.updated_at)
+        if updated_at is None:
+            return None
+        members = array("I", map(self._creatives.intern, entity.creative_ids))
+        return (entity.title, entity.description, members, self._states.codes[entity.enabling_state],
+                self._statuses.codes[entity.status], entity.impressions, updated_at)
+
+    def encode_json(self, fields: Dict[str, Any]) -> Optional[Tuple]:
+        if fields.keys() != self._fields:
+            return None
+        title, description, creative_ids, impressions = fields["title"], fields["description"], fields["creative_ids"], fields["impressions"]
+        if type(title) is not str or type(description) is not str or type(impressions) is not int \
+                or type(creative_ids) is not list or any(type(c_id) is not str for c_id in creative_ids):
+            return None
+        enabling_state, status = self._states.codes.get(fields["enabling_state"]), self._statuses.codes.get(fields["status"])
+        updated_at = self.encode_iso_time(fields["updated_at"])
+        if enabling_state is None or status is None or updated_at is None:
+            return None
+        return (title, description, array("I", map(self._creatives.intern, creative_ids)), enabling_state, status, impressions, updated_at)
+
+    def decode(self, key: str, row: List) -> CreativeGroup:
+        title, description, members, enabling_state, status, impressions, updated_at = row
+        ids = self._creatives.ids
+        return CreativeGroup(id=key, title=title, description=description, creative_ids=[ids[slot] for slot in members],
+                             enabling_state=self._states.members[enabling_state], status=self._statuses.members[status],
+                             impressions=impressions, updated_at=self.decode_time(updated_at))
+
+
+class _Encoded(NamedTuple):
+    """An entity already turned into a row of column values, see `CompactStore.decode_json`"""
+    id: str
+    title: str
+    row: Tuple
+
+
+class _Columns(MutableMapping):
+    """{id: entity} kept as columns instead of models, each entity built again when it's read.
+
+    Ids are interned: each one gets a slot, an index into every column, which it keeps
+    for good, even once removed, so other columns can refer to it with a 4-byte int.
+    Writes happen under the store's lock. Reads don't lock: a per-slot sequence number is
+    odd while the slot is being written, and a read that overlapped a write retries.
+    """
+
+    def __init__(self, codec: Codec):
+        self.codec = codec
+        self.slots: Dict[str, int] = {} # {id: slot}
+        self.ids: List[str] = [] # slot -> id
+        self._columns: List[Any] = [array(typecode) if typecode else [] for typecode in codec.columns.values()]
+        self._blank = [0 if typecode else None for typecode in codec.columns.values()] # values of an empty slot
+        self._present = bytearray()
+        self._writes = array("L") # slot -> sequence number, odd while written
+        self._models: Dict[int, Any] = {} # slot -> entity the columns can't hold
+        self._len = 0
+        self._intern_lock = Lock() # ids are also interned by the stores referring to them, under their own lock
+
+    def intern(self, key: str) -> int:
+        """Get the slot of an id, adding an empty one if it's new"""
+        slot = self.slots.get(key)
+        if slot is not None:
+            return slot
+        with self._intern_lock:
+            slot = self.slots.get(key)
+            if slot is not None:
+                return slot
+            slot = len(self.ids)
+            for column, blank in zip(self._columns, self._blank):
+                column.append(blank)
+            self._present.append(0)
+            self._writes.append(0)
+            self.ids.append(key)
+            self.slots[key] = slot # last, readers only find the slot once it's complete
+        return slot
+
+    def __getitem__(self, key: str):
+        entity = self.get(key)
+        if entity is None:
+            raise KeyError(key)
+        return entity
+
+    def get(self, key: str, default=None):
+        slot = self.slots.get(key)
+        if slot is None:
+            return default
+        present, model, row = self._read(slot, self._columns)
+        if not present:
+            return default
+        return model if model is not None else self.codec.decode(key, row)
+
+    def _read(self, slot: int, columns: List[Any]) -> Tuple[int, Any, List]:
+        """(present, model or None, values of the columns) of one slot, never half written"""
+        while True:
+            before = self._writes[slot]
+            if before & 1:
+                sleep(0) # let the writer finish
+                continue
+            present, model = self._present[slot], self._models.get(slot)
+            row = [column[slot] for column in columns]
+            if self._writes[slot] == before:
+                return present, model, row
+
+    def fields(self, names: Tuple[str, ...], default) -> Optional[List[tuple]]:
+        """See IndexedStore.fields, read from the columns without building the entities, or
+        None if a field isn't kept as is in a column
+        """
+        model_fields = self.codec.model.model_fields
+        if any(name in model_fields and name not in self.codec.plain for name in names):
+            return None
+        columns = [self._columns[list(self.codec.columns).index(name)] if name in model_fields else None for name in names]
+        found = [column for column in columns if column is not None]
+        rows = []
+        for slot in range(len(self.ids)):
+            present, model, row = self._read(slot, found)
+            if not present:
+                continue
+            if model is not None:
+                rows.append((self.ids[slot], *(getattr(model, name) if name in model_fields else default for name in names)))
+            else:
+                values = iter(row)
+                rows.append((self.ids[slot], *(default if column is None else next(values) for column in columns)))
+        return rows
+
+    def __setitem__(self, key: str, entity):
+        slot = self.intern(key)
+        row = entity.row if isinstance(entity, _Encoded) else self.codec.encode(entity)
+        self._writes[slot] += 1
+        try:
+            if row is None:
+                self._models[slot] = entity
+            else:
+                self._models.pop(slot, None)
+                for column, value in zip(self._columns, row):
+                    column[slot] = value
+            if not self._present[slot]:
+                self._present[slot] = 1
+                self._len += 1
+        finally:
+            self._writes[slot] += 1
+
+    def __delitem__(self, key: str):
+        slot = self.slots.get(key)
+        if slot is None or not self._present[slot]:
+            raise KeyError(key)
+        self._writes[slot] += 1
+        self._present[slot] = 0
+        self._models.pop(slot, None)
+        for column, blank in zip(self._columns, self._blank):
+            column[slot] = blank # drop the references
+        self._len -= 1
+        self._writes[slot] += 1
+
+    def __contains__(self, key) -> bool:
+        slot = self.slots.get(key)
+        return slot is not None and self._present[slot] == 1
+
+    def __iter__(self) -> Iterator[str]:
+        # By index, so ids interned meanwhile don't break the iteration
+        ids, present = self.ids, self._present
+        for slot in range(len(ids)):
+            if present[slot]:
+                yield ids[slot]
+
+    def __len__(self) -> int:
+        return self._len
+
+    def clear(self):
+        for key in list(self):
+            del self[key]
+
+    # The default views look every key up again, and fail on one removed meanwhile
+    def values(self) -> Iterator[Any]:
+        return (entity for _, entity in self.items())
+
+    def items(self) -> Iterator[Tuple[str, Any]]:
+        for key in self:
+            entity = self.get(key)
+            if entity is not None:
+                yield key, entity
+
+
+class CompactStore(IndexedStore):
+    """An IndexedStore holding its entities as columns, see `_Columns`, for millions of
+    creatives and groups. Readers get a new model on every read, so `swap` compares the
+    version read by value instead of by identity.
+    """
+
+    def __init__(self, name: str, codec: Codec):
+        super().__init__(name)
+        self._items = _Columns(codec)
+
+    def fields(self, *names: str, default=None):
+        rows = self._items.fields(names, default)
+        return rows if rows is not None else super().fields(*names, default=default)
+
+    def decode_json(self, data: List[bytes]) -> List[Any]:
+        """Decode persisted entities, each the JSON of a model, for `load`. They go straight into
+        column values without building the models; only the ones the columns can't hold
+        exactly are validated into models.
+        """
+        codec = self._items.codec
+        decoded = []
+        for start in range(0, len(data), DECODE_CHUNK):
+            chunk = b"[" + b",".join(data[start:start + DECODE_CHUNK]) + b"]"
+            for fields in (orjson.loads(chunk) if orjson is not None else json.loads(chunk)):
+                row = codec.encode_json(fields)
+                decoded.append(_Encoded(fields["id"], fields["title"], row) if row is not None else codec.model.model_validate(fields))
+        return decoded
+
+    def swap(self, pairs):
+        swapped = []
+        for old, new in pairs:
+            with self.entity_lock(new.id), self._lock:
+                if self._items.get(new.id) == old:
+                    self._items[new.id] = new
+                    swapped.append(new)
+        if swapped:
+            self.touch(*(entity.id for entity in swapped))
+        return swapped
+
+
+def create_stores(layout: str) -> Tuple[IndexedStore[Creative], IndexedStore[CreativeGroup]]:
+    """Create the creatives' and groups' stores
+
+    Args:
+        layout (str): "models" keeps Pydantic models, "compact" columns, see STORE_LAYOUT
+
+    Raises:
+        ValueError: if the layout is unknown
+    """
+    if layout == "models":
+        return IndexedStore("Creative"), IndexedStore("Group")
+    if layout == "compact":
+        creatives = CompactStore("Creative", CreativeCodec())
+        return creatives, CompactStore("Group", CreativeGroupCodec(creatives))
+    raise ValueError(f"Unknown STORE_LAYOUT {layout!r}")
@@ -0,0 +1,79 @@
+import os
+
+
+def _optional_int(name: str):
+    value = os.environ.get(name, "")
+    return int(value) if value else None
+
+
+### Impression simulation ###
+
+SIM_TICK_INTERVAL = float(os.environ.get("SIM_TICK_INTERVAL", "1.0")) # seconds between scheduler ticks
+SIM_MAX_CAMPAIGNS_PER_TICK = int(os.environ.get("SIM_MAX_CAMPAIGNS_PER_TICK", "0")) # 0 means no limit
+SIM_SEED = _optional_int("SIM_SEED") # None means a fresh random seed on every start
+
+IMPRESSION_TARGET = 10000 # a campaign pauses when all its groups reach this many impressions
+IMPRESSION_INCREMENT_MIN = 600
+IMPRESSION_INCREMENT_MAX = 2000
+
+SIM_ALLOCATION_POLICY = os.environ.get("SIM_ALLOCATION_POLICY", "uniform") # "uniform" or "thompson", see api/allocation.py
+SIM_BANDIT_CONFIDENCE = float(os.environ.get("SIM_BANDIT_CONFIDENCE", "0.95")) # thompson stops once a group is best with this probability
+SIM_BANDIT_SAMPLES = int(os.environ.get("SIM_BANDIT_SAMPLES", "200")) # posterior draws per group and tick
+SIM_BANDIT_MIN_IMPRESSIONS = int(os.environ.get("SIM_BANDIT_MIN_IMPRESSIONS", "1000")) # thompson never stops before every group got this many
+CLICK_RATE_MIN = 0.01 # the simulated click-through rates of the groups are spread over [min, max)
+CLICK_RATE_MAX = 0.03
+
+SIM_MAX_ACTIVE_CAMPAIGNS = int(os.environ.get("SIM_MAX_ACTIVE_CAMPAIGNS", "0")) # launches over this many running campaigns are QUEUED, 0 means no limit
+SIM_GUARD_MAX_LAG = float(os.environ.get("SIM_GUARD_MAX_LAG", "0.1")) # seconds of event loop lag before the scheduler backs off, 0 to ignore
+SIM_GUARD_MAX_P99 = float(os.environ.get("SIM_GUARD_MAX_P99", "0.25")) # seconds of recent p99 time to response start before it backs off, 0 to ignore
+SIM_GUARD_WINDOW = 10.0 # seconds of responses the p99 is taken over
+
+### Impression simulation ###
+
+
+### Impression ingestion ###
+
+INGEST_BATCH_SIZE = int(os.environ.get("INGEST_BATCH_SIZE", "50000")) # events aggregated per batch by /impressions:ingest
+
+### Impression ingestion ###
+
+
+### Impression time series ###
+
+TS_MAX_SERIES = int(os.environ.get("TS_MAX_SERIES", "50000")) # max (campaign, group) series kept in memory
+TS_TICK_SLOTS = int(os.environ.get("TS_TICK_SLOTS", "120")) # raw points kept per series
+TS_MINUTE_SLOTS = int(os.environ.get("TS_MINUTE_SLOTS", "240")) # per-minute sums kept per series
+TS_HOUR_SLOTS = int(os.environ.get("TS_HOUR_SLOTS", "168")) # per-hour sums kept per series
+
+### Impression time series ###
+
+
+### Storage ###
+
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "memory") # "memory" or "sqlite"
+STORAGE_PATH = os.environ.get("STORAGE_PATH", "bubbleye.db") # SQLite database file
+STORAGE_FLUSH_INTERVAL = float(os.environ.get("STORAGE_FLUSH_INTERVAL", "0.05")) # seconds between group commits
+STORAGE_CHECKPOINT_ROWS = int(os.environ.get("STORAGE_CHECKPOINT_ROWS", "100000")) # log rows before folding into the snapshot
+STORAGE_LEASE_TTL = float(os.environ.get("STORAGE_LEASE_TTL", "5.0")) # seconds before a silent worker loses the simulator lease
+STORAGE_MAX_WORKERS = int(os.environ.get("STORAGE_MAX_WORKERS", "64")) # worker processes that can share one database
+STORE_LAYOUT = os.environ.get("STORE_LAYOUT", "models") # "models" or "compact": creatives and groups as columns, built into models on read
+
+### Storage ###
+
+
+### Seeding ###
+
+SEED_PROFILE = os.environ.get("SEED_PROFILE", "") # "small", "medium" or "large" (api/seeding.py) loaded into an empty store at startup, "" for none
+SEED = int(os.environ.get("SEED", "0")) # seed of the generated dataset
+
+### Seeding ###
+
+
+### API ###
+
+MAX_PAGE_SIZE = int(os.environ.get("MAX_PAGE_SIZE", "1000")) # upper bound for the `limit` of list endpoints
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1") == "1" # per-route request metrics for /metrics
+FAST_JSON = os.environ.get("FAST_JSON", "0") == "1" # serialize list responses with pydantic-core/orjson instead of jsonable_encoder
+API_WORKERS = int(os.environ.get("API_WORKERS", "1")) # uvicorn worker processes, more than 1 needs STORAGE_BACKEND=sqlite
+
+### API ###
@@ -0,0 +1,246 @@
+import json
+import math
+import struct
+from collections import defaultdict
+from typing import AsyncIterator, Callable, Dict, Iterable, List, Optional, Tuple
+
+from api import config
+from api.store import IndexedStore
+from api.timeseries import TimeSeriesStore
+from shared.models import Campaign
+
+try:
+    import orjson
+except ImportError: # orjson is optional, it only makes parsing faster
+    orjson = None
+
+
+def _finite(value: str) -> float:
+    number = float(value)
+    if not math.isfinite(number):
+        raise ValueError(f"Number {value} is out of range")
+    return number
+
+def _reject_constant(name: str):
+    raise ValueError(f"Unexpected {name}")
+
+def _json_loads(data: bytes):
+    # Rejects NaN, Infinity and overflowing numbers like orjson does, so both give the same 400
+    return json.loads(data, parse_float=_finite, parse_constant=_reject_constant)
+
+
+_loads = orjson.loads if orjson is not None else _json_loads
+_FRAME_HEADER = struct.Struct(">I")
+
+# Impression events are either objects {"campaign_id", "group_id", "count", "ts"}
+# or the compact array form [campaign_id, group_id, count, ts]
+Event = dict | list
+PairCounts = Dict[Tuple[str, str], int] # {(campaign id, group id): impressions}
+
+# Max count of one event. The sums of a batch and the time series rollups then stay far inside int64.
+MAX_EVENT_COUNT = 2**31 - 1
+# Max distance of an event timestamp from the epoch, in seconds, so the time series buckets fit in int64
+MAX_EVENT_TS = 2**53
+
+
+class IngestError(ValueError):
+    """The body of an ingest request can't be parsed"""
+
+
+def _parse_lines(lines: List[bytes]) -> List[Event]:
+    # One parser call for the whole batch instead of one per line
+    try:
+        return _loads(b"[" + b",".join(lines) + b"]")
+    except ValueError as e:
+        raise IngestError(f"Malformed NDJSON: {e}") from None
+
+async def ndjson_batches(chunks: AsyncIterator[bytes], batch_size: int = config.INGEST_BATCH_SIZE) -> AsyncIterator[List[Event]]:
+    """Parse a stream of newline-delimited JSON events into batches, without buffering the whole body
+
+    Args:
+        chunks (AsyncIterator[bytes]): the request body chunks
+        batch_size (int): max events per batch
+
+    Yields:
+        List[Event]: the parsed events of each batch
+    """
+    tail = b""
+    lines: List[bytes] = []
+    async for chunk in chunks:
+        *complete, tail = (tail + chunk).split(b"\n")
+        lines.extend(filter(bytes.strip, complete)) # drops the blank lines without a Python call per line
+        while len(lines) >= batch_size:
+            yield _parse_lines(lines[:batch_size])
+            del lines[:batch_size]
+    if tail.strip():
+        lines.append(tail)
+    if lines:
+        yield _parse_lines(lines)
+
+async def framed_batches(chunks: AsyncIterator[bytes], batch_size: int = config.INGEST_BATCH_SIZE) -> AsyncIterator[List[Event]]:
+    """Parse a stream of length-prefixed frames into batches. Each frame is a 4-byte
+    big-endian length followed by a JSON array of events.
+
+    Args:
+        chunks (AsyncIterator[bytes]): the request body chunks
+        batch_size (int): events to collect before yielding a batch, frames are never split
+
+    Yields:
+        List[Event]: the parsed events of each batch
+    """
+    buffer = bytearray()
+    events: List[Event] = []
+    async for chunk in chunks:
+        buffer += chunk
+        pos = 0
+        while len(buffer) - pos >= _FRAME_HEADER.size:
+            (length,) = _FRAME_HEADER.unpack_from(buffer, pos)
+            end = pos + _FRAME_HEADER.size + length
+            if end > len(buffer):
+                break
+            try:
+                events.extend(_loads(bytes(buffer[pos + _FRAME_HEADER.size:end])))
+            except ValueError as e:
+                raise IngestError(f"Malformed frame: {e}") from None
+            pos = end
+        del buffer[:pos]
+        if len(events) >= batch_size:
+            yield events
+            events = []
+    if buffer:
+        raise IngestError("Truncated frame at the end of the body")
+    if events:
+        yield events
+
+
+def aggregate(events: Iterable[Event]) -> Tuple[PairCounts, int, Optional[float]]:
+    """Sum the event counts per (campaign, group). Events with a negative count or one over
+    MAX_EVENT_COUNT, or a timestamp that isn't a number within MAX_EVENT_TS, are malformed.
+
+    Returns:
+        Tuple[PairCounts, int, Optional[float]]: the summed counts, the number of malformed events skipped, and the latest event timestamp
+    """
+    totals: PairCounts = defaultdict(int)
+    rejected = 0
+    latest = None
+    for event in events:
+        try:
+            if type(event) is dict:
+                campaign_id, group_id, count, ts = event["campaign_id"], event["group_id"], event["count"], event.get("ts")
+            else:
+                campaign_id, group_id, count = event[0], event[1], event[2]
+                ts = event[3] if len(event) > 3 else None
+            if type(count) is not int or not 0 <= count <= MAX_EVENT_COUNT or type(campaign_id) is not str or type(group_id) is not str:
+                raise ValueError
+            if ts is not None:
+                # The range check also rejects NaN and the infinities
+                if (type(ts) is not int and type(ts) is not float) or not -MAX_EVENT_TS <= ts <= MAX_EVENT_TS:
+                    raise ValueError
+                if latest is None or ts > latest:
+                    latest = ts
+        except (KeyError, IndexError, TypeError, ValueError, AttributeError):
+            rejected += 1
+            continue
+        totals[campaign_id, group_id] += count
+    return totals, rejected, latest
+
+
+def _add_locked(campaigns: IndexedStore[Campaign], campaign_id: str, counts: Dict[str, int]) -> Optional[Tuple[Campaign, Dict[str, int], bool]]:
+    """Add impressions to one campaign through a copy-on-write update
+
+    Returns:
+        Optional[Tuple[Campaign, Dict[str, int], bool]]: the new version, the impressions added per group and
+            whether the campaign was complete before, or None if it was removed
+    """
+    added: Dict[str, int] = {} # the group list is only final under the campaign's lock
+    was_complete: List[bool] = []
+    def add(the_campaign: Campaign):
+        impressions = the_campaign.impressions
+        if not impressions: # every group was detached since it was read
+            return
+        was_complete.append(min(impressions.values()) >= config.IMPRESSION_TARGET)
+        for gid, count in counts.items():
+            if gid in impressions:
+                impressions[gid] += count
+                added[gid] = count
+
+    try:
+        the_campaign = campaigns.update(campaign_id, add)
+    except KeyError: # removed meanwhile
+        return None
+    return the_campaign, added, bool(was_complete) and was_complete[0]
+
+def apply_counts(campaigns: IndexedStore[Campaign],
+                 totals: PairCounts,
+                 on_complete: Optional[Callable[[str], None]],
+                 on_change: Callable[[List[Campaign]], None],
+                 series: Optional[TimeSeriesStore] = None,
+                 ts: Optional[float] = None) -> Tuple[int, int, List[str]]:
+    """Add aggregated impressions to the campaigns, then run the completion check once per campaign.
+    A campaign completes when this batch brings all of its groups to the impression target.
+
+    As in a scheduler tick, the new versions are computed from the campaigns read without a lock
+    and swapped in at once. Only a campaign written concurrently meanwhile gets a copy-on-write
+    update of its own, so concurrent writes to it are never lost. The time series points are
+    recorded before any campaign is written, so if recording fails none of the batch is applied.
+
+    Args:
+        campaigns (IndexedStore[Campaign]): the campaign store
+        totals (PairCounts): the impressions to add
+        on_complete (Callable[[str], None], optional): called with each campaign completed by this batch, None to
+            leave completing them to the caller, e.g. on the event loop
+        on_change (Callable[[List[Campaign]], None]): called once with the new version of every campaign that got impressions
+        series (TimeSeriesStore, optional): records the applied impressions as one point per group
+        ts (float, optional): timestamp of the recorded points, defaults to now
+
+    Returns:
+        Tuple[int, int, List[str]]: impressions applied, impressions for unknown campaigns or groups, and the completed campaign ids
+    """
+    by_campaign: Dict[str, Dict[str, int]] = {}
+    for (campaign_id, group_id), count in totals.items():
+        by_campaign.setdefault(campaign_id, {})[group_id] = count
+
+    unknown = 0
+    read, updated, additions = [], [], []
+    for campaign_id, counts in by_campaign.items():
+        current = campaigns.get(campaign_id)
+        impressions = dict(current.impressions) if current is not None else {}
+        added = {gid: count for gid, count in counts.items() if gid in impressions}
+        unknown += sum(counts.values()) - sum(added.values())
+        if not added:
+            continue
+        for gid, count in added.items():
+            impressions[gid] += count
+        read.append(current)
+        updated.append(current.model_copy(update={"impressions": impressions}))
+        additions.append(added)
+    if series is not None and additions:
+        series.record_many([(the_campaign.id, gid) for the_campaign, added in zip(read, additions) for gid in added],
+                           [count for added in additions for count in added.values()], ts)
+    swapped = {id(the_campaign) for the_campaign in campaigns.swap(zip(read, updated))}
+
+    changes: List[Tuple[Campaign, Dict[str, int], bool]] = []
+    for current, the_campaign, added in zip(read, updated, additions):
+        if id(the_campaign) in swapped:
+            changes.append((the_campaign, added, min(current.impressions.values()) >= config.IMPRESSION_TARGET))
+            continue
+        # Written meanwhile, add to its new version instead. Only the groups recorded above get
+        # impressions, the ones detached meanwhile count as unknown.
+        change = _add_locked(campaigns, the_campaign.id, added)
+        unknown += sum(added.values()) - (sum(change[1].values()) if change is not None else 0)
+        if change is not None and change[1]:
+            changes.append(change)
+
+    applied = 0
+    completed = []
+    for the_campaign, added, was_complete in changes:
+        applied += sum(added.values())
+        if not was_complete and min(the_campaign.impressions.values()) >= config.IMPRESSION_TARGET:
+            completed.append(the_campaign.id)
+
+    if changes:
+        on_change([the_campaign for the_campaign, _, _ in changes])
+    if on_complete is not None:
+        for campaign_id in completed:
+            on_complete(campaign_id)
+    return applied, unknown, completed
@@ -0,0 +1,104 @@
+import math
+import time
+from collections import deque
+from typing import Callable, Deque, Optional, Tuple
+
+from api import config
+
+
+class LoadGuard:
+    """Backs the impression scheduler off while the API is slow, so requests always win over simulation work.
+
+    The scheduler and the request handlers share one event loop. Before each tick, the
+    guard checks how late the loop woke the scheduler up, and the p99 time to response
+    start of the requests of the last `window` seconds. While either is over its threshold,
+    the share of running campaigns advanced per tick is halved, down to `min_share`; once
+    both are back under, it grows by `recovery` per tick (additive increase, multiplicative
+    decrease). Campaigns left out are served round-robin on later ticks, like with
+    SIM_MAX_CAMPAIGNS_PER_TICK, so every campaign still progresses, only slower.
+    """
+
+    def __init__(self,
+                 max_lag: float = config.SIM_GUARD_MAX_LAG,
+                 max_p99: float = config.SIM_GUARD_MAX_P99,
+                 window: float = config.SIM_GUARD_WINDOW,
+                 min_share: float = 1 / 64,
+                 recovery: float = 1 / 8,
+                 max_samples: int = 2048):
+        """
+        Args:
+            max_lag (float): seconds of event loop lag tolerated, 0 to ignore the lag
+            max_p99 (float): seconds of p99 time to response start tolerated, 0 to ignore the latency
+            window (float): seconds of responses the p99 is taken over
+            min_share (float): the least share of campaigns advanced per tick
+            recovery (float): share added back per tick once the API is fast again
+            max_samples (int): most recent responses kept for the p99
+        """
+        self.max_lag = max_lag
+        self.max_p99 = max_p99
+        self.window = window
+        self.min_share = min_share
+        self.recovery = recovery
+        self.share = 1.0
+        self._samples: Deque[Tuple[float, float]] = deque(maxlen=max_samples) # (monotonic time, seconds)
+
+    def observe(self, seconds: float, now: Optional[float] = None):
+        """Record the time a request took until its response started"""
+        self._samples.append((time.monotonic() if now is None else now, seconds))
+
+    def p99(self, now: Optional[float] = None) -> float:
+        """p99 time to response start over the last `window` seconds, 0 without requests"""
+        since = (time.monotonic() if now is None else now) - self.window
+        while self._samples and self._samples[0][0] < since:
+            self._samples.popleft()
+        latencies = sorted(seconds for _, seconds in self._samples)
+        return latencies[min(len(latencies) - 1, int(0.99 * len(latencies)))] if latencies else 0.0
+
+    def overloaded(self, lag: float, now: Optional[float] = None) -> bool:
+        return bool(self.max_lag and lag > self.max_lag) or bool(self.max_p99 and self.p99(now) > self.max_p99)
+
+    def update(self, lag: float, now: Optional[float] = None) -> float:
+        """Adjust the share of campaigns to advance on the next tick
+
+        Args:
+            lag (float): how late the event loop woke the scheduler up for this tick, in seconds
+
+        Returns:
+            float: the new share
+        """
+        if self.overloaded(lag, now):
+            self.share = max(self.min_share, self.share / 2)
+        else:
+            self.share = min(1.0, self.share + self.recovery)
+        return self.share
+
+    def limit(self, running: int) -> int:
+        """How many of the running campaigns to advance on this tick, at least 1"""
+        return max(1, math.ceil(self.share * running))
+
+
+class ResponseTimer:
+    """Pure ASGI middleware passing the seconds each HTTP request took until its response
+    started to `on_response`, e.g. `LoadGuard.observe`. Installed on its own so the guard
+    gets its samples whether or not the request metrics are recorded.
+    """
+
+    def __init__(self, app, on_response: Callable[[float], None]):
+        """
+        Args:
+            app: the ASGI app
+            on_response (Callable[[float], None]): called with the seconds until the response started
+        """
+        self.app = app
+        self.on_response = on_response
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        start = time.perf_counter()
+        async def send_timed(message):
+            if message["type"] == "http.response.start":
+                self.on_response(time.perf_counter() - start)
+            await send(message)
+        await self.app(scope, receive, send_timed)
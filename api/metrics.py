@@ -0,0 +1,170 @@
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from time import perf_counter
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+
+# Upper bounds in seconds, from a cached list response to a slow bulk write
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Labels = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def _label_text(names: Sequence[str], values: Sequence[str]) -> str:
+    return ",".join(f'{name}="{_escape(str(value))}"' for name, value in zip(names, values))
+
+def _sample(name: str, names: Sequence[str], values: Sequence[str], value: float) -> str:
+    labels = _label_text(names, values)
+    return f"{name}{{{labels}}} {value:g}" if labels else f"{name} {value:g}"
+
+
+class Metric(ABC):
+    """A metric family in the Prometheus text format. Updates are plain dict and float
+    operations, so a metric must only be updated from one thread, the event loop's.
+    """
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}", *self._samples()]
+
+    @abstractmethod
+    def _samples(self) -> List[str]:
+        """The sample lines of the family"""
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, *label_values: str, amount: float = 1):
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def _samples(self) -> List[str]:
+        return [_sample(self.name, self.labels, key, value) for key, value in sorted(self._values.items())]
+
+
+class Gauge(Metric):
+    """A value that goes up and down. With `collect`, the values are read when scraped instead
+    of being set, e.g. the size of a store.
+    """
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (),
+                 collect: Optional[Callable[[], Dict[Labels, float]]] = None):
+        super().__init__(name, help, labels)
+        self._values: Dict[Labels, float] = {}
+        self._collect = collect
+
+    def set(self, value: float, *label_values: str):
+        self._values[label_values] = value
+
+    def inc(self, *label_values: str, amount: float = 1):
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def _samples(self) -> List[str]:
+        values = self._collect() if self._collect is not None else self._values
+        return [_sample(self.name, self.labels, key, value) for key, value in sorted(values.items())]
+
+
+class Histogram(Metric):
+    """Counts observations in fixed buckets. Each observation is one bisect and two
+    additions; the cumulative counts Prometheus expects are only summed when scraped.
+    """
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+        self._series: Dict[Labels, list] = {} # {label values: [bucket counts + overflow, sum]}
+
+    def observe(self, value: float, *label_values: str):
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def _samples(self) -> List[str]:
+        lines = []
+        names = (*self.labels, "le")
+        for key, (counts, total) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, n in zip((*self.buckets, float("inf")), counts):
+                cumulative += n
+                lines.append(_sample(f"{self.name}_bucket", names, (*key, "+Inf" if bound == float("inf") else f"{bound:g}"), cumulative))
+            lines.append(_sample(f"{self.name}_sum", self.labels, key, total))
+            lines.append(_sample(f"{self.name}_count", self.labels, key, cumulative))
+        return lines
+
+
+class MetricsRegistry:
+    """The metric families served by /metrics"""
+
+    def __init__(self):
+        self._metrics: List[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(line for metric in self._metrics for line in metric.render()) + "\n"
+
+
+class HttpMetrics:
+    """Per-route request counts and latencies, and the requests in flight"""
+
+    def __init__(self, registry: MetricsRegistry):
+        self.requests = registry.register(Counter(
+            "http_requests_total", "HTTP requests by route template, method and status code", ("method", "route", "status")))
+        self.latency = registry.register(Histogram(
+            "http_request_duration_seconds", "HTTP request latency by route template and method", ("method", "route")))
+        self.in_flight = registry.register(Gauge("http_requests_in_flight", "HTTP requests being served"))
+        self.in_flight.set(0)
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware recording HttpMetrics, without the per-request task and body
+    buffering of Starlette's BaseHTTPMiddleware. Requests are labelled with the route
+    template the router matched, e.g. /campaigns/{campaign_id}/launch, so ids don't
+    multiply the series.
+    """
+
+    def __init__(self, app, metrics: HttpMetrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status = 500 # if the app raises before starting the response
+        async def send_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        metrics = self.metrics
+        metrics.in_flight.inc(amount=1)
+        start = perf_counter()
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            elapsed = perf_counter() - start
+            metrics.in_flight.inc(amount=-1)
+            route = scope.get("route")
+            path = route.path if route is not None else "unmatched"
+            metrics.requests.inc(scope["method"], path, str(status))
+            metrics.latency.observe(elapsed, scope["method"], path)
@@ -4,25 +4,112 @@ import os
 # Add project root to Python path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from fastapi import FastAPI, HTTPException, Query, BackgroundTasks
-from typing import List, Dict
-from datetime import datetime
-from shared.models import CurrencyStrEnum, CreativeTypeStrEnum, CampaignStateStrEnum
-from shared.models import Video, Image, HTML, AdAccount, Product, Creative, CreativeGroup, Campaign
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from contextlib import asynccontextmanager
+from typing import List, Optional, Callable, Literal, Tuple
+from shared.models import CurrencyStrEnum, CreativeTypeStrEnum, CampaignStateStrEnum, EnablingStateEnum, CreativeGroupStatusStrEnum
+from shared.models import MEDIA, AdAccount, Product, Creative, CreativeGroup, Campaign, Simulation
+from shared.models import CreativeCreate, CreativeGroupCreate, BatchItemResult, IngestResult, Champion
+from shared.models import SimulationModeStrEnum, SimulationRun, CreativeUsage, SearchHit
+from api import config, serialization
+from api.store import IndexedStore
+from api.compact_store import create_stores
+from api.reverse_index import ReverseIndex
+from api.search import SearchIndex, TextIndex
+from api.seeding import PROFILES, SeedReport, generate, rss_bytes
+from api.cache import VersionedResponseCache, make_etag, etag_matches
+from api.simulator import ImpressionScheduler, fast_forward
+from api.load_guard import LoadGuard, ResponseTimer
+from api.champions import ChampionLeaderboard
+from api.timeseries import TimeSeriesStore
+from api.repository import create_repository
+from api.metrics import MetricsRegistry, HttpMetrics, MetricsMiddleware, Counter, Gauge, Histogram
+from api.ingest import Event, IngestError, ndjson_batches, framed_batches, aggregate, apply_counts
+from api.streaming import CampaignBroadcaster, campaign_frame, sse_frames
+import argparse
+import asyncio
+import gc
+import logging
+import time
 import uuid
 import uvicorn
-import asyncio
-import random
-
-
-app = FastAPI()
 
-ad_accounts: Dict[str, AdAccount] # {uuid4: AdAccount}
-creatives: Dict[str, Creative] = {} # {uuid4: Creative}
-creative_groups: Dict[str, CreativeGroup] = {} # {uuid4: CreativeGroup}
-campaigns: Dict[str, Campaign] = {} # {uuid4: Campaign}
 
-champions_queue = [] # For the champion groups for future use in the regular campaigns
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    loop = asyncio.get_running_loop()
+    def on_remote_changes(kind: str, changes: List[tuple]):
+        loop.call_soon_threadsafe(_apply_remote_changes, kind, changes)
+    repository.watch(on_remote_changes)
+    restore_state()
+    if config.SEED_PROFILE and len(creatives) == 0:
+        logger.info("%s", seed_profile(config.SEED_PROFILE, config.SEED))
+    repository.start() # reopened if a previous run of the lifespan closed it
+    # One scheduler advances every ACTIVE campaign, in the elected worker only when several share the storage
+    repository.elect(lambda leading: loop.call_soon_threadsafe(_lead_simulation, leading))
+    yield
+    repository.unwatch(on_remote_changes) # the lifespan may run again, e.g. in tests
+    await scheduler.stop()
+    repository.close()
+
+app = FastAPI(lifespan=lifespan)
+
+# Each store is a {uuid4: entity} mapping with a title index for O(1) uniqueness checks
+ad_accounts: IndexedStore[AdAccount] = IndexedStore("Ad account")
+# Creatives and groups can be kept as columns instead of models, see STORE_LAYOUT
+creatives, creative_groups = create_stores(config.STORE_LAYOUT)
+campaigns: IndexedStore[Campaign] = IndexedStore("Campaign")
+
+# Reverse indexes: the groups containing each creative, the campaigns running each group
+groups_by_creative = ReverseIndex(creative_groups, lambda the_group: the_group.creative_ids)
+campaigns_by_group = ReverseIndex(campaigns, lambda the_campaign: the_campaign.groups)
+
+# Title prefix and word search over creatives, groups and campaigns, see GET /search
+search_index = SearchIndex([TextIndex(creatives, "creative"), TextIndex(creative_groups, "creative_group"), TextIndex(campaigns, "campaign")])
+
+champions = ChampionLeaderboard() # For the champion groups for future use in the regular campaigns
+
+list_cache = VersionedResponseCache() # serialized list responses, invalidated by store writes
+
+# Persists the stores, see STORAGE_BACKEND
+repository = create_repository()
+repository.register("ad_account", AdAccount, ad_accounts)
+repository.register("creative", Creative, creatives)
+repository.register("creative_group", CreativeGroup, creative_groups)
+repository.register("campaign", Campaign, campaigns)
+repository.register("champion", Champion, champions)
+_restored = False
+broadcaster = CampaignBroadcaster() # live campaign updates for /campaigns/{id}/stream
+impression_series = TimeSeriesStore() # per-(campaign, group) impression history
+
+# Backs the simulations off while responses are slow, see SIM_GUARD_MAX_LAG and SIM_GUARD_MAX_P99
+load_guard = LoadGuard()
+if config.SIM_GUARD_MAX_P99:
+    app.add_middleware(ResponseTimer, on_response=load_guard.observe)
+
+# Served by /metrics. Metrics are only updated from the event loop, so /metrics is async as well.
+metrics_registry = MetricsRegistry()
+http_metrics = HttpMetrics(metrics_registry)
+if config.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware, metrics=http_metrics)
+tick_duration = metrics_registry.register(Histogram("simulator_tick_duration_seconds", "Time spent advancing the impressions in one tick"))
+tick_lag = metrics_registry.register(Histogram("simulator_tick_lag_seconds", "How late the scheduler woke up for a tick"))
+champions_selected = metrics_registry.register(Counter("champions_selected_total", "Groups recorded as champion, or improving their best result"))
+metrics_registry.register(Gauge("simulator_active_campaigns", "Campaigns with a running simulation",
+                                collect=lambda: {(): len(scheduler.simulations())}))
+metrics_registry.register(Gauge("simulator_queued_campaigns", "Launched campaigns waiting for a simulation slot",
+                                collect=lambda: {(): len(scheduler.queued())}))
+metrics_registry.register(Gauge("simulator_work_share", "Share of the running campaigns advanced per tick, below 1 while the API is slow",
+                                collect=lambda: {(): load_guard.share}))
+metrics_registry.register(Gauge("champion_groups", "Groups on the champion leaderboard", collect=lambda: {(): len(champions)}))
+metrics_registry.register(Gauge("store_entities", "Entities in each in-memory store", ("store",),
+                                collect=lambda: {("ad_accounts",): len(ad_accounts), ("creatives",): len(creatives),
+                                                 ("creative_groups",): len(creative_groups), ("campaigns",): len(campaigns)}))
 
 
 ### POSTS ###
@@ -37,15 +124,17 @@ def create_ad_account(title: str, description: str, timezone: str, currency: Cur
         timezone (str): timezone for the Ad account
         currency (CurrencyStrEnum): currency for the Ad account
 
+    Raises:
+        HTTPException: Raise 409 error if the Ad account title already exists
+
     Returns:
         The newly created AdAccount
     """
-    if any(adaccount.title == title for adaccount in ad_accounts.values()):
-        raise HTTPException(400, f"Ad account \"{title}\" already exists")
-
-    new_id=str(uuid.uuid4())
-    new_ad_account = AdAccount(id=new_id, title=title, description=description, timezone=timezone, currency=currency)
-    ad_accounts[new_id] = new_ad_account
+    new_ad_account = AdAccount(id=str(uuid.uuid4()), title=title, description=description, timezone=timezone, currency=currency, products=[])
+    # Checks the title and stores the Ad account in one step, a concurrent create can't take it in between
+    error, = ad_accounts.insert_many([new_ad_account])
+    if error is not None:
+        raise HTTPException(409, error)
     return new_ad_account
 
 @app.post("/products", response_model=Product)
@@ -75,45 +164,44 @@ def create_creative(title: str, type: CreativeTypeStrEnum):
 
     Raises:
         HTTPException: Raise 400 error if the creative title already exists
+        HTTPException: Raise 400 error if the type is UNKNOWN
 
     Returns:
         The newly created Creative
     """
-    # Check if a creative with this title already exists
-    if any(creative.title == title for creative in creatives.values()):
-        raise HTTPException(400, f"Creative \"{title}\" already exists") 
-
-    new_id=str(uuid.uuid4())
-    if type == CreativeTypeStrEnum.VIDEO:
-        the_video = Video(filename=f"{title}.mp4", auto_endcard=True)
-        new_creative = Creative(
-            id=new_id, 
-            title=title,
-            type=type,
-            filename = the_video.filename,
-            video=the_video   
-            )
-    elif type == CreativeTypeStrEnum.IMAGE:
-        the_image = Image(filename=f"{title}.jpg")
-        new_creative = Creative(
-            id=new_id, 
-            title=title, 
-            type=type,
-            filename = the_image.filename,
-            image=the_image
-            )
-    elif type == CreativeTypeStrEnum.HTML:
-        the_html = HTML(filename=f"{title}.html")
-        new_creative = Creative(
-            id=new_id, 
-            title=title, 
-            type=type,
-            filename = the_html.filename,
-            html=the_html
-            )
-
-    creatives[new_id] = new_creative
+    new_creative = _build_creative(title, type)
+    # Checks the title and stores the creative in one step, a concurrent create can't take it in between
+    error, = creatives.insert_many([new_creative])
+    if error is not None:
+        raise HTTPException(400, error)
     return new_creative
+
+@app.post("/creatives:batch", response_model=List[BatchItemResult])
+def create_creatives_batch(items: List[CreativeCreate]):
+    """Create many creatives at once. The whole batch is validated first and committed all-or-nothing.
+
+    Args:
+        items (List[CreativeCreate]): the creatives to create
+
+    Raises:
+        HTTPException: 400 error with the per-item results if any title already exists or repeats in the batch, or the type is UNKNOWN
+
+    Returns:
+        The per-item results with the new creative ids
+    """
+    results = [BatchItemResult(index=i) for i in range(len(items))]
+    new_creatives = []
+    for item, result in zip(items, results):
+        try:
+            new_creatives.append(_build_creative(item.title, item.type))
+        except HTTPException as e:
+            result.error = e.detail
+    _raise_for_batch_errors(results)
+
+    for result, new_creative, error in zip(results, new_creatives, creatives.insert_many(new_creatives)):
+        result.id, result.error = (new_creative.id, None) if error is None else (None, error)
+    _raise_for_batch_errors(results)
+    return results
     
 @app.post("/creative-groups", response_model=CreativeGroup)
 def create_group(title: str, description: str, creative_ids: List[str] = Query(...)):
@@ -131,13 +219,6 @@ def create_group(title: str, description: str, creative_ids: List[str] = Query(.
     Returns:
         The newly created CreativeGroup
     """
-    if any(group.title == title for group in creative_groups.values()):
-        raise HTTPException(400, f"Group \"{title}\" already exists")
-
-    for c_id in creative_ids:
-        if c_id not in creatives:
-            raise HTTPException(400, "Creative ID not found")
-
     new_id = str(uuid.uuid4())
     new_group = CreativeGroup(
         id=new_id,
@@ -145,9 +226,78 @@ def create_group(title: str, description: str, creative_ids: List[str] = Query(.
         description=description,
         creative_ids=creative_ids
     )
-    creative_groups[new_id] = new_group
+    error, = _insert_groups([new_group])
+    if error is not None:
+        raise HTTPException(400, error)
     return new_group
 
+@app.post("/creative-groups:batch", response_model=List[BatchItemResult])
+def create_groups_batch(items: List[CreativeGroupCreate]):
+    """Create many creative groups at once. The whole batch is validated first and committed all-or-nothing.
+
+    Args:
+        items (List[CreativeGroupCreate]): the creative groups to create
+
+    Raises:
+        HTTPException: 400 error with the per-item results if a title already exists or repeats in the batch, or a creative doesn't exist
+
+    Returns:
+        The per-item results with the new group ids
+    """
+    new_groups = [CreativeGroup(id=str(uuid.uuid4()), title=item.title, description=item.description, creative_ids=item.creative_ids)
+                  for item in items]
+    results = [BatchItemResult(index=i, id=the_group.id if error is None else None, error=error)
+               for i, (the_group, error) in enumerate(zip(new_groups, _insert_groups(new_groups)))]
+    _raise_for_batch_errors(results)
+    return results
+
+@app.post("/creative-groups/{group_id}/disable", response_model=CreativeGroup)
+def disable_group(group_id: str):
+    """Disable the CreativeGroup, it's removed from the champion groups
+
+    Raises:
+        HTTPException: 400 error if the CreativeGroup doesn't exist
+
+    Returns:
+        The target CreativeGroup
+    """
+    if group_id not in creative_groups:
+        raise HTTPException(400, "Group not found")
+
+    def disable(the_group: CreativeGroup):
+        the_group.enabling_state = EnablingStateEnum.DISABLED
+        the_group.update_time()
+    the_group = creative_groups.update(group_id, disable)
+    champions.remove(group_id)
+    return the_group
+
+@app.post("/creatives/{creative_id}/disable", response_model=Creative)
+def disable_creative(creative_id: str, force: bool = False):
+    """Disable the Creative. Unless forced, a creative still running in an ACTIVE campaign
+    (through any of its groups) is left enabled.
+
+    Args:
+        creative_id (str): The target creative id
+        force (bool): disable it even if ACTIVE campaigns use it
+
+    Raises:
+        HTTPException: 400 error if the Creative doesn't exist
+        HTTPException: 400 error if ACTIVE campaigns use the Creative and `force` is not set
+
+    Returns:
+        The target Creative
+    """
+    if creative_id not in creatives:
+        raise HTTPException(400, "Creative not found")
+    usage = _creative_usage(creative_id)
+    if usage.active_campaign_ids and not force:
+        raise HTTPException(400, f"Creative is used by active campaigns: {', '.join(usage.active_campaign_ids)}")
+
+    def disable(the_creative: Creative):
+        the_creative.enabling_state = EnablingStateEnum.DISABLED
+        the_creative.update_time()
+    return creatives.update(creative_id, disable)
+
 @app.post("/campaigns", response_model=Campaign)
 def create_campaign(title: str, description: str, group_ids: List[str] = Query(default=[])):
     """Create a new Campaign
@@ -164,13 +314,6 @@ def create_campaign(title: str, description: str, group_ids: List[str] = Query(d
     Returns:
         The newly created Campaign 
     """
-    if any(campaign.title == title for campaign in campaigns.values()):
-        raise HTTPException(400, f"Campaign \"{title}\" already exists")
-
-    for g_id in group_ids:
-        if g_id not in creative_groups:
-            raise HTTPException(400, "Group ID not found")
-
     new_id = str(uuid.uuid4())
     new_campaign = Campaign(
         id=new_id,
@@ -178,7 +321,13 @@ def create_campaign(title: str, description: str, group_ids: List[str] = Query(d
         description=description,
         groups=group_ids,
     )
-    campaigns[new_id] = new_campaign
+    def check(the_campaign: Campaign) -> Optional[str]:
+        return None if all(g_id in creative_groups for g_id in the_campaign.groups) else "Group ID not found"
+    # The groups' lock keeps them from being removed until the campaign is stored, see _insert_groups
+    with creative_groups.write_lock():
+        error, = campaigns.insert_many([new_campaign], check)
+    if error is not None:
+        raise HTTPException(400, error)
     return new_campaign 
 
 @app.post("/campaigns/{campaign_id}/attach", response_model=Campaign)
@@ -201,14 +350,50 @@ def attach_group_to_campaign(campaign_id: str, group_id: str):
         raise HTTPException(400, "Campaign not found")
     if group_id not in creative_groups:
         raise HTTPException(400, "Group not found")
-    the_campaign = campaigns[campaign_id]
 
-    if group_id not in the_campaign.groups:
-        the_campaign.groups.append(group_id)
-        the_campaign.impressions[group_id] = 0
-    else:
-        raise HTTPException(400, "Group already in the campaign")
-    return the_campaign
+    def attach(the_campaign: Campaign):
+        if group_id not in the_campaign.impressions:
+            the_campaign.groups.append(group_id)
+            the_campaign.impressions[group_id] = 0
+            the_campaign.clicks[group_id] = 0
+        else:
+            raise HTTPException(400, "Group already in the campaign")
+    return _update_campaign(campaign_id, attach)
+
+@app.post("/campaigns/{campaign_id}/attach:batch", response_model=List[BatchItemResult])
+def attach_groups_to_campaign_batch(campaign_id: str, group_ids: List[str]):
+    """Attach many CreativeGroups to the Campaign at once, all-or-nothing
+
+    Args:
+        campaign_id (str): The target campaign id
+        group_ids (List[str]): The CreativeGroup ids to be attached
+
+    Raises:
+        HTTPException: 400 error if the Campaign doesn't exist
+        HTTPException: 400 error with the per-item results if a group doesn't exist, is already in the Campaign or repeats in the batch
+
+    Returns:
+        The per-item results with the attached group ids
+    """
+    if campaign_id not in campaigns:
+        raise HTTPException(400, "Campaign not found")
+
+    results = [BatchItemResult(index=i, id=gid) for i, gid in enumerate(group_ids)]
+    def attach(the_campaign: Campaign):
+        seen = set()
+        for gid, result in zip(group_ids, results):
+            if gid not in creative_groups:
+                result.error = "Group not found"
+            elif gid in the_campaign.impressions or gid in seen:
+                result.error = "Group already in the campaign"
+            seen.add(gid)
+        _raise_for_batch_errors(results)
+
+        the_campaign.groups.extend(group_ids)
+        the_campaign.impressions.update(dict.fromkeys(group_ids, 0))
+        the_campaign.clicks.update(dict.fromkeys(group_ids, 0))
+    _update_campaign(campaign_id, attach)
+    return results
 
 @app.post("/campaigns/{campaign_id}/remove", response_model=Campaign)
 def remove_group_from_campaign(campaign_id: str, group_id: str):
@@ -230,18 +415,24 @@ def remove_group_from_campaign(campaign_id: str, group_id: str):
         raise HTTPException(400, "Campaign not found")
     if group_id not in creative_groups:
         raise HTTPException(400, "Group not found")
-    the_campaign = campaigns[campaign_id]
 
-    if group_id in the_campaign.groups:
-        the_campaign.groups.remove(group_id)
-        the_campaign.impressions.pop(group_id)
-    else:
-        raise HTTPException(400, "Group is not in the campaign")
+    def remove(the_campaign: Campaign):
+        if group_id in the_campaign.impressions:
+            # O(n) on purpose: campaigns have a handful of groups, and the list keeps their attach order
+            the_campaign.groups.remove(group_id)
+            the_campaign.impressions.pop(group_id)
+            the_campaign.clicks.pop(group_id, None)
+        else:
+            raise HTTPException(400, "Group is not in the campaign")
+    the_campaign = _update_campaign(campaign_id, remove)
+    impression_series.drop([(campaign_id, group_id)])
     return the_campaign
 
 @app.post("/campaigns/{campaign_id}/launch", response_model=Campaign)
-def launch_campaign(campaign_id: str, bg_tasks: BackgroundTasks):
-    """Launch the campaign, it'll accumulate impressions in the backgroud
+def launch_campaign(campaign_id: str):
+    """Launch the campaign, the impression scheduler will accumulate its impressions in the backgroud.
+    Over SIM_MAX_ACTIVE_CAMPAIGNS running campaigns, it's QUEUED instead, and starts once the
+    ones launched before it finish or pause. Launching a running or queued campaign is a no-op.
 
     Raises:
         HTTPException: 400 error if the Campaign doesn't exist
@@ -252,20 +443,25 @@ def launch_campaign(campaign_id: str, bg_tasks: BackgroundTasks):
     """
     if campaign_id not in campaigns:
         raise HTTPException(400, "Campaign not found")
-    
-    the_campaign = campaigns[campaign_id]
-    if len(the_campaign.groups) == 0:
-        raise HTTPException(400, "Campaign has no groups")
 
-    the_campaign.state = CampaignStateStrEnum.ACTIVE
-    bg_tasks.add_task(accumulate_campaign_impressions, campaign_id)
+    with scheduler.admission:
+        run = scheduler.is_running(campaign_id) or (not scheduler.is_queued(campaign_id) and scheduler.has_capacity())
+        def launch(the_campaign: Campaign):
+            if len(the_campaign.groups) == 0:
+                raise HTTPException(400, "Campaign has no groups")
+            the_campaign.state = CampaignStateStrEnum.ACTIVE if run else CampaignStateStrEnum.QUEUED
+        the_campaign = _update_campaign(campaign_id, launch)
+        if run:
+            scheduler.start_simulation(campaign_id)
+        else:
+            scheduler.enqueue(campaign_id)
 
     return the_campaign 
     
     
 @app.post("/campaigns/{campaign_id}/pause", response_model=Campaign)
 def pause_campaign(campaign_id: str):
-    """Pause the campaign
+    """Pause the campaign and cancel its simulation, or take it out of the admission queue
 
     Raises:
         HTTPException: 400 error if the Campaign doesn't exist
@@ -276,48 +472,339 @@ def pause_campaign(campaign_id: str):
     if campaign_id not in campaigns:
         raise HTTPException(400, "Campaign not found")
     
-    the_campaign = campaigns[campaign_id]
-    if len(the_campaign.groups) == 0:
-        raise HTTPException(400, "Campaign has no groups")
-
-    the_campaign.state = CampaignStateStrEnum.PAUSED
+    def pause(the_campaign: Campaign):
+        if len(the_campaign.groups) == 0:
+            raise HTTPException(400, "Campaign has no groups")
+        the_campaign.state = CampaignStateStrEnum.PAUSED
+    the_campaign = _update_campaign(campaign_id, pause)
+    scheduler.cancel_simulation(campaign_id)
+    scheduler.dequeue(campaign_id)
+    _admit_queued()
 
     return the_campaign 
 
 @app.post("/campaigns/{campaign_id}/reset", response_model=Campaign)
 def reset_campaign(campaign_id: str):
-    """Reset the group impressions to 0
+    """Cancel the campaign's simulation, pause it and reset the group impressions and clicks to 0
+
+    Raises:
+        HTTPException: 400 error if the Campaign doesn't exist
 
     Returns:
         The target Campaign
     """
-    the_campaign = campaigns[campaign_id]
-    for gid in the_campaign.impressions:
-        the_campaign.impressions[gid] = 0
+    if campaign_id not in campaigns:
+        raise HTTPException(400, "Campaign not found")
+
+    def reset(the_campaign: Campaign):
+        the_campaign.state = CampaignStateStrEnum.PAUSED
+        for gid in the_campaign.impressions:
+            the_campaign.impressions[gid] = 0
+            the_campaign.clicks[gid] = 0
+    the_campaign = _update_campaign(campaign_id, reset)
+    scheduler.cancel_simulation(campaign_id)
+    scheduler.dequeue(campaign_id)
+    _admit_queued()
+    impression_series.clear((campaign_id, gid) for gid in the_campaign.impressions)
 
     return the_campaign
 
+def _ingest_batch(events: List[Event]) -> Tuple[int, int, int, List[str]]:
+    """Aggregate and apply one batch of impression events. Runs in the threadpool, so the
+    completed campaigns are left to the caller, see `ingest_impressions`.
+
+    Returns:
+        Tuple[int, int, int, List[str]]: the rejected events, then what `apply_counts` returns
+    """
+    totals, rejected, latest_ts = aggregate(events)
+    return (rejected, *apply_counts(campaigns, totals, None, broadcaster.publish, impression_series, latest_ts))
+
+@app.post("/impressions:ingest", response_model=IngestResult)
+async def ingest_impressions(request: Request):
+    """Add replayed impression events to the campaigns.
+
+    The body is either NDJSON (the default), or length-prefixed frames with
+    Content-Type application/x-impression-frames: a 4-byte big-endian length followed
+    by a JSON array of events. Events are {"campaign_id", "group_id", "count", "ts"}
+    objects or [campaign_id, group_id, count, ts] arrays. The body is parsed as it
+    streams in, and each batch of events is summed per group and applied at once in
+    the threadpool, off the event loop, followed by one completion check per campaign.
+
+    Raises:
+        HTTPException: 400 error if the body can't be parsed. Batches before the error are already applied.
+
+    Returns:
+        The number of events, applied impressions and completed campaigns
+    """
+    framed = request.headers.get("content-type", "").startswith("application/x-impression-frames")
+    batches = framed_batches(request.stream()) if framed else ndjson_batches(request.stream())
+
+    result = IngestResult()
+    try:
+        async for events in batches:
+            rejected, applied, unknown, completed = await run_in_threadpool(_ingest_batch, events)
+            for campaign_id in completed: # back on the event loop, which alone updates the metrics
+                _complete_campaign(campaign_id)
+            result.events += len(events)
+            result.batches += 1
+            result.applied += applied
+            result.rejected_events += rejected
+            result.unknown_impressions += unknown
+            result.completed += completed
+    except IngestError as e:
+        raise HTTPException(400, f"{e} (after {result.events} events)")
+    return result
+
+@app.post("/simulations:run", response_model=SimulationRun)
+def run_simulation(mode: SimulationModeStrEnum,
+                   campaign_ids: List[str] = Query(default=[]),
+                   seed: Optional[int] = None,
+                   trajectories: bool = False):
+    """Simulate campaigns to completion offline, in one pass without sleeping. The campaigns
+    themselves, the champions and the running simulations are left untouched.
+
+    The result is what the real-time scheduler would produce if these campaigns were
+    launched in this order from their current impressions, with `SIM_SEED` set to the
+    returned seed, `SIM_MAX_CAMPAIGNS_PER_TICK` and `SIM_MAX_ACTIVE_CAMPAIGNS` unchanged,
+    and no other campaign running. Backing off while the API is slow isn't simulated.
+
+    Args:
+        mode (SimulationModeStrEnum): only `fast` is supported, launch a campaign to simulate it in real time
+        campaign_ids (List[str], optional): the campaigns to simulate. Defaults to every campaign.
+        seed (int, optional): seed for the impressions. Defaults to SIM_SEED, or a fresh seed.
+        trajectories (bool): also return every group's impressions after each tick
+
+    Raises:
+        HTTPException: 400 error if a Campaign doesn't exist
+
+    Returns:
+        The completion tick, final impressions and champion groups of every campaign
+    """
+    if campaign_ids:
+        for campaign_id in campaign_ids:
+            if campaign_id not in campaigns:
+                raise HTTPException(400, "Campaign ID not found")
+        selected = [campaigns[campaign_id] for campaign_id in campaign_ids]
+    else:
+        selected = campaigns.page()[0]
+
+    def is_eligible(group_id: str) -> bool:
+        the_group = creative_groups.get(group_id)
+        return the_group is not None and the_group.enabling_state != EnablingStateEnum.DISABLED
+
+    return fast_forward(selected, seed=config.SIM_SEED if seed is None else seed,
+                        max_campaigns_per_tick=config.SIM_MAX_CAMPAIGNS_PER_TICK,
+                        max_active_campaigns=config.SIM_MAX_ACTIVE_CAMPAIGNS, trajectories=trajectories, is_eligible=is_eligible, policy=scheduler.policy)
+
 ### POSTS ###
 
 
 
 ### Getters ###
 
+# List endpoints page in insertion order. The cursor for the next page is returned in the
+# X-Next-Cursor header, and `fields` limits each item to a comma-separated list of fields.
+# Responses carry an ETag, and are cached per query until the stores they read are written.
+# `expand` joins the referenced entities in as `<name>_details` summaries, using dict lookups.
+
 @app.get("/creatives", response_model=List[Creative])
-def get_creatives():
-    return list(creatives.values())
+def get_creatives(request: Request,
+                  limit: Optional[int] = Query(None, ge=1, le=config.MAX_PAGE_SIZE),
+                  after: Optional[str] = None,
+                  fields: Optional[str] = None,
+                  type: Optional[CreativeTypeStrEnum] = None,
+                  enabling_state: Optional[EnablingStateEnum] = None):
+    def predicate(c: Creative):
+        return (type is None or c.type == type) and \
+               (enabling_state is None or c.enabling_state == enabling_state)
+    return _cached_list(request, [creatives],
+                        lambda: _list_page(creatives, Creative, limit, after, fields, predicate))
+
+@app.get("/creatives/by-title/{title:path}", response_model=Creative) # titles can contain "/"
+def get_creative_by_title(title: str):
+    """Get a creative by exact title match
+
+    Raises:
+        HTTPException: 404 error if no creative has this title
+
+    Returns:
+        The target Creative
+    """
+    the_creative = creatives.get_by_title(title)
+    if the_creative is None:
+        raise HTTPException(404, "Creative not found")
+    return the_creative
+
+@app.get("/creatives/{creative_id}/usage", response_model=CreativeUsage)
+def get_creative_usage(creative_id: str):
+    """Get the groups containing the creative and the campaigns running them, from the reverse indexes
+
+    Raises:
+        HTTPException: 404 error if the Creative doesn't exist
+
+    Returns:
+        The group, campaign and ACTIVE campaign ids
+    """
+    if creative_id not in creatives:
+        raise HTTPException(404, "Creative not found")
+    return _creative_usage(creative_id)
+
+@app.get("/search", response_model=List[SearchHit])
+def search(q: str = Query(..., min_length=1),
+           kind: Optional[Literal["creative", "creative_group", "campaign"]] = None,
+           limit: int = Query(10, ge=1, le=config.MAX_PAGE_SIZE)):
+    """Find creatives, groups and campaigns by title or description, for typeahead
+
+    Args:
+        q (str): what the user typed so far, its last word matches as a prefix
+        kind (str, optional): only search this kind of entity
+        limit (int): max number of hits
+
+    Returns:
+        The best hits first: exact titles, titles starting with q, titles then descriptions with every word of q
+    """
+    return search_index.search(q, kind, limit)
 
 @app.get("/creative-groups", response_model=List[CreativeGroup])
-def get_groups():
-    return list(creative_groups.values())
+def get_groups(request: Request,
+               limit: Optional[int] = Query(None, ge=1, le=config.MAX_PAGE_SIZE),
+               after: Optional[str] = None,
+               fields: Optional[str] = None,
+               enabling_state: Optional[EnablingStateEnum] = None,
+               status: Optional[CreativeGroupStatusStrEnum] = None,
+               expand: Optional[Literal["creatives"]] = None):
+    def predicate(g: CreativeGroup):
+        return (enabling_state is None or g.enabling_state == enabling_state) and \
+               (status is None or g.status == status)
+
+    def expand_creatives(g: CreativeGroup):
+        return {"creative_details": [_creative_summary(creatives[cid]) for cid in g.creative_ids if cid in creatives]}
+
+    if expand is None:
+        return _cached_list(request, [creative_groups],
+                            lambda: _list_page(creative_groups, CreativeGroup, limit, after, fields, predicate))
+    return _cached_list(request, [creative_groups, creatives],
+                        lambda: _list_page(creative_groups, CreativeGroup, limit, after, fields, predicate, expand_creatives))
+
+@app.get("/creative-groups/{group_id}/campaigns", response_model=List[Campaign])
+def get_group_campaigns(group_id: str):
+    """Get the campaigns running the group, in the order the group was attached to them
+
+    Raises:
+        HTTPException: 404 error if the CreativeGroup doesn't exist
+
+    Returns:
+        The campaigns
+    """
+    if group_id not in creative_groups:
+        raise HTTPException(404, "Group not found")
+    return [the_campaign for the_campaign in map(campaigns.get, campaigns_by_group.referencing(group_id))
+            if the_campaign is not None]
 
 @app.get("/campaigns", response_model=List[Campaign])
-def get_campaigns():
-    return list(campaigns.values())
+def get_campaigns(request: Request,
+                  limit: Optional[int] = Query(None, ge=1, le=config.MAX_PAGE_SIZE),
+                  after: Optional[str] = None,
+                  fields: Optional[str] = None,
+                  state: Optional[CampaignStateStrEnum] = None,
+                  enabling_state: Optional[EnablingStateEnum] = None,
+                  expand: Optional[Literal["groups"]] = None):
+    def predicate(c: Campaign):
+        return (state is None or c.state == state) and \
+               (enabling_state is None or c.enabling_state == enabling_state)
+
+    def expand_groups(c: Campaign):
+        return {"group_details": [_group_summary(creative_groups[gid]) for gid in c.groups if gid in creative_groups]}
+
+    if expand is None:
+        return _cached_list(request, [campaigns],
+                            lambda: _list_page(campaigns, Campaign, limit, after, fields, predicate))
+    return _cached_list(request, [campaigns, creative_groups],
+                        lambda: _list_page(campaigns, Campaign, limit, after, fields, predicate, expand_groups))
+
+@app.get("/campaigns/{campaign_id}/stream")
+async def stream_campaign(campaign_id: str):
+    """Stream the campaign's state and impressions as Server-Sent Events.
+    Updates are coalesced per scheduler tick, and a slow consumer only gets the latest frame.
+
+    Raises:
+        HTTPException: 400 error if the Campaign doesn't exist
+
+    Returns:
+        A text/event-stream response, starting with the current state of the campaign
+    """
+    if campaign_id not in campaigns:
+        raise HTTPException(400, "Campaign not found")
+
+    subscription = broadcaster.subscribe(campaign_id)
+    subscription.offer(campaign_frame(campaigns[campaign_id]))
+
+    async def events():
+        try:
+            async for event in sse_frames(subscription):
+                yield event
+        finally:
+            broadcaster.unsubscribe(campaign_id, subscription)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.get("/campaigns/{campaign_id}/timeseries")
+def get_campaign_timeseries(campaign_id: str,
+                            group_id: Optional[str] = None,
+                            resolution: Literal["tick", "minute", "hour"] = "tick"):
+    """Get the impression history of the campaign's groups
+
+    Args:
+        campaign_id (str): The target campaign id
+        group_id (str, optional): only return this group's series
+        resolution (str): "tick" for the raw points, or the "minute" or "hour" rollups
+
+    Raises:
+        HTTPException: 400 error if the Campaign doesn't exist, or the group is not in the Campaign
+
+    Returns:
+        {group id: [[timestamp, impressions], ...]} with the oldest point first
+    """
+    if campaign_id not in campaigns:
+        raise HTTPException(400, "Campaign not found")
+    the_campaign = campaigns[campaign_id]
+    if group_id is not None and group_id not in the_campaign.impressions:
+        raise HTTPException(400, "Group is not in the campaign")
+
+    group_ids = [group_id] if group_id is not None else list(the_campaign.impressions)
+    return {gid: impression_series.points((campaign_id, gid), resolution) for gid in group_ids}
+
+@app.get("/simulations", response_model=List[Simulation])
+def get_simulations():
+    """Get the running campaign simulations with their start time and tick count"""
+    return scheduler.simulations()
+
+@app.get("/simulations/queue", response_model=List[str])
+def get_simulation_queue():
+    """Get the ids of the QUEUED campaigns, the next one to start first"""
+    return scheduler.queued()
 
 @app.get("/champions")
-def get_champions():
-    return champions_queue
+def get_champions(top: Optional[int] = Query(None, ge=1), expand: Optional[Literal["group"]] = None):
+    """Get the champion group ids ranked by impressions, best first
+
+    Args:
+        top (int, optional): only return the best `top` champions
+        expand (str, optional): "group" to return group summaries with the winning campaign and impressions
+
+    Returns:
+        The champion group ids, or their summaries with expand=group
+    """
+    ranked = champions.top(top)
+    if expand is None:
+        return [c.group_id for c in ranked]
+    return [_group_summary(creative_groups[c.group_id]) | {"campaign_id": c.campaign_id, "impressions": c.impressions}
+            for c in ranked if c.group_id in creative_groups]
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Get the request, simulator and store metrics in the Prometheus text format"""
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
 
 ### Getters ###
 
@@ -338,64 +825,373 @@ def get_creative_id_by_title(title: str) -> str | None:
     Returns:
         str: the target creative id or None if it doesn't exist
     """
-    for creative_id, creative in creatives.items():
-        if creative.title == title:
-            return creative_id
-    return None
+    return creatives.get_id_by_title(title)
 
-async def accumulate_campaign_impressions(campaign_id: str):
-    """Simulate impression increment after launching the campaign. The campaign will paused when all its groups reach 10,000 impressions.
+def _build_creative(title: str, type: CreativeTypeStrEnum) -> Creative:
+    """Build a new creative with a fresh id and the media model matching its type
+
+    Args:
+        title (str): title for the creative
+        type (CreativeTypeStrEnum): Image, Video, or HTML
 
     Raises:
-        HTTPException: 404 error if the campaign doesn't exist.
+        HTTPException: 400 error if the type is UNKNOWN
+
+    Returns:
+        Creative: the new creative, not yet stored
     """
-    if campaign_id not in campaigns:
-        raise HTTPException(404, "Campaign not found")
+    field, extension = MEDIA.get(type, (None, None))
+    if field is None:
+        raise HTTPException(400, "Creative type must be IMAGE, VIDEO, or HTML")
+    filename = f"{title}.{extension}"
+    the_media = {"filename": filename, "auto_endcard": True} if type == CreativeTypeStrEnum.VIDEO else {"filename": filename}
+    return Creative(id=str(uuid.uuid4()), title=title, type=type, filename=filename, **{field: the_media})
 
-    the_campaign = campaigns[campaign_id]
-    while the_campaign.state == CampaignStateStrEnum.ACTIVE:
-        all_complete = True
-        for gid in the_campaign.groups:
-            increment = random.randint(600, 2000)
-            the_campaign.impressions[gid] += increment
-            if the_campaign.impressions[gid] < 10000:
-                all_complete = False
-
-        if all_complete:
-            the_campaign.state = CampaignStateStrEnum.PAUSED
-            await _select_champion_from_campaign(the_campaign.id)
-            break
-        
-        await asyncio.sleep(1) 
-        
-async def _select_champion_from_campaign(campaign_id: str):
-    """Automatically select the creative group with a highest impression after the campaign paused.
+def _cached_list(request: Request, stores: List[IndexedStore], build: Callable[[], Response]) -> Response:
+    """Serve a list endpoint from the versioned response cache
+
+    Args:
+        request (Request): the list request, its query parameters are part of the cache key
+        stores (List[IndexedStore]): the stores the response is built from
+        build (Callable[[], Response]): builds the response on a cache miss
+
+    Returns:
+        304 Not Modified if If-None-Match has the current ETag, otherwise the cached or freshly built JSON
+    """
+    # Read the versions before building, so a write during the build only makes the entry look older
+    versions = tuple(store.version for store in stores)
+    key = (request.url.path, tuple(sorted(request.query_params.multi_items())))
+    etag = make_etag(key, versions)
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+
+    cached = list_cache.get(key, versions)
+    if cached is None:
+        built = build()
+        cursor = built.headers.get("X-Next-Cursor")
+        cached = list_cache.put(key, versions, built.body, {} if cursor is None else {"X-Next-Cursor": cursor})
+    return Response(cached.body, media_type="application/json", headers={**cached.headers, "ETag": etag})
+
+def _list_page(store: IndexedStore, model: type,
+               limit: Optional[int], after: Optional[str], fields: Optional[str],
+               predicate: Callable, expand: Optional[Callable] = None) -> Response:
+    """Get one page of a store for a list endpoint
+
+    Args:
+        store (IndexedStore): the store to list
+        model (type): the entity model, used to check the projected field names
+        limit (int, optional): max number of items, None for all of them
+        after (str, optional): cursor returned by the previous page
+        fields (str, optional): comma-separated fields to keep in each item
+        predicate (Callable): filter for the entities
+        expand (Callable, optional): returns the joined fields to add to each item
+
+    Raises:
+        HTTPException: 400 error if the cursor or a field name is invalid
+
+    Returns:
+        Response: the JSON page, with the X-Next-Cursor header if there may be more items
+    """
+    if after is not None and not after.isdigit():
+        raise HTTPException(400, "Invalid cursor")
+
+    include = None
+    if fields:
+        include = {f.strip() for f in fields.split(",") if f.strip()}
+        unknown = include - set(model.model_fields)
+        if unknown:
+            raise HTTPException(400, f"Unknown fields: {', '.join(sorted(unknown))}")
+
+    items, next_cursor = store.page(limit, None if after is None else int(after), predicate)
+    headers = {} if next_cursor is None else {"X-Next-Cursor": str(next_cursor)}
+    if include is not None or expand is not None:
+        body = serialization.dumps([item.model_dump(include=include) | (expand(item) if expand else {}) for item in items])
+    else:
+        body = serialization.dumps(items, model)
+    return Response(body, media_type="application/json", headers=headers)
+
+def _creative_summary(creative: Creative) -> dict:
+    return {"id": creative.id, "title": creative.title, "type": creative.type,
+            "filename": creative.filename, "enabling_state": creative.enabling_state}
+
+def _group_summary(group: CreativeGroup) -> dict:
+    return {"id": group.id, "title": group.title, "enabling_state": group.enabling_state, "status": group.status}
+
+def _insert_groups(new_groups: List[CreativeGroup]) -> List[Optional[str]]:
+    """Store new groups all-or-nothing, see IndexedStore.insert_many. The creatives' lock is held
+    throughout, so none of their creatives can be removed between the check and the insert.
+
+    Returns:
+        List[Optional[str]]: the error of each group or None
+    """
+    def check(the_group: CreativeGroup) -> Optional[str]:
+        return None if all(c_id in creatives for c_id in the_group.creative_ids) else "Creative ID not found"
+    with creatives.write_lock():
+        return creative_groups.insert_many(new_groups, check)
+
+def _raise_for_batch_errors(results: List[BatchItemResult]):
+    """Reject the whole batch with the per-item results if any item failed validation
+
+    Raises:
+        HTTPException: 400 error with the per-item results as the detail
+    """
+    if any(r.error is not None for r in results):
+        raise HTTPException(400, [r.model_dump() for r in results])
+
+def restore_state():
+    """Load the persisted entities into the stores, once, and resume the simulations of
+    the campaigns that were ACTIVE. The lifespan then starts persisting new writes.
+    """
+    global _restored
+    if _restored:
+        return
+    _restored = True
+
+    # Like seed_profile: decoding millions of entities would otherwise trigger full collections over and over
+    gc.disable()
+    try:
+        loaded = repository.load()
+        for kind, store in (("ad_account", ad_accounts), ("creative", creatives),
+                            ("creative_group", creative_groups), ("campaign", campaigns)):
+            if kind in loaded:
+                entities, seqs = loaded[kind]
+                store.load(entities, seqs)
+        if "champion" in loaded:
+            champions.load(*loaded["champion"])
+        del loaded
+        groups_by_creative.rebuild()
+        campaigns_by_group.rebuild()
+        search_index.rebuild()
+    finally:
+        gc.enable()
+    gc.freeze()
+
+    # The queue order isn't persisted, queued campaigns are restored in creation order
+    for the_campaign in campaigns.values():
+        if the_campaign.state == CampaignStateStrEnum.ACTIVE:
+            scheduler.start_simulation(the_campaign.id)
+        elif the_campaign.state == CampaignStateStrEnum.QUEUED:
+            scheduler.enqueue(the_campaign.id)
+
+def seed_profile(profile: str, seed: int = 0) -> SeedReport:
+    """Bulk load a generated dataset, see api/seeding.py. The entities go straight into the
+    stores, without the per-request checks, and the indexes are rebuilt once at the end.
+
+    Args:
+        profile (str): name of the profile in PROFILES, e.g. "large"
+        seed (int, optional): seed of the generator. Defaults to 0.
+
+    Raises:
+        ValueError: if a generated title is already taken, seed an empty store
+
+    Returns:
+        SeedReport: the counts, timings and resident memory growth
+    """
+    memory = rss_bytes()
+    # Millions of new objects would trigger full collections over and over, each one
+    # scanning everything allocated so far
+    gc.disable()
+    try:
+        start = time.perf_counter()
+        dataset = generate(PROFILES[profile], seed)
+        generated = time.perf_counter()
+        counts = {}
+        for kind, store, entities in (("creative", creatives, dataset.creatives),
+                                      ("creative_group", creative_groups, dataset.creative_groups),
+                                      ("campaign", campaigns, dataset.campaigns)):
+            store.load(entities)
+            # `load` doesn't notify the repository, mark the entities to persist by hand
+            repository.changed(kind, tuple(entity.id for entity in entities))
+            counts[kind] = len(entities)
+        groups_by_creative.rebuild()
+        campaigns_by_group.rebuild()
+        search_index.rebuild()
+        loaded = time.perf_counter()
+        del dataset # only the stores' copy stays, e.g. columns with STORE_LAYOUT=compact
+    finally:
+        gc.enable()
+    # The entities live as long as the server, keep the collector from scanning them again
+    gc.freeze()
+    return SeedReport(profile, seed, counts, generated - start, loaded - generated, rss_bytes() - memory)
+
+def _creative_usage(creative_id: str) -> CreativeUsage:
+    """Collect where the creative is used through the reverse indexes, without scanning the stores
+
+    Args:
+        creative_id (str): the target creative id
+    """
+    group_ids = groups_by_creative.referencing(creative_id)
+    campaign_ids = list(dict.fromkeys(cid for gid in group_ids for cid in campaigns_by_group.referencing(gid)))
+    active = [the_campaign.id for the_campaign in map(campaigns.get, campaign_ids)
+              if the_campaign is not None and the_campaign.state in (CampaignStateStrEnum.ACTIVE, CampaignStateStrEnum.QUEUED)]
+    return CreativeUsage(creative_id=creative_id, group_ids=group_ids, campaign_ids=campaign_ids, active_campaign_ids=active)
+
+def _update_campaign(campaign_id: str, mutate: Callable[[Campaign], None]) -> Campaign:
+    """Update a campaign copy-on-write under its lock, then push the new version to its stream subscribers.
+    Readers and the impression scheduler keep working on the version they already have.
+
+    Args:
+        campaign_id (str): the target campaign id
+        mutate (Callable[[Campaign], None]): changes the copy in place, raising leaves the campaign untouched
+
+    Returns:
+        Campaign: the new version of the campaign
+    """
+    the_campaign = campaigns.update(campaign_id, mutate)
+    broadcaster.publish([the_campaign])
+    return the_campaign
+
+def _complete_campaign(campaign_id: str):
+    """Pause the campaign once all its groups reach the impression target, and select its champion.
+
+    Args:
+        campaign_id (str): the target campaign id.
+    """
+    scheduler.cancel_simulation(campaign_id)
+    scheduler.dequeue(campaign_id) # a QUEUED campaign can complete through ingestion
+    _update_campaign(campaign_id, lambda the_campaign: setattr(the_campaign, "state", CampaignStateStrEnum.PAUSED))
+    _select_champion_from_campaign(campaign_id)
+    _admit_queued()
+
+def _admit_queued():
+    """Start the QUEUED campaigns that fit under SIM_MAX_ACTIVE_CAMPAIGNS, the first queued first"""
+    with scheduler.admission:
+        while True:
+            campaign_id = scheduler.next_admission()
+            if campaign_id is None:
+                return
+            if campaign_id not in campaigns:
+                continue # removed meanwhile
+            def admit(the_campaign: Campaign):
+                if the_campaign.state == CampaignStateStrEnum.QUEUED: # unless paused meanwhile
+                    the_campaign.state = CampaignStateStrEnum.ACTIVE
+            if _update_campaign(campaign_id, admit).state == CampaignStateStrEnum.ACTIVE:
+                scheduler.start_simulation(campaign_id)
+
+def _select_champion_from_campaign(campaign_id: str):
+    """Automatically select the winning creative group(s) after the campaign paused: the groups with
+    the highest impression under the uniform allocation policy, the best click rate under thompson.
+    Every enabled group tied for the win becomes a champion.
 
     Args:
         campaign_id (str): the target campaign id.
     """
     the_campaign = campaigns[campaign_id]
-    the_champion_group = max(the_campaign.impressions, key=the_campaign.impressions.get)
-    if the_champion_group not in champions_queue:
-        champions_queue.append(the_champion_group)
+    if not the_campaign.impressions:
+        return
+    for gid in scheduler.policy.champions(the_campaign.impressions, the_campaign.clicks):
+        the_group = creative_groups.get(gid)
+        if the_group is not None and the_group.enabling_state != EnablingStateEnum.DISABLED:
+            if champions.record(gid, campaign_id, the_campaign.impressions[gid]):
+                champions_selected.inc()
+
 
+def _lead_simulation(leading: bool):
+    """Run the impression scheduler while this worker holds the simulator lease
+
+    Args:
+        leading (bool): whether this worker just became the leader or lost the lease
+    """
+    if leading:
+        logger.info("Running the impression simulator in this worker")
+        scheduler.start()
+        _admit_queued()
+    else:
+        logger.info("Lost the simulator lease to another worker")
+        asyncio.ensure_future(scheduler.stop())
+
+def _apply_remote_changes(kind: str, changes: List[tuple]):
+    """Keep the simulations, time series and stream subscribers in step with the campaigns
+    written by other workers
+
+    Args:
+        kind (str): the kind of the changed entities
+        changes (List[tuple]): (old, new) entity pairs, new is None for a removal
+    """
+    # Loaded entities don't notify the stores' listeners
+    if kind in search_index.indexes:
+        search_index.indexes[kind].refresh([(new or old).id for old, new in changes])
+    if kind == "creative_group":
+        groups_by_creative.refresh([(new or old).id for old, new in changes])
+    if kind != "campaign":
+        return
+    campaigns_by_group.refresh([(new or old).id for old, new in changes])
+    updated, keys, counts = [], [], []
+    for old, new in changes:
+        if new is None:
+            if old is not None:
+                scheduler.cancel_simulation(old.id)
+                scheduler.dequeue(old.id)
+            continue
+        if new.state == CampaignStateStrEnum.ACTIVE:
+            scheduler.dequeue(new.id) # admitted by another worker
+            scheduler.start_simulation(new.id)
+        elif new.state == CampaignStateStrEnum.QUEUED:
+            scheduler.enqueue(new.id)
+        else:
+            scheduler.cancel_simulation(new.id)
+            scheduler.dequeue(new.id)
+        if old is not None:
+            for gid, impressions in new.impressions.items():
+                delta = impressions - old.impressions.get(gid, 0)
+                if delta > 0:
+                    keys.append((new.id, gid))
+                    counts.append(delta)
+        updated.append(new)
+    if keys:
+        impression_series.record_many(keys, counts)
+    broadcaster.publish(updated)
+    # Slots freed by other workers are filled by the one running the simulations
+    if scheduler.ticking:
+        _admit_queued()
+
+
+def _record_tick_timing(duration: float, lag: float):
+    tick_duration.observe(duration)
+    tick_lag.observe(lag)
+
+
+scheduler = ImpressionScheduler(campaigns, on_complete=_complete_campaign, on_tick=broadcaster.publish,
+                                series=impression_series, on_timing=_record_tick_timing, on_release=_admit_queued,
+                                guard=load_guard)
 
 ### Helpers ###
 
 
 
 if __name__ == "__main__":
-    # Add the two good creatives and use them to create the good creative group
-    create_creative(title='good_creative_1', type=CreativeTypeStrEnum.VIDEO)
-    create_creative(title='good_creative_2', type=CreativeTypeStrEnum.VIDEO)
-    good_creative_1_id = get_creative_id_by_title('good_creative_1')
-    good_creative_2_id = get_creative_id_by_title('good_creative_2')
-    create_group(title='good_creative_group', description='High performance group', creative_ids=[good_creative_1_id, good_creative_2_id])
-
-    # Add the creative testing campaign and the two regular campaigns
-    create_campaign(title='creative_testing_campaign', description='', group_ids=[])
-    create_campaign(title='regular_campaign_a', description='', group_ids=[])
-    create_campaign(title='regular_campaign_b', description='', group_ids=[])
+    parser = argparse.ArgumentParser(description="Run the mock API on port 8000")
+    parser.add_argument("--seed-profile", choices=list(PROFILES), default=config.SEED_PROFILE or None,
+                        help="load a generated dataset of this size into an empty store, see api/seeding.py")
+    parser.add_argument("--seed", type=int, default=config.SEED, help="seed of the generated dataset")
+    args = parser.parse_args()
+    # Show this module's info logs, e.g. the seed report, next to uvicorn's
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s:     %(message)s")
+
+    if config.API_WORKERS > 1 and config.STORAGE_BACKEND != "sqlite":
+        sys.exit("API_WORKERS > 1 needs STORAGE_BACKEND=sqlite so the workers share their state")
+
+    # Restore the persisted state first, and only seed into an empty store
+    restore_state()
+    if args.seed_profile and len(creatives) == 0:
+        logger.info("%s", seed_profile(args.seed_profile, args.seed))
+    elif len(campaigns) == 0:
+        # Add the two good creatives and use them to create the good creative group
+        create_creative(title='good_creative_1', type=CreativeTypeStrEnum.VIDEO)
+        create_creative(title='good_creative_2', type=CreativeTypeStrEnum.VIDEO)
+        good_creative_1_id = get_creative_id_by_title('good_creative_1')
+        good_creative_2_id = get_creative_id_by_title('good_creative_2')
+        create_group(title='good_creative_group', description='High performance group', creative_ids=[good_creative_1_id, good_creative_2_id])
+
+        # Add the creative testing campaign and the two regular campaigns
+        create_campaign(title='creative_testing_campaign', description='', group_ids=[])
+        create_campaign(title='regular_campaign_a', description='', group_ids=[])
+        create_campaign(title='regular_campaign_b', description='', group_ids=[])
 
     # Run server
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    if config.API_WORKERS > 1:
+        # Each worker imports the app and restores the seeded state from the database
+        repository.close()
+        uvicorn.run("api.mock_api:app", host="0.0.0.0", port=8000, workers=config.API_WORKERS)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -0,0 +1,482 @@
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Protocol, Tuple
+
+from pydantic import BaseModel, TypeAdapter
+
+from api import config
+
+
+logger = logging.getLogger(__name__)
+
+
+class Source(Protocol):
+    """What a repository needs from a store: entity lookup, change notifications, and bulk
+    writes that don't notify, to apply the writes of other processes
+    """
+
+    def get(self, key: str): ...
+
+    def __iter__(self) -> Iterator[str]: ...
+
+    def subscribe(self, listener: Callable[[Tuple[str, ...]], None]): ...
+
+    def load(self, entities: Iterable[BaseModel], seqs: Optional[Iterable[int]] = None): ...
+
+    def unload(self, keys: Iterable[str]): ...
+
+
+# {kind: (entities in insertion order, their insertion sequence numbers)}. The entities are
+# models, or what the store's `decode_json` made of their rows, see `SQLiteRepository.load`.
+Loaded = Dict[str, Tuple[List[BaseModel], List[int]]]
+
+# listener(kind, [(old entity or None, new entity or None for a removal)])
+Watcher = Callable[[str, List[Tuple[Optional[BaseModel], Optional[BaseModel]]]], None]
+
+
+class Repository(ABC):
+    """Persists the in-memory stores.
+
+    Stores are registered under a kind name. The repository subscribes to their
+    change notifications, and writes the current state of the changed entities
+    later, so many writes to one entity cost one persisted row.
+    """
+
+    def __init__(self):
+        self._sources: Dict[str, Source] = {}
+        self._models: Dict[str, type] = {}
+        self._watchers: List[Watcher] = []
+
+    def register(self, kind: str, model: type, source: Source):
+        """Persist the entities of `source` under `kind`
+
+        Args:
+            kind (str): name of the entity kind in storage
+            model (type): the Pydantic model of the entities
+            source (Source): the store holding the entities
+        """
+        self._sources[kind] = source
+        self._models[kind] = model
+        source.subscribe(lambda keys: self.changed(kind, keys))
+
+    @abstractmethod
+    def load(self) -> Loaded:
+        """Read back every persisted entity"""
+
+    @abstractmethod
+    def changed(self, kind: str, keys: Tuple[str, ...]):
+        """Mark entities as written, they are persisted on the next flush"""
+
+    def watch(self, listener: Watcher):
+        """Call `listener(kind, changes)` after applying entities written by other processes
+        to the stores. It's called from the syncing thread.
+        """
+        self._watchers.append(listener)
+
+    def unwatch(self, listener: Watcher):
+        """Stop calling a listener passed to `watch`"""
+        # Replaced rather than mutated, the syncing thread may be iterating the old list
+        self._watchers = [watcher for watcher in self._watchers if watcher is not listener]
+
+    def elect(self, on_change: Callable[[bool], None]):
+        """Take part in electing the one process that runs the impression simulator.
+        `on_change(True)` is called when this process becomes the leader, `on_change(False)`
+        when it loses the lease. A repository that isn't shared always leads.
+        """
+        on_change(True)
+
+    def start(self):
+        """Start background flushing"""
+
+    def flush(self):
+        """Persist the entities written since the last flush"""
+
+    def close(self):
+        """Flush and release the storage. It's opened again by the next `load`, `elect` or `start`,
+        and closing twice does nothing.
+        """
+
+
+class InMemoryRepository(Repository):
+    """Keeps nothing: state lives in the stores and is lost on restart"""
+
+    def load(self) -> Loaded:
+        return {}
+
+    def changed(self, kind: str, keys: Tuple[str, ...]):
+        pass
+
+
+class SQLiteRepository(Repository):
+    """Persists the stores to an SQLite database in WAL mode, which several worker processes can share.
+
+    Changed entities are collected in a dirty set and appended to a `log` table by a
+    background thread every `flush_interval` seconds, one transaction per flush (group
+    commit). Once the log has `checkpoint_rows` rows it's folded into the `snapshot`
+    table, which keeps one row per entity. Recovery reads the snapshot and replays the
+    log on top of it.
+
+    The same thread tails the log for rows written by other workers and applies them to
+    the stores. On a conflict the simulator leader takes the other worker's version,
+    while the other workers keep their own pending write, so a pause or reset made in
+    any worker wins over a concurrent simulator tick. Each worker records how far it
+    has read in the `workers` table, and checkpoints only fold rows every live worker
+    has read; a worker that fell further behind reloads everything. The leader is
+    whoever holds the `lease` row, renewed every third of `lease_ttl`.
+    """
+
+    LEASE = "simulator"
+
+    def __init__(self,
+                 path: str,
+                 flush_interval: float = config.STORAGE_FLUSH_INTERVAL,
+                 checkpoint_rows: int = config.STORAGE_CHECKPOINT_ROWS,
+                 lease_ttl: float = config.STORAGE_LEASE_TTL,
+                 max_workers: int = config.STORAGE_MAX_WORKERS):
+        super().__init__()
+        self.path = path
+        self.flush_interval = flush_interval
+        self.checkpoint_rows = checkpoint_rows
+        self.lease_ttl = lease_ttl
+        self.max_workers = max_workers
+        self.worker_id = uuid.uuid4().hex
+        self._db_lock = threading.Lock()
+        self._dirty: Dict[Tuple[str, str], None] = {} # insertion-ordered set of (kind, id)
+        self._dirty_lock = threading.Lock()
+        self._cursor = 0 # last log row applied to the stores, written by this worker or another one
+        self._adapters: Dict[str, TypeAdapter] = {}
+        self._on_lead: Optional[Callable[[bool], None]] = None
+        self.leading = False
+        self._next_beat = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._conn: Optional[sqlite3.Connection] = None
+        self._connect()
+
+    def _connect(self):
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS snapshot (
+                kind TEXT NOT NULL, id TEXT NOT NULL, pos INTEGER NOT NULL, data BLOB NOT NULL,
+                PRIMARY KEY (kind, id)) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS log (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL, id TEXT NOT NULL, pos INTEGER NOT NULL, data BLOB); -- NULL data is a removal
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+            CREATE TABLE IF NOT EXISTS workers (
+                id TEXT PRIMARY KEY, slot INTEGER NOT NULL, seq INTEGER NOT NULL, seen REAL NOT NULL);
+            CREATE TABLE IF NOT EXISTS lease (name TEXT PRIMARY KEY, owner TEXT NOT NULL, expires REAL NOT NULL);
+        """)
+        self._log_rows = self._conn.execute("SELECT COUNT(*) FROM log").fetchone()[0]
+
+    def _reopen(self):
+        """Connect again after `close`, e.g. when the app's lifespan runs again, and rejoin the workers"""
+        if self._conn is not None:
+            return
+        self._connect()
+        self._stop.clear()
+        with self._db_lock:
+            self._join()
+
+    ### Recovery ###
+
+    def load(self) -> Loaded:
+        self._reopen()
+        with self._db_lock:
+            self._conn.execute("BEGIN")
+            try:
+                rows, self._cursor = self._read_state()
+            finally:
+                self._conn.execute("COMMIT")
+            self._join()
+
+        by_kind: Dict[str, List[Tuple[int, bytes]]] = {}
+        for (kind, _), row in rows.items():
+            by_kind.setdefault(kind, []).append(row)
+
+        loaded: Loaded = {}
+        for kind, kind_rows in by_kind.items():
+            if kind not in self._models:
+                continue
+            kind_rows.sort(key=lambda row: row[0])
+            data = [data for _, data in kind_rows]
+            # A store that can take the rows without models, e.g. CompactStore, skips validating them
+            decode = getattr(self._sources[kind], "decode_json", None)
+            loaded[kind] = (decode(data) if decode is not None else self._validate(kind, data), [pos for pos, _ in kind_rows])
+        return loaded
+
+    def _read_state(self) -> Tuple[Dict[Tuple[str, str], Tuple[int, bytes]], int]:
+        rows = {(kind, key): (pos, data) for kind, key, pos, data
+                in self._conn.execute("SELECT kind, id, pos, data FROM snapshot")}
+        last_seq = self._checkpoint_seq()
+        for seq, kind, key, pos, data in self._conn.execute("SELECT seq, kind, id, pos, data FROM log ORDER BY seq"):
+            if data is None:
+                rows.pop((kind, key), None)
+            else:
+                rows[(kind, key)] = (pos, data)
+            last_seq = seq
+        return rows, last_seq
+
+    def _validate(self, kind: str, data: List[bytes]) -> List[BaseModel]:
+        adapter = self._adapters.get(kind)
+        if adapter is None:
+            adapter = self._adapters[kind] = TypeAdapter(List[self._models[kind]])
+        # One validation call per kind instead of one per entity
+        return adapter.validate_json(b"[" + b",".join(data) + b"]")
+
+    def _checkpoint_seq(self) -> int:
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'checkpoint'").fetchone()
+        return 0 if row is None else row[0]
+
+    ### Recovery ###
+
+
+    ### Workers ###
+
+    def _join(self):
+        """Register this worker and claim a free slot, which partitions the insertion sequence numbers"""
+        now = time.time()
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._conn.execute("DELETE FROM workers WHERE seen < ?", (now - self.lease_ttl,))
+            taken = {slot for slot, in self._conn.execute("SELECT slot FROM workers WHERE id != ?", (self.worker_id,))}
+            free = [slot for slot in range(self.max_workers) if slot not in taken]
+            if not free:
+                raise RuntimeError(f"More than {self.max_workers} workers share {self.path}")
+            self._conn.execute("INSERT OR REPLACE INTO workers (id, slot, seq, seen) VALUES (?, ?, ?, ?)",
+                               (self.worker_id, free[0], self._cursor, now))
+            self._conn.execute("COMMIT")
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        for source in self._sources.values():
+            partition = getattr(source, "partition_seqs", None)
+            if partition is not None:
+                partition(self.max_workers, free[0])
+
+    def elect(self, on_change: Callable[[bool], None]):
+        self._reopen()
+        self._on_lead = on_change
+        self._beat()
+
+    def _beat(self):
+        """Record how far this worker has read, and acquire or renew the simulator lease"""
+        now = time.time()
+        leading = False
+        with self._db_lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                updated = self._conn.execute("UPDATE workers SET seq = ?, seen = ? WHERE id = ?",
+                                             (self._cursor, now, self.worker_id)).rowcount
+                if self._on_lead is not None:
+                    self._conn.execute(
+                        "INSERT INTO lease (name, owner, expires) VALUES (?, ?, ?) "
+                        "ON CONFLICT (name) DO UPDATE SET owner = excluded.owner, expires = excluded.expires "
+                        "WHERE lease.owner = excluded.owner OR lease.expires < ?",
+                        (self.LEASE, self.worker_id, now + self.lease_ttl, now))
+                    owner, = self._conn.execute("SELECT owner FROM lease WHERE name = ?", (self.LEASE,)).fetchone()
+                    leading = owner == self.worker_id
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            if not updated: # presumed dead after a stall, and the slot may be someone else's by now
+                self._join()
+        self._next_beat = time.monotonic() + self.lease_ttl / 3
+
+        if leading != self.leading:
+            self.leading = leading
+            self._on_lead(leading)
+
+    ### Workers ###
+
+
+    ### Sync ###
+
+    def changed(self, kind: str, keys: Tuple[str, ...]):
+        with self._dirty_lock:
+            for key in keys:
+                self._dirty[(kind, key)] = None
+
+    def start(self):
+        self._reopen()
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="sqlite-sync", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                if time.monotonic() >= self._next_beat:
+                    self._beat()
+                self.flush()
+            except Exception:
+                logger.exception("SQLite sync failed")
+
+    def flush(self):
+        """Apply the rows written by other workers, then persist the entities written here since the last flush"""
+        with self._dirty_lock:
+            dirty, self._dirty = self._dirty, {}
+
+        def keep_local(kind: str, key: str) -> bool:
+            return not self.leading and ((kind, key) in dirty or (kind, key) in self._dirty)
+
+        rows = []
+        with self._db_lock:
+            # The write lock is taken before reading, so no other worker writes between our read and our write
+            self._conn.execute("BEGIN IMMEDIATE" if dirty else "BEGIN")
+            try:
+                self._tail(keep_local)
+                rows = self._rows(dirty)
+                if rows:
+                    self._conn.executemany("INSERT INTO log (kind, id, pos, data) VALUES (?, ?, ?, ?)", rows)
+                    self._cursor = self._conn.execute("SELECT MAX(seq) FROM log").fetchone()[0]
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                with self._dirty_lock:
+                    self._dirty.update(dirty)
+                raise
+            self._log_rows += len(rows)
+            if self._log_rows >= self.checkpoint_rows:
+                self._checkpoint()
+
+    def _rows(self, dirty: Dict[Tuple[str, str], None]) -> List[tuple]:
+        rows = []
+        for kind, key in dirty:
+            source = self._sources[kind]
+            entity = source.get(key)
+            if entity is None:
+                rows.append((kind, key, 0, None))
+                continue
+            try:
+                data = entity.model_dump_json().encode()
+            except RuntimeError: # mutated while serializing, try again on the next flush
+                self.changed(kind, (key,))
+                continue
+            seq_of = getattr(source, "seq_of", None)
+            rows.append((kind, key, seq_of(key) if seq_of else 0, data))
+        return rows
+
+    def _tail(self, keep_local: Callable[[str, str], bool]):
+        if self._checkpoint_seq() > self._cursor:
+            # Rows this worker never read were folded into the snapshot, reload everything
+            logger.warning("Worker %s fell behind the log, reloading the stores", self.worker_id)
+            rows, self._cursor = self._read_state()
+            self._apply(rows, keep_local, complete=True)
+            return
+
+        rows = {}
+        for seq, kind, key, pos, data in self._conn.execute(
+                "SELECT seq, kind, id, pos, data FROM log WHERE seq > ? ORDER BY seq", (self._cursor,)):
+            rows[(kind, key)] = (pos, data)
+            self._cursor = seq
+        if rows:
+            self._apply(rows, keep_local)
+
+    def _apply(self, rows: Dict[Tuple[str, str], Tuple[int, Optional[bytes]]],
+               keep_local: Callable[[str, str], bool], complete: bool = False):
+        """Apply the latest rows of other workers to the stores
+
+        Args:
+            rows (Dict): {(kind, id): (position, data or None for a removal)}
+            keep_local (Callable): tells which entities have a local write that wins over the rows
+            complete (bool): the rows hold every entity, local entities missing from them were removed
+        """
+        by_kind: Dict[str, Dict[str, Tuple[int, Optional[bytes]]]] = {kind: {} for kind in self._sources} if complete else {}
+        for (kind, key), row in rows.items():
+            if kind in self._sources and not keep_local(kind, key):
+                by_kind.setdefault(kind, {})[key] = row
+
+        for kind, kind_rows in by_kind.items():
+            source = self._sources[kind]
+            removed = [key for key, (_, data) in kind_rows.items() if data is None]
+            if complete:
+                removed += [key for key in list(source) if key not in kind_rows and not keep_local(kind, key)]
+            upserts = sorted((pos, key, data) for key, (pos, data) in kind_rows.items() if data is not None)
+            entities = self._validate(kind, [data for _, _, data in upserts])
+            changes = [(source.get(key), None) for key in removed]
+            changes += [(source.get(key), entity) for (_, key, _), entity in zip(upserts, entities)]
+
+            source.unload(removed)
+            try:
+                source.load(entities, [pos for pos, _, _ in upserts])
+            except ValueError: # a title taken concurrently in two workers, the first one to load it keeps it
+                for (pos, key, _), entity in zip(upserts, entities):
+                    try:
+                        source.load([entity], [pos])
+                    except ValueError as e:
+                        logger.warning("Skipped %s %s written by another worker: %s", kind, key, e)
+            for listener in self._watchers:
+                listener(kind, changes)
+
+    def checkpoint(self):
+        """Fold the log rows every live worker has read into the snapshot"""
+        with self._db_lock:
+            self._checkpoint()
+
+    def _checkpoint(self):
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            others, = self._conn.execute("SELECT MIN(seq) FROM workers WHERE seen >= ? AND id != ?",
+                                         (time.time() - self.lease_ttl, self.worker_id)).fetchone()
+            upto = self._cursor if others is None else min(others, self._cursor)
+            latest: Dict[Tuple[str, str], Tuple[int, Optional[bytes]]] = {}
+            for kind, key, pos, data in self._conn.execute(
+                    "SELECT kind, id, pos, data FROM log WHERE seq <= ? ORDER BY seq", (upto,)):
+                latest[(kind, key)] = (pos, data)
+
+            self._conn.executemany(
+                "INSERT INTO snapshot (kind, id, pos, data) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (kind, id) DO UPDATE SET pos = excluded.pos, data = excluded.data",
+                [(kind, key, pos, data) for (kind, key), (pos, data) in latest.items() if data is not None])
+            self._conn.executemany("DELETE FROM snapshot WHERE kind = ? AND id = ?",
+                                   [(kind, key) for (kind, key), (_, data) in latest.items() if data is None])
+            self._conn.execute("DELETE FROM log WHERE seq <= ?", (upto,))
+            self._conn.execute("INSERT INTO meta (key, value) VALUES ('checkpoint', ?) "
+                               "ON CONFLICT (key) DO UPDATE SET value = MAX(value, excluded.value)", (upto,))
+            self._conn.execute("COMMIT")
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._log_rows = 0
+
+    ### Sync ###
+
+    def close(self):
+        if self._conn is None:
+            return
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+        with self._db_lock:
+            self._checkpoint()
+            # Leave right away instead of making the other workers wait for the lease to expire
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._conn.execute("DELETE FROM workers WHERE id = ?", (self.worker_id,))
+            self._conn.execute("UPDATE lease SET expires = 0 WHERE owner = ?", (self.worker_id,))
+            self._conn.execute("COMMIT")
+            self._conn.close()
+            self._conn = None
+        self.leading = False
+
+
+def create_repository(backend: str = config.STORAGE_BACKEND, path: str = config.STORAGE_PATH) -> Repository:
+    """Create the repository configured by STORAGE_BACKEND ("memory" or "sqlite")
+
+    Raises:
+        ValueError: if the backend is unknown
+    """
+    if backend == "memory":
+        return InMemoryRepository()
+    if backend == "sqlite":
+        return SQLiteRepository(path)
+    raise ValueError(f"Unknown storage backend \"{backend}\"")
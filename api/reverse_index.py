@@ -0,0 +1,68 @@
+from threading import Lock
+from typing import Callable, Dict, Iterable, List, Tuple
+
+from api.store import IndexedStore, T
+
+
+class ReverseIndex:
+    """Which entities of a store reference an id, e.g. the groups containing a creative, without
+    scanning the store.
+
+    The index subscribes to the store and re-reads every written entity, comparing its
+    references with the ones it indexed last time, so it follows inserts, in-place
+    touches, copy-on-write updates and removals alike. Writes that don't notify the
+    store's listeners (`load`, `unload`) must be followed by `refresh` or `rebuild`.
+    Referencing ids are kept in insertion order, and each reference counts once.
+    """
+
+    def __init__(self, store: IndexedStore[T], references: Callable[[T], Iterable[str]]):
+        """
+        Args:
+            store (IndexedStore[T]): the store of the referencing entities
+            references (Callable[[T], Iterable[str]]): the ids an entity references, e.g. a group's creative ids
+        """
+        self._store = store
+        self._references = references
+        self._forward: Dict[str, Tuple[str, ...]] = {} # {referencing id: referenced ids}
+        self._reverse: Dict[str, Dict[str, None]] = {} # {referenced id: {referencing id: None}}, an ordered set
+        self._lock = Lock() # writes come from the store's writers and the remote sync alike
+        store.subscribe(self.refresh)
+
+    def refresh(self, keys: Iterable[str]):
+        """Re-index the entities with these ids from their current version in the store
+
+        Args:
+            keys (Iterable[str]): ids of the written entities, including removed ones
+        """
+        with self._lock:
+            for key in keys:
+                entity = self._store.get(key)
+                new = tuple(self._references(entity)) if entity is not None else ()
+                old = self._forward.get(key, ())
+                if new == old: # most writes, e.g. impressions, leave the references alone
+                    continue
+                new = tuple(dict.fromkeys(new))
+                for ref in set(old).difference(new):
+                    referencing = self._reverse[ref]
+                    del referencing[key]
+                    if not referencing:
+                        del self._reverse[ref]
+                for ref in set(new).difference(old):
+                    self._reverse.setdefault(ref, {})[key] = None
+                if new:
+                    self._forward[key] = new
+                else:
+                    self._forward.pop(key, None)
+
+    def rebuild(self):
+        """Re-index the whole store, e.g. after it was loaded from storage"""
+        keys = list(self._store.keys())
+        self.refresh(keys + [key for key in self._forward if key not in self._store])
+
+    def referencing(self, ref: str) -> List[str]:
+        """Get the ids of the entities referencing `ref`, in the order they started referencing it"""
+        with self._lock:
+            return list(self._reverse.get(ref, ()))
+
+    def is_referenced(self, ref: str) -> bool:
+        return ref in self._reverse
@@ -0,0 +1,204 @@
+import re
+from bisect import bisect_left, insort
+from functools import lru_cache
+from threading import Lock
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from api.store import IndexedStore
+from shared.models import SearchHit, SearchMatchStrEnum
+
+
+_TOKEN = re.compile(r"\w+")
+_RANKS = {match: rank for rank, match in enumerate(SearchMatchStrEnum)} # best first
+
+def normalize(text: str) -> str:
+    return text.casefold().strip()
+
+def tokenize(text: str) -> List[str]:
+    return list(dict.fromkeys(_TOKEN.findall(text.casefold())))
+
+@lru_cache(maxsize=None)
+def _has_description(model: type) -> bool:
+    # Looking up a missing attribute of a Pydantic model raises and catches an error, ask the class once instead
+    return "description" in model.model_fields
+
+def _description(entity) -> str:
+    return entity.description if _has_description(type(entity)) else ""
+
+
+class _InvertedIndex:
+    """{token: {id: None}} postings, plus the tokens in sorted order to expand a prefix"""
+
+    # A short prefix like "c" can match most of the vocabulary, only this many tokens are expanded
+    MAX_EXPANSIONS = 64
+
+    def __init__(self):
+        self.postings: Dict[str, Dict[str, None]] = {}
+        self.vocabulary: List[str] = []
+
+    def add(self, key: str, tokens: Iterable[str]):
+        for token in tokens:
+            posting = self.postings.get(token)
+            if posting is None:
+                posting = self.postings[token] = {}
+                insort(self.vocabulary, token)
+            posting[key] = None
+
+    def discard(self, key: str, tokens: Iterable[str]):
+        for token in tokens:
+            posting = self.postings[token]
+            del posting[key]
+            if not posting:
+                del self.postings[token]
+                del self.vocabulary[bisect_left(self.vocabulary, token)]
+
+    def expand(self, prefix: str) -> List[str]:
+        i = bisect_left(self.vocabulary, prefix)
+        tokens = self.vocabulary[i:i + self.MAX_EXPANSIONS]
+        return [token for token in tokens if token.startswith(prefix)]
+
+    def matches(self, tokens: List[str]) -> Iterator[str]:
+        """Yield the ids with every token, the last one as a prefix (the user is still typing it)"""
+        exact = [self.postings.get(token) for token in tokens[:-1]]
+        if any(posting is None for posting in exact):
+            return
+        expanded = [self.postings[token] for token in self.expand(tokens[-1])]
+        if not expanded:
+            return
+
+        # Walk the smaller side and probe the others
+        exact.sort(key=len)
+        if exact and len(exact[0]) < sum(map(len, expanded)):
+            for key in exact[0]:
+                if all(key in posting for posting in exact[1:]) and any(key in posting for posting in expanded):
+                    yield key
+            return
+        seen = set()
+        for posting in expanded:
+            for key in posting:
+                if key not in seen and all(key in other for other in exact):
+                    seen.add(key)
+                    yield key
+
+
+class TextIndex:
+    """Search index over the `title` (and `description`, if any) of the entities of one store.
+
+    Titles are kept normalized in one sorted array, so the titles starting with a query
+    are a bisect away, and tokens of titles and descriptions have inverted indexes. Like
+    `ReverseIndex`, it subscribes to the store and re-reads the written entities; writes
+    that leave the text alone, such as impressions, cost one tuple comparison. A new title
+    is inserted into the sorted array in O(n), a memmove of pointers; `rebuild` sorts in bulk.
+    """
+
+    def __init__(self, store: IndexedStore, kind: str):
+        """
+        Args:
+            store (IndexedStore): the store of the entities to index
+            kind (str): the kind reported in the search hits, e.g. "campaign"
+        """
+        self.kind = kind
+        self._store = store
+        self._texts: Dict[str, Tuple[str, str, str]] = {} # {id: (title, normalized title, description)}
+        self._titles: List[Tuple[str, str]] = [] # sorted (normalized title, id)
+        self._title_tokens = _InvertedIndex()
+        self._description_tokens = _InvertedIndex()
+        self._lock = Lock()
+        store.subscribe(self.refresh)
+
+    def __len__(self) -> int:
+        return len(self._texts)
+
+    def refresh(self, keys: Iterable[str]):
+        """Re-index the entities with these ids from their current version in the store
+
+        Args:
+            keys (Iterable[str]): ids of the written entities, including removed ones
+        """
+        with self._lock:
+            for key in keys:
+                entity = self._store.get(key)
+                old = self._texts.get(key)
+                if entity is not None and old is not None and old[0] == entity.title and \
+                        old[2] == _description(entity):
+                    continue
+                if old is not None:
+                    self._discard(key, old)
+                if entity is not None:
+                    self._add(key, entity.title, _description(entity))
+
+    def rebuild(self):
+        """Re-index the whole store at once, e.g. after it was loaded from storage"""
+        with self._lock:
+            self._texts.clear()
+            self._title_tokens = _InvertedIndex()
+            self._description_tokens = _InvertedIndex()
+            for key, title, description in self._store.fields("title", "description", default=""):
+                self._texts[key] = (title, normalize(title), description)
+                for index, text in ((self._title_tokens, title), (self._description_tokens, description)):
+                    if text:
+                        for token in tokenize(text):
+                            index.postings.setdefault(token, {})[key] = None
+            for index in (self._title_tokens, self._description_tokens):
+                index.vocabulary = sorted(index.postings)
+            self._titles = sorted((normalized, key) for key, (_, normalized, _) in self._texts.items())
+
+    def _add(self, key: str, title: str, description: str):
+        normalized = normalize(title)
+        self._texts[key] = (title, normalized, description)
+        insort(self._titles, (normalized, key))
+        self._title_tokens.add(key, tokenize(title))
+        self._description_tokens.add(key, tokenize(description))
+
+    def _discard(self, key: str, text: Tuple[str, str, str]):
+        title, normalized, description = text
+        del self._titles[bisect_left(self._titles, (normalized, key))]
+        self._title_tokens.discard(key, tokenize(title))
+        self._description_tokens.discard(key, tokenize(description))
+        del self._texts[key]
+
+    def search(self, query: str, limit: int) -> List[SearchHit]:
+        """Get up to `limit` entities matching the query, best first: the exact title, titles
+        starting with the query, titles with every query word, then descriptions with every
+        query word. The last word matches as a prefix.
+        """
+        normalized, tokens = normalize(query), tokenize(query)
+        hits: Dict[str, SearchHit] = {}
+        with self._lock:
+            i = bisect_left(self._titles, (normalized,))
+            for title, key in self._titles[i:i + limit]:
+                if not title.startswith(normalized):
+                    break
+                match = SearchMatchStrEnum.EXACT if title == normalized else SearchMatchStrEnum.PREFIX
+                hits[key] = SearchHit(kind=self.kind, id=key, title=self._texts[key][0], match=match)
+            if tokens:
+                for index, match in ((self._title_tokens, SearchMatchStrEnum.TITLE),
+                                     (self._description_tokens, SearchMatchStrEnum.DESCRIPTION)):
+                    for key in index.matches(tokens):
+                        if len(hits) >= limit:
+                            break
+                        if key not in hits:
+                            hits[key] = SearchHit(kind=self.kind, id=key, title=self._texts[key][0], match=match)
+        # Exact matches sort before the other prefix matches, which are in title order already
+        return sorted(hits.values(), key=lambda hit: _RANKS[hit.match])
+
+
+class SearchIndex:
+    """The text indexes of several stores, searched together"""
+
+    def __init__(self, indexes: Iterable[TextIndex]):
+        self.indexes = {index.kind: index for index in indexes}
+
+    def rebuild(self):
+        for index in self.indexes.values():
+            index.rebuild()
+
+    def search(self, query: str, kind: Optional[str] = None, limit: int = 10) -> List[SearchHit]:
+        """Search one kind, or every kind with the best matches of all of them first
+
+        Raises:
+            KeyError: if the kind is not indexed
+        """
+        indexes = [self.indexes[kind]] if kind is not None else self.indexes.values()
+        hits = [hit for index in indexes for hit in index.search(query, limit)]
+        return sorted(hits, key=lambda hit: _RANKS[hit.match])[:limit]
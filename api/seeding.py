@@ -0,0 +1,131 @@
+import os
+import resource
+import uuid
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Tuple
+
+import numpy as np
+from pydantic import TypeAdapter
+
+from shared.models import MEDIA, Campaign, Creative, CreativeGroup, CreativeTypeStrEnum
+
+
+class SeedProfile(NamedTuple):
+    creatives: int
+    groups: int
+    campaigns: int
+    creatives_per_group: Tuple[int, int] # (min, max), drawn uniformly
+    groups_per_campaign: Tuple[int, int]
+
+PROFILES: Dict[str, SeedProfile] = {
+    "small": SeedProfile(creatives=1_000, groups=100, campaigns=10, creatives_per_group=(2, 6), groups_per_campaign=(2, 6)),
+    "medium": SeedProfile(creatives=100_000, groups=10_000, campaigns=1_000, creatives_per_group=(2, 6), groups_per_campaign=(2, 6)),
+    "large": SeedProfile(creatives=1_000_000, groups=100_000, campaigns=10_000, creatives_per_group=(2, 6), groups_per_campaign=(2, 6)),
+}
+
+# Share of each creative type
+CREATIVE_TYPES = {CreativeTypeStrEnum.VIDEO: 0.5, CreativeTypeStrEnum.IMAGE: 0.35, CreativeTypeStrEnum.HTML: 0.15}
+
+# Title words, so that titles and descriptions look like the ones people search for
+WORDS = ["summer", "winter", "spring", "autumn", "sale", "launch", "banner", "promo", "brand", "retarget",
+         "install", "holiday", "flash", "premium", "casual", "puzzle", "racing", "shooter", "story", "music",
+         "fitness", "rewards", "weekend", "bonus", "level", "boost", "arcade", "strategy", "trivia", "cards"]
+
+_CREATIVES = TypeAdapter(List[Creative])
+_GROUPS = TypeAdapter(List[CreativeGroup])
+_CAMPAIGNS = TypeAdapter(List[Campaign])
+
+
+class Dataset(NamedTuple):
+    creatives: List[Creative]
+    creative_groups: List[CreativeGroup]
+    campaigns: List[Campaign]
+
+
+def generate(profile: SeedProfile, seed: int) -> Dataset:
+    """Generate creatives, groups of creatives and campaigns running the groups. The same
+    profile and seed give the same ids, titles and memberships. Every campaign is PAUSED.
+
+    Each kind is validated in one call of a list TypeAdapter, which is as fast as Pydantic
+    builds models, and none of the per-request checks run: titles are unique and the
+    memberships point to generated entities by construction.
+
+    Args:
+        profile (SeedProfile): how many entities of each kind
+        seed (int): seed of the random generator
+
+    Returns:
+        Dataset: the entities, not yet stored
+    """
+    rng = np.random.default_rng(seed)
+    now = datetime.now()
+    words = np.array(WORDS)
+
+    def ids(n: int) -> List[str]:
+        raw = rng.bytes(16 * n)
+        return [str(uuid.UUID(bytes=raw[i:i + 16], version=4)) for i in range(0, 16 * n, 16)]
+
+    def titles(n: int, prefix: str) -> List[str]:
+        pairs = words[rng.integers(0, len(WORDS), size=(n, 2))]
+        return [f"{first} {second} {prefix} {i}" for i, (first, second) in enumerate(pairs.tolist())]
+
+    def descriptions(n: int) -> List[str]:
+        return [" ".join(triple) for triple in words[rng.integers(0, len(WORDS), size=(n, 3))].tolist()]
+
+    def memberships(n: int, sizes: Tuple[int, int], pool: List[str]) -> List[List[str]]:
+        counts = rng.integers(sizes[0], sizes[1] + 1, size=n)
+        picks = rng.integers(0, len(pool), size=int(counts.sum())).tolist()
+        bounds = np.concatenate(([0], np.cumsum(counts))).tolist()
+        # A repeated pick is dropped, like the API does with a repeated id
+        return [list(dict.fromkeys(pool[j] for j in picks[start:end])) for start, end in zip(bounds, bounds[1:])]
+
+    types = list(CREATIVE_TYPES)
+    creative_types = rng.choice(len(types), size=profile.creatives, p=list(CREATIVE_TYPES.values())).tolist()
+    rows = []
+    for new_id, title, t in zip(ids(profile.creatives), titles(profile.creatives, "creative"), creative_types):
+        the_type = types[t]
+        field, extension = MEDIA[the_type]
+        filename = f"{title}.{extension}"
+        the_media = {"filename": filename, "auto_endcard": True} if the_type == CreativeTypeStrEnum.VIDEO else {"filename": filename}
+        rows.append({"id": new_id, "title": title, "type": the_type, "filename": filename, "updated_at": now, field: the_media})
+    creatives = _CREATIVES.validate_python(rows)
+
+    creative_ids = [the_creative.id for the_creative in creatives]
+    rows = [
+        {"id": new_id, "title": title, "description": description, "creative_ids": members, "updated_at": now}
+        for new_id, title, description, members in zip(ids(profile.groups), titles(profile.groups, "group"), descriptions(profile.groups),
+                                                       memberships(profile.groups, profile.creatives_per_group, creative_ids))
+    ]
+    groups = _GROUPS.validate_python(rows)
+
+    group_ids = [the_group.id for the_group in groups]
+    rows = [
+        {"id": new_id, "title": title, "description": description, "groups": members, "updated_at": now}
+        for new_id, title, description, members in zip(ids(profile.campaigns), titles(profile.campaigns, "campaign"), descriptions(profile.campaigns),
+                                                       memberships(profile.campaigns, profile.groups_per_campaign, group_ids))
+    ]
+    campaigns = _CAMPAIGNS.validate_python(rows)
+    return Dataset(creatives, groups, campaigns)
+
+
+def rss_bytes() -> int:
+    """Resident memory of this process, or its peak where the current value isn't available"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class SeedReport(NamedTuple):
+    profile: str
+    seed: int
+    counts: Dict[str, int] # {kind: entities loaded}
+    generate_seconds: float
+    load_seconds: float # into the stores, plus rebuilding the indexes
+    memory_bytes: int # growth of the resident memory
+
+    def __str__(self) -> str:
+        counts = ", ".join(f"{n} {kind}" for kind, n in self.counts.items())
+        return (f"Seeded profile {self.profile!r} (seed {self.seed}): {counts}, generated in {self.generate_seconds:.1f}s, "
+                f"loaded in {self.load_seconds:.1f}s, +{self.memory_bytes / 2**20:.0f} MiB resident")
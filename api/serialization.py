@@ -0,0 +1,43 @@
+import json
+from typing import Dict, List, Optional
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+from pydantic_core import to_json
+
+from api import config
+
+try:
+    import orjson
+except ImportError: # orjson is optional, pydantic-core serializes plain data without it
+    orjson = None
+
+
+_adapters: Dict[type, TypeAdapter] = {}
+
+
+def dumps(items: List, model: Optional[type] = None) -> bytes:
+    """Serialize a list response body, the same bytes JSONResponse would render
+
+    With FAST_JSON, the items are trusted models built by the service itself: a list of `model`
+    instances is written by pydantic-core in one call, without jsonable_encoder turning every
+    model into dicts first, and plain dicts go to orjson when it's installed.
+
+    Args:
+        items (List): `model` instances, or plain dicts (projected or expanded items)
+        model (type, optional): the Pydantic model of the items, None if they are dicts
+
+    Returns:
+        bytes: compact UTF-8 JSON
+    """
+    if not config.FAST_JSON:
+        return json.dumps(jsonable_encoder(items), ensure_ascii=False, allow_nan=False,
+                          indent=None, separators=(",", ":")).encode("utf-8")
+    if model is not None:
+        adapter = _adapters.get(model)
+        if adapter is None:
+            adapter = _adapters[model] = TypeAdapter(List[model])
+        return adapter.dump_json(items)
+    if orjson is not None:
+        return orjson.dumps(items)
+    return to_json(items)
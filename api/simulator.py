@@ -0,0 +1,402 @@
+import asyncio
+import logging
+from threading import Lock
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from api import config
+from api.allocation import AllocationPolicy, create_policy, latent_click_rate
+from api.load_guard import LoadGuard
+from api.store import IndexedStore
+from api.timeseries import TimeSeriesStore
+from shared.models import Campaign, CampaignStateStrEnum, Simulation, SimulatedCampaign, SimulationRun
+
+
+logger = logging.getLogger(__name__)
+
+
+def advance(policy: AllocationPolicy,
+            rng: np.random.Generator,
+            click_rng: np.random.Generator,
+            impressions: np.ndarray,
+            clicks: np.ndarray,
+            click_rates: np.ndarray,
+            starts: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Advance a batch of (campaign, group) counters by one tick, in place. This is the step
+    shared by the real-time scheduler and `fast_forward`, so the same seed draws the same
+    impressions and clicks in both.
+
+    Args:
+        policy (AllocationPolicy): splits the impressions between the groups and decides completion
+        rng (np.random.Generator): the impression random generator
+        click_rng (np.random.Generator): the click random generator, kept apart so the impressions drawn
+            by a policy don't depend on how many clicks were drawn
+        impressions (np.ndarray): int64 impressions of every group in the batch, each campaign's groups contiguous
+        clicks (np.ndarray): int64 clicks of every group in the batch
+        click_rates (np.ndarray): the latent click rate of every group in the batch
+        starts (np.ndarray): the index of each campaign's first group in the counters
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: the impressions added to each group, and for each campaign whether it's complete
+    """
+    increments, complete = policy.step(rng, impressions, clicks, starts)
+    impressions += increments
+    clicks += click_rng.binomial(increments, click_rates)
+    return increments, complete
+
+
+class ImpressionScheduler:
+    """A single ticker that advances the impressions of every running simulation.
+
+    Running simulations are kept in a registry keyed by campaign id, so launching a
+    campaign twice never doubles its work, and cancelling takes effect before the
+    next tick. On each tick the (campaign, group) counters of the selected campaigns are laid
+    out in flat NumPy arrays, and the allocation policy draws the impressions of every
+    group at once and checks completion per campaign segment. Campaigns whose groups all reached
+    the impression target are handed to `on_complete`. Campaigns are never mutated in
+    place: the advanced versions are compare-and-swapped into the store.
+
+    With `max_active_campaigns`, launches over the cap wait in a FIFO admission queue, and
+    a `LoadGuard` can shrink the batch of each tick while the API is slow.
+    """
+
+    def __init__(self,
+                 campaigns: IndexedStore[Campaign],
+                 on_complete: Callable[[str], None],
+                 on_tick: Optional[Callable[[List[Campaign]], None]] = None,
+                 series: Optional[TimeSeriesStore] = None,
+                 on_timing: Optional[Callable[[float, float], None]] = None,
+                 on_release: Optional[Callable[[], None]] = None,
+                 policy: Optional[AllocationPolicy] = None,
+                 guard: Optional[LoadGuard] = None,
+                 tick_interval: float = config.SIM_TICK_INTERVAL,
+                 max_campaigns_per_tick: int = config.SIM_MAX_CAMPAIGNS_PER_TICK,
+                 max_active_campaigns: int = config.SIM_MAX_ACTIVE_CAMPAIGNS,
+                 seed: Optional[int] = config.SIM_SEED):
+        """
+        Args:
+            campaigns (IndexedStore[Campaign]): the campaign store to advance
+            on_complete (Callable[[str], None]): called with the campaign id once all its groups reach the target
+            on_tick (Callable[[List[Campaign]], None], optional): called with the campaigns advanced on each tick
+            series (TimeSeriesStore, optional): records the per-tick increments of every group
+            on_timing (Callable[[float, float], None], optional): called after each scheduled tick with its duration, and how late
+                the sleep before it woke up, in seconds
+            on_release (Callable[[], None], optional): called after a tick dropped the simulations of campaigns no longer
+                ACTIVE, so queued campaigns can take the freed slots
+            policy (AllocationPolicy, optional): how impressions are split between groups, SIM_ALLOCATION_POLICY if None
+            guard (LoadGuard, optional): shrinks the batch of each scheduled tick while the API is slow, None to never back off
+            tick_interval (float): seconds between ticks
+            max_campaigns_per_tick (int): cap on campaigns advanced per tick, 0 for no cap. Campaigns over the cap are served round-robin on later ticks.
+            max_active_campaigns (int): cap on running simulations, 0 for no cap. Launches over the cap are queued, see `has_capacity`.
+            seed (int, optional): seed for the impression random generator
+        """
+        self._campaigns = campaigns
+        self._on_complete = on_complete
+        self._on_tick = on_tick
+        self._series = series
+        self._on_timing = on_timing
+        self._on_release = on_release
+        self.policy = policy if policy is not None else create_policy()
+        self.guard = guard
+        self.tick_interval = tick_interval
+        self.max_campaigns_per_tick = max_campaigns_per_tick
+        self.max_active_campaigns = max_active_campaigns
+        seeds = np.random.SeedSequence(seed)
+        self._rng = np.random.default_rng(seeds)
+        self._click_rng = np.random.default_rng(seeds.spawn(1)[0])
+        self._simulations: Dict[str, Simulation] = {} # {campaign id: Simulation}
+        self._queue: Dict[str, None] = {} # queued campaign ids, first queued first
+        self.admission = Lock() # held while deciding whether a campaign runs or queues, and writing its state
+        self._cursor = 0 # round-robin position when the per-tick cap applies
+        self._task: Optional[asyncio.Task] = None
+
+    ### Registry ###
+
+    def start_simulation(self, campaign_id: str) -> bool:
+        """Register a running simulation for the campaign
+
+        Returns:
+            bool: False if the campaign was already running, True otherwise
+        """
+        if campaign_id in self._simulations:
+            return False
+        self._simulations[campaign_id] = Simulation(campaign_id=campaign_id)
+        return True
+
+    def cancel_simulation(self, campaign_id: str) -> bool:
+        """Drop the campaign's simulation, it won't be advanced by any later tick
+
+        Returns:
+            bool: True if a simulation was running
+        """
+        return self._simulations.pop(campaign_id, None) is not None
+
+    def is_running(self, campaign_id: str) -> bool:
+        return campaign_id in self._simulations
+
+    def simulations(self) -> List[Simulation]:
+        """Get the running simulations in launch order"""
+        return list(self._simulations.values())
+
+    ### Registry ###
+
+
+    ### Admission ###
+
+    def has_capacity(self) -> bool:
+        """Check if a launch can run right away: under `max_active_campaigns`, and nobody queued before it"""
+        cap = self.max_active_campaigns
+        return not cap or (len(self._simulations) < cap and not self._queue)
+
+    def enqueue(self, campaign_id: str):
+        """Queue the campaign for a simulation slot, behind the ones queued before it. Queuing it again keeps its place."""
+        self._queue.setdefault(campaign_id, None)
+
+    def dequeue(self, campaign_id: str) -> bool:
+        """Take the campaign out of the queue
+
+        Returns:
+            bool: True if it was queued
+        """
+        try:
+            del self._queue[campaign_id]
+        except KeyError:
+            return False
+        return True
+
+    def is_queued(self, campaign_id: str) -> bool:
+        return campaign_id in self._queue
+
+    def queued(self) -> List[str]:
+        """Get the queued campaign ids in admission order"""
+        return list(self._queue)
+
+    def next_admission(self) -> Optional[str]:
+        """Take the first queued campaign out of the queue if a simulation slot is free
+
+        Returns:
+            Optional[str]: its id, None if the queue is empty or every slot is taken
+        """
+        cap = self.max_active_campaigns
+        if not self._queue or (cap and len(self._simulations) >= cap):
+            return None
+        campaign_id = next(iter(self._queue))
+        del self._queue[campaign_id]
+        return campaign_id
+
+    ### Admission ###
+
+    def _select_batch(self) -> List[Campaign]:
+        active = []
+        released = False
+        for campaign_id in list(self._simulations):
+            the_campaign = self._campaigns.get(campaign_id)
+            if the_campaign is None or the_campaign.state != CampaignStateStrEnum.ACTIVE:
+                # The campaign is gone or was stopped without cancelling its simulation. A
+                # concurrent cancel_simulation may have dropped it already.
+                released |= self.cancel_simulation(campaign_id)
+            elif the_campaign.impressions:
+                active.append(the_campaign)
+        if released and self._on_release is not None:
+            self._on_release() # admitted campaigns run from the next tick
+
+        cap = self.max_campaigns_per_tick
+        if self.guard is not None:
+            limit = self.guard.limit(len(active))
+            cap = min(cap, limit) if cap else limit
+        if not cap or len(active) <= cap:
+            return active
+
+        start = self._cursor % len(active)
+        batch = (active[start:] + active[:start])[:cap]
+        self._cursor = start + cap
+        return batch
+
+    def tick(self) -> List[str]:
+        """Advance the selected ACTIVE campaigns by one step
+
+        Returns:
+            List[str]: the ids of the campaigns completed on this tick
+        """
+        batch = self._select_batch()
+        if not batch:
+            return []
+
+        sizes = [len(c.impressions) for c in batch]
+        group_ids = [gid for c in batch for gid in c.impressions]
+        counters = np.fromiter((n for c in batch for n in c.impressions.values()),
+                               dtype=np.int64, count=len(group_ids))
+        clicks = np.fromiter((c.clicks.get(gid, 0) for c in batch for gid in c.impressions),
+                             dtype=np.int64, count=len(group_ids))
+        click_rates = np.fromiter(map(latent_click_rate, group_ids), dtype=np.float64, count=len(group_ids))
+        starts = np.cumsum(sizes) - sizes
+        increments, complete = advance(self.policy, self._rng, self._click_rng, counters, clicks, click_rates, starts)
+
+        values, added, clicked = counters.tolist(), increments.tolist(), clicks.tolist()
+        # Copy-on-write: the new versions replace the ones read above only if nothing wrote them
+        # meanwhile. A campaign written concurrently (reset, pause, group removed) skips this
+        # step and is advanced from its new version on the next tick.
+        updated = [the_campaign.model_copy(update={"impressions": dict(zip(group_ids[start:start + size], values[start:start + size])),
+                                                   "clicks": dict(zip(group_ids[start:start + size], clicked[start:start + size]))})
+                   for the_campaign, start, size in zip(batch, starts.tolist(), sizes)]
+        swapped = {id(the_campaign) for the_campaign in self._campaigns.swap(zip(batch, updated))}
+
+        advanced, completed, keys, counts = [], [], [], []
+        for the_campaign, start, size, is_complete in zip(updated, starts.tolist(), sizes, complete.tolist()):
+            if id(the_campaign) not in swapped:
+                continue
+            advanced.append(the_campaign)
+            simulation = self._simulations.get(the_campaign.id)
+            if simulation is not None:
+                simulation.ticks += 1
+            if is_complete:
+                completed.append(the_campaign.id)
+            if self._series is not None:
+                keys.extend((the_campaign.id, gid) for gid in group_ids[start:start + size])
+                counts.extend(added[start:start + size])
+        if keys:
+            self._series.record_many(keys, counts)
+
+        for campaign_id in completed:
+            self._simulations.pop(campaign_id, None)
+            self._on_complete(campaign_id)
+        if self._on_tick is not None:
+            self._on_tick(advanced)
+        return completed
+
+    async def run(self):
+        """Tick forever, sleeping `tick_interval` seconds between ticks"""
+        loop = asyncio.get_running_loop()
+        lag = 0.0
+        while True:
+            started = loop.time()
+            if self.guard is not None:
+                self.guard.update(lag)
+            try:
+                self.tick()
+            except Exception:
+                logger.exception("Impression scheduler tick failed")
+            finished = loop.time()
+            if self._on_timing is not None:
+                self._on_timing(finished - started, lag)
+            await asyncio.sleep(self.tick_interval)
+            # A busy event loop wakes the scheduler up late, which delays every simulation
+            lag = max(0.0, loop.time() - finished - self.tick_interval)
+
+    @property
+    def ticking(self) -> bool:
+        """Whether this scheduler ticks, i.e. its process runs the simulations"""
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        """Start ticking on the running event loop"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        """Stop ticking and wait for the loop to exit"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+
+def fast_forward(campaigns: Iterable[Campaign],
+                 seed: Optional[int] = None,
+                 max_campaigns_per_tick: int = 0,
+                 max_active_campaigns: int = 0,
+                 trajectories: bool = False,
+                 is_eligible: Optional[Callable[[str], bool]] = None,
+                 policy: Optional[AllocationPolicy] = None) -> SimulationRun:
+    """Simulate the campaigns until they all complete, without sleeping between ticks and
+    without touching them. Every tick advances the same batch with the same `advance` step
+    as `ImpressionScheduler.tick`, so the run is identical to launching the campaigns, in
+    this order, into a scheduler seeded with `seed` and ticking it until they all completed.
+    Launches over `max_active_campaigns` are queued and admitted as in the scheduler. The
+    `LoadGuard` isn't simulated: the run matches a scheduler whose guard never backed off.
+
+    The counters of every campaign stay in one flat array, and each tick gathers the
+    groups of its batch, advances them and scatters them back; only the round-robin
+    bookkeeping of the per-tick cap is done per campaign.
+
+    Args:
+        campaigns (Iterable[Campaign]): the campaigns to simulate from their current impressions, duplicates are ignored
+        seed (int, optional): seed for the impression random generator, a fresh one if None
+        max_campaigns_per_tick (int): cap on campaigns advanced per tick as in the scheduler, 0 for no cap
+        max_active_campaigns (int): cap on running simulations as in the scheduler, 0 for no cap
+        trajectories (bool): also return every group's impressions after each tick
+        is_eligible (Callable[[str], bool], optional): whether a group id can be selected as champion, all can if None
+        policy (AllocationPolicy, optional): how impressions are split between groups, SIM_ALLOCATION_POLICY if None
+
+    Returns:
+        SimulationRun: the completion tick, final impressions and champion groups of every campaign
+    """
+    policy = policy if policy is not None else create_policy()
+    seeds = np.random.SeedSequence(seed)
+    rng = np.random.default_rng(seeds)
+    click_rng = np.random.default_rng(seeds.spawn(1)[0])
+
+    unique = list({the_campaign.id: the_campaign for the_campaign in campaigns}.values())
+    group_ids = [list(the_campaign.impressions) for the_campaign in unique]
+    sizes = np.array([len(gids) for gids in group_ids], dtype=np.int64)
+    offsets = np.cumsum(sizes) - sizes
+    counters = np.fromiter((n for the_campaign in unique for n in the_campaign.impressions.values()),
+                           dtype=np.int64, count=int(sizes.sum()))
+    clicks = np.fromiter((the_campaign.clicks.get(gid, 0) for the_campaign, gids in zip(unique, group_ids) for gid in gids),
+                         dtype=np.int64, count=counters.size)
+    click_rates = np.fromiter((latent_click_rate(gid) for gids in group_ids for gid in gids), dtype=np.float64, count=counters.size)
+    completed_tick = np.zeros(len(unique), dtype=np.int64) # 0 while running
+
+    # Campaigns without groups are never advanced by the scheduler either
+    launched = np.flatnonzero(sizes > 0)
+    # Over the admission cap, the others wait, and are admitted in order as running ones complete
+    cap = max_active_campaigns or launched.size
+    active, queued = launched[:cap], launched[cap:]
+    history: List[np.ndarray] = []
+    cursor, tick = 0, 0
+    while active.size:
+        tick += 1
+        if max_campaigns_per_tick and active.size > max_campaigns_per_tick:
+            start = cursor % active.size
+            batch = np.concatenate((active[start:], active[:start]))[:max_campaigns_per_tick]
+            cursor = start + max_campaigns_per_tick
+        else:
+            batch = active
+
+        batch_sizes = sizes[batch]
+        batch_starts = np.cumsum(batch_sizes) - batch_sizes
+        index = np.repeat(offsets[batch] - batch_starts, batch_sizes) + np.arange(int(batch_sizes.sum()))
+        values, clicked = counters[index], clicks[index]
+        _, complete = advance(policy, rng, click_rng, values, clicked, click_rates[index], batch_starts)
+        counters[index], clicks[index] = values, clicked
+
+        completed_tick[batch[complete]] = tick
+        if complete.any():
+            active = active[completed_tick[active] == 0]
+            free = cap - active.size
+            if free and queued.size:
+                active, queued = np.concatenate((active, queued[:free])), queued[free:]
+        if trajectories:
+            history.append(counters.copy())
+
+    timeline = np.stack(history) if history else np.zeros((0, counters.size), dtype=np.int64)
+    results = []
+    for i, the_campaign in enumerate(unique):
+        first, size = int(offsets[i]), int(sizes[i])
+        impressions = dict(zip(group_ids[i], counters[first:first + size].tolist()))
+        clicked = dict(zip(group_ids[i], clicks[first:first + size].tolist()))
+        result = SimulatedCampaign(campaign_id=the_campaign.id, impressions=impressions, clicks=clicked)
+        if size:
+            result.completed_tick = int(completed_tick[i])
+            result.champion_group_ids = [gid for gid in policy.champions(impressions, clicked)
+                                         if is_eligible is None or is_eligible(gid)]
+        if trajectories:
+            result.trajectory = {gid: timeline[:result.completed_tick or 0, first + j].tolist()
+                                 for j, gid in enumerate(group_ids[i])}
+        results.append(result)
+    return SimulationRun(seed=seeds.entropy, ticks=tick, campaigns=results)
@@ -0,0 +1,329 @@
+from bisect import bisect_left, bisect_right
+from collections.abc import MutableMapping
+from itertools import count
+from threading import Lock, RLock
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, TypeVar, Generic
+
+from pydantic import BaseModel
+
+
+T = TypeVar("T", bound=BaseModel)
+
+ENTITY_LOCK_STRIPES = 64
+
+
+class IndexedStore(MutableMapping, Generic[T]):
+    """A dict-like store of entities keyed by id, with a title -> id secondary index.
+
+    Every insert, replace and removal keeps the title index in sync, so checking
+    whether a title is taken and looking up an entity by title are both O(1).
+
+    Each id also gets a monotonic insertion sequence number, which serves as a
+    stable pagination cursor: removals never shift the position of later entities.
+    Processes sharing one database partition the sequence numbers between them (see
+    `partition_seqs`), so an entity has the same cursor in every process.
+
+    `version` increases on every write. Writes that mutate a stored entity in place
+    must call `touch(id)` so caches built from an older version are invalidated, and
+    listeners (e.g. the persistence layer) learn which entities changed. Entities written
+    from several threads should go through `update` or `swap` instead, which never mutate
+    a stored instance, so readers always see a consistent version without locking.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._items: Dict[str, T] = {}
+        self._title_index: Dict[str, str] = {} # {title: id}
+        self._seq: Dict[str, int] = {} # {id: insertion sequence number}
+        # (ascending sequence numbers, matching ids or None once removed), swapped as a whole
+        # when rebuilt, so a reader that grabbed the pair never sees them out of step
+        self._order: Tuple[List[int], List[Optional[str]]] = ([], [])
+        self._removed = 0
+        self._next_seq = 0
+        self._seq_stride = 1
+        self._seq_offset = 0
+        self._versions = count(1) # next() on a count is atomic, unlike `+= 1` across threads
+        self.version = 0
+        self._listeners: List[Callable[[Tuple[str, ...]], None]] = []
+        self._lock = RLock() # serializes writes to the indexes, reads don't take it
+        self._entity_locks = [Lock() for _ in range(ENTITY_LOCK_STRIPES)]
+
+    def __getitem__(self, key: str) -> T:
+        return self._items[key]
+
+    def __setitem__(self, key: str, entity: T):
+        with self._lock:
+            owner = self._title_index.get(entity.title)
+            if owner is not None and owner != key:
+                raise ValueError(f"{self.name} title \"{entity.title}\" already exists")
+
+            old = self._items.get(key)
+            if old is not None and old.title != entity.title:
+                self._title_index.pop(old.title, None)
+            self._items[key] = entity
+            self._title_index[entity.title] = key
+            if old is None:
+                seq = self._next_seq + (self._seq_offset - self._next_seq) % self._seq_stride
+                self._append_order(seq, key)
+                self._next_seq = seq + 1
+            self.touch(key)
+
+    def __delitem__(self, key: str):
+        with self.entity_lock(key), self._lock:
+            self._remove(key)
+            self.touch(key)
+
+    def __contains__(self, key) -> bool:
+        return key in self._items
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._items)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    # The default MutableMapping views go through __getitem__ one key at a time
+    def keys(self):
+        return self._items.keys()
+
+    def values(self):
+        return self._items.values()
+
+    def items(self):
+        return self._items.items()
+
+    def fields(self, *names: str, default=None) -> List[tuple]:
+        """Get (id, *values of these fields) of every entity, `default` for a field its model
+        lacks. Cheaper than reading the entities from a store that builds them on read.
+        """
+        rows = []
+        for key, entity in list(self._items.items()):
+            model_fields = type(entity).model_fields
+            rows.append((key, *(getattr(entity, name) if name in model_fields else default for name in names)))
+        return rows
+
+    def insert_many(self, entities: List[T], check: Optional[Callable[[T], Optional[str]]] = None) -> List[Optional[str]]:
+        """Insert new entities all-or-nothing. They're all checked, then all inserted, under the
+        store's lock, so no concurrent write can take one of their titles in between.
+
+        Args:
+            entities (List[T]): the new entities
+            check (Callable[[T], Optional[str]], optional): more validation of each entity, returns an error message or None
+
+        Returns:
+            List[Optional[str]]: the error of each entity or None, nothing was inserted unless they're all None
+        """
+        with self._lock:
+            errors, seen = [], set()
+            for entity in entities:
+                if entity.title in self._title_index or entity.title in seen:
+                    errors.append(f"{self.name} \"{entity.title}\" already exists")
+                else:
+                    errors.append(check(entity) if check is not None else None)
+                seen.add(entity.title)
+            if all(error is None for error in errors):
+                for entity in entities:
+                    self[entity.id] = entity
+            return errors
+
+    def write_lock(self) -> RLock:
+        """Get the lock every write of this store takes. Holding it keeps entities from being
+        added or removed while a write to another store is checked against this one, and it's
+        taken before the other store's lock.
+        """
+        return self._lock
+
+    def clear(self):
+        with self._lock:
+            keys = tuple(self._items)
+            self._items.clear()
+            self._title_index.clear()
+            self._seq.clear()
+            self._order = ([], [])
+            self._removed = 0
+            self.touch(*keys)
+
+    def touch(self, *keys: str):
+        """Bump the store version after mutating stored entities in place, and tell the listeners which ones
+
+        Args:
+            keys (str): ids of the entities that changed
+        """
+        self.version = next(self._versions)
+        if keys:
+            for listener in self._listeners:
+                listener(keys)
+
+    def subscribe(self, listener: Callable[[Tuple[str, ...]], None]):
+        """Call `listener(ids)` after every write, with the ids of the entities written"""
+        self._listeners.append(listener)
+
+    ### Copy-on-write ###
+
+    def entity_lock(self, key: str) -> Lock:
+        """Get the lock serializing the read-modify-write updates of one entity. Locks are
+        striped: unrelated entities may share one, so never hold two at once. It's always
+        taken before the store's own lock.
+        """
+        return self._entity_locks[hash(key) % ENTITY_LOCK_STRIPES]
+
+    def update(self, key: str, mutate: Callable[[T], None]) -> T:
+        """Update an entity without ever mutating the stored instance
+
+        The current entity is deep-copied, `mutate` changes the copy, and the copy replaces
+        the stored one. Updates of one entity are serialized by its lock, so none of them is
+        lost, while readers keep using whichever version they got without locking. If
+        `mutate` raises, the stored entity is left untouched.
+
+        Args:
+            key (str): id of the entity
+            mutate (Callable[[T], None]): changes the copy in place
+
+        Raises:
+            KeyError: if the entity doesn't exist
+
+        Returns:
+            T: the new version of the entity
+        """
+        with self.entity_lock(key):
+            updated = self._items[key].model_copy(deep=True)
+            mutate(updated)
+            self[key] = updated
+        return updated
+
+    def swap(self, pairs: Iterable[Tuple[T, T]]) -> List[T]:
+        """Compare-and-swap entities computed from a version read earlier without a lock
+
+        Each new entity replaces the stored one only if the store still holds the exact
+        version it was computed from, so a concurrent `update` always wins. Titles must not change.
+
+        Args:
+            pairs (Iterable[Tuple[T, T]]): (version read, new version) pairs
+
+        Returns:
+            List[T]: the new versions that were swapped in
+        """
+        swapped = []
+        for old, new in pairs:
+            with self.entity_lock(new.id), self._lock:
+                if self._items.get(new.id) is old:
+                    self._items[new.id] = new
+                    swapped.append(new)
+        if swapped:
+            self.touch(*(entity.id for entity in swapped))
+        return swapped
+
+    ### Copy-on-write ###
+
+    def partition_seqs(self, stride: int, offset: int):
+        """Only hand out insertion sequence numbers equal to `offset` modulo `stride`, so
+        processes given different offsets never assign the same cursor to different entities
+        """
+        self._seq_stride = stride
+        self._seq_offset = offset
+
+    def load(self, entities: Iterable[T], seqs: Optional[Iterable[int]] = None):
+        """Bulk insert or replace entities, e.g. when restoring from storage or applying writes
+        made by another process. Listeners are not called.
+
+        Args:
+            entities (Iterable[T]): the entities, in insertion order
+            seqs (Iterable[int], optional): insertion sequence numbers to restore, so cursors survive a restart
+
+        Raises:
+            ValueError: if a title is already taken
+        """
+        seqs = iter(seqs) if seqs is not None else None
+        with self._lock:
+            for entity in entities:
+                key = entity.id
+                owner = self._title_index.get(entity.title)
+                if owner is not None and owner != key:
+                    raise ValueError(f"{self.name} title \"{entity.title}\" already exists")
+                old = self._items.get(key)
+                if old is not None and old.title != entity.title:
+                    self._title_index.pop(old.title, None)
+                seq = self._next_seq if seqs is None else next(seqs)
+                if old is None:
+                    self._append_order(seq, key)
+                    self._next_seq = max(self._next_seq, seq + 1)
+                self._items[key] = entity
+                self._title_index[entity.title] = key
+            self.version = next(self._versions)
+
+    def unload(self, keys: Iterable[str]):
+        """Bulk remove entities, e.g. when applying removals made by another process. Listeners are not called."""
+        with self._lock:
+            for key in keys:
+                if key in self._items:
+                    self._remove(key)
+            self.version = next(self._versions)
+
+    def seq_of(self, key: str) -> int:
+        """Get the insertion sequence number of an id"""
+        return self._seq[key]
+
+    def _append_order(self, seq: int, key: str):
+        self._seq[key] = seq
+        seqs, ids = self._order
+        if not seqs or seq > seqs[-1]:
+            # Appending the id last keeps len(ids) <= len(seqs) for concurrent readers
+            seqs.append(seq)
+            ids.append(key)
+        else: # inserted by another process before some of ours, rebuild instead of shifting under readers
+            i = bisect_left(seqs, seq)
+            self._order = (seqs[:i] + [seq] + seqs[i:], ids[:i] + [key] + ids[i:])
+
+    def _remove(self, key: str):
+        entity = self._items.pop(key)
+        if self._title_index.get(entity.title) == key:
+            del self._title_index[entity.title]
+        seq = self._seq.pop(key)
+        seqs, ids = self._order
+        ids[bisect_right(seqs, seq) - 1] = None
+        self._removed += 1
+        if self._removed > len(ids) // 2:
+            kept = [(seq, key) for seq, key in zip(seqs, ids) if key is not None]
+            self._order = ([seq for seq, _ in kept], [key for _, key in kept])
+            self._removed = 0
+
+    def page(self,
+             limit: Optional[int] = None,
+             after: Optional[int] = None,
+             predicate: Optional[Callable[[T], bool]] = None) -> Tuple[List[T], Optional[int]]:
+        """Get entities in insertion order, starting after a cursor. Doesn't block writers.
+
+        Args:
+            limit (int, optional): max number of entities to return, None for all of them
+            after (int, optional): cursor from a previous page, None to start from the beginning
+            predicate (Callable, optional): only return entities matching this filter
+
+        Returns:
+            Tuple[List[T], Optional[int]]: the page, and the cursor for the next page or None if this page isn't full
+        """
+        seqs, ids = self._order
+        start = 0 if after is None else bisect_right(seqs, after)
+        found = []
+        for i in range(start, len(ids)):
+            key = ids[i]
+            entity = None if key is None else self._items.get(key)
+            if entity is None: # removed, possibly while paging
+                continue
+            if predicate is None or predicate(entity):
+                found.append(entity)
+                if len(found) == limit:
+                    return found, seqs[i]
+        return found, None
+
+    def has_title(self, title: str) -> bool:
+        """Check if an entity with this exact title exists"""
+        return title in self._title_index
+
+    def get_id_by_title(self, title: str) -> Optional[str]:
+        """Get the entity id by exact title match, or None if it doesn't exist"""
+        return self._title_index.get(title)
+
+    def get_by_title(self, title: str) -> Optional[T]:
+        """Get the entity by exact title match, or None if it doesn't exist"""
+        key = self._title_index.get(title)
+        return None if key is None else self._items.get(key)
@@ -0,0 +1,95 @@
+import asyncio
+import json
+from collections import defaultdict
+from threading import Lock
+from typing import AsyncIterator, Dict, Iterable, Optional, Set
+
+from shared.models import Campaign
+
+
+def campaign_frame(campaign: Campaign) -> dict:
+    """Snapshot the parts of a campaign that the stream reports"""
+    return {"campaign_id": campaign.id, "state": campaign.state.value, "impressions": dict(campaign.impressions)}
+
+
+class Subscription:
+    """One stream consumer. Holds at most one pending frame: a newer frame replaces
+    the pending one, so a slow consumer skips intermediate frames instead of queueing them.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self._loop = loop
+        self._ready = asyncio.Event()
+        self._pending: Optional[dict] = None
+        self.dropped = 0 # frames replaced before the consumer read them
+
+    def offer(self, frame: dict):
+        """Hand the consumer a new frame. Safe to call from any thread."""
+        if self._pending is not None:
+            self.dropped += 1
+        self._pending = frame
+        self._loop.call_soon_threadsafe(self._ready.set)
+
+    async def next(self) -> dict:
+        """Wait for the latest frame"""
+        while self._pending is None:
+            self._ready.clear()
+            await self._ready.wait()
+        frame, self._pending = self._pending, None
+        return frame
+
+
+class CampaignBroadcaster:
+    """Fans campaign frames out to the subscribers of each campaign"""
+
+    def __init__(self):
+        self._subscribers: Dict[str, Set[Subscription]] = defaultdict(set) # {campaign id: subscriptions}
+        self._lock = Lock()
+
+    def subscribe(self, campaign_id: str) -> Subscription:
+        """Subscribe to a campaign, must be called on the event loop that will consume the frames"""
+        subscription = Subscription(asyncio.get_running_loop())
+        with self._lock:
+            self._subscribers[campaign_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, campaign_id: str, subscription: Subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(campaign_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[campaign_id]
+
+    def publish(self, campaigns: Iterable[Campaign]):
+        """Offer the current frame of each campaign to its subscribers, if it has any"""
+        for the_campaign in campaigns:
+            subscribers = self._subscribers.get(the_campaign.id)
+            if not subscribers:
+                continue
+            frame = campaign_frame(the_campaign)
+            with self._lock:
+                subscribers = list(subscribers)
+            for subscription in subscribers:
+                subscription.offer(frame)
+
+
+async def sse_frames(subscription: Subscription, heartbeat: float = 15.0) -> AsyncIterator[str]:
+    """Render the frames of a subscription as Server-Sent Events.
+
+    Each event carries the full impressions and the delta since the last frame this
+    consumer received, so the deltas stay correct when intermediate frames are dropped.
+    """
+    last: Dict[str, int] = {}
+    while True:
+        try:
+            frame = await asyncio.wait_for(subscription.next(), heartbeat)
+        except asyncio.TimeoutError:
+            yield ": keep-alive\n\n"
+            continue
+
+        impressions = frame["impressions"]
+        delta = {gid: n - last.get(gid, 0) for gid, n in impressions.items() if n != last.get(gid, 0)}
+        last = impressions
+        data = {**frame, "delta": delta, "dropped": subscription.dropped}
+        yield f"event: campaign\ndata: {json.dumps(data)}\n\n"
@@ -0,0 +1,201 @@
+import time
+from threading import Lock
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from api import config
+
+
+_ROLLUP_SECONDS = {"minute": 60, "hour": 3600}
+
+Key = Tuple[str, str] # (campaign id, group id)
+
+
+class _Rollup:
+    """Fixed-width time buckets for every series, one ring of `slots` buckets per row"""
+
+    def __init__(self, rows: int, slots: int, seconds: int):
+        self.slots = slots
+        self.seconds = seconds
+        self.counts = np.zeros((rows, slots), dtype=np.int64)
+        self.newest = np.full(rows, -1, dtype=np.int64) # newest bucket number per row, -1 if empty
+        self.filled = np.zeros(rows, dtype=np.int32) # buckets written per row, up to `slots`
+
+    def grow(self, rows: int):
+        extra = rows - len(self.newest)
+        self.counts = np.vstack([self.counts, np.zeros((extra, self.slots), dtype=np.int64)])
+        self.newest = np.concatenate([self.newest, np.full(extra, -1, dtype=np.int64)])
+        self.filled = np.concatenate([self.filled, np.zeros(extra, dtype=np.int32)])
+
+    def clear(self, row: int):
+        self.counts[row] = 0
+        self.newest[row] = -1
+        self.filled[row] = 0
+
+    def add(self, rows: np.ndarray, counts: np.ndarray, ts: float):
+        bucket = int(ts // self.seconds)
+        # Rows that enter a new bucket zero the buckets they skip over. This happens once per
+        # bucket per row, so the loop runs rarely compared to the vectorized add below.
+        for row in rows[self.newest[rows] < bucket].tolist():
+            newest = int(self.newest[row])
+            if newest < 0: # first point, the row is already zeroed
+                self.filled[row] = 1
+            elif bucket - newest >= self.slots:
+                self.counts[row] = 0
+                self.filled[row] = self.slots
+            else:
+                for b in range(newest + 1, bucket + 1):
+                    self.counts[row, b % self.slots] = 0
+                self.filled[row] = min(int(self.filled[row]) + bucket - newest, self.slots)
+            self.newest[row] = bucket
+        # Late data still inside the window lands in its bucket, older data is dropped
+        in_window = self.newest[rows] - bucket < self.slots
+        np.add.at(self.counts, (rows[in_window], bucket % self.slots), counts[in_window])
+
+    def points(self, row: int) -> List[Tuple[float, int]]:
+        newest, filled = int(self.newest[row]), int(self.filled[row])
+        return [(b * self.seconds, int(self.counts[row, b % self.slots]))
+                for b in range(newest - filled + 1, newest + 1)]
+
+
+class TimeSeriesStore:
+    """Per-(campaign, group) impression time series in preallocated NumPy slabs.
+
+    Each series owns one row of every slab: a ring of the last `tick_slots` raw
+    points (timestamp, impressions), and rings of per-minute and per-hour sums that
+    every point is rolled up into as it's recorded. Rows are allocated in chunks up to
+    `max_series` and recycled when a series is dropped, so memory is bounded by
+    `max_series * bytes_per_series`.
+    """
+
+    def __init__(self,
+                 max_series: int = config.TS_MAX_SERIES,
+                 tick_slots: int = config.TS_TICK_SLOTS,
+                 minute_slots: int = config.TS_MINUTE_SLOTS,
+                 hour_slots: int = config.TS_HOUR_SLOTS,
+                 chunk: int = 1024):
+        self.max_series = max_series
+        self.tick_slots = tick_slots
+        self._chunk = chunk
+        rows = min(chunk, max_series)
+        self._tick_counts = np.zeros((rows, tick_slots), dtype=np.int64)
+        self._tick_ts = np.zeros((rows, tick_slots), dtype=np.float64)
+        self._tick_head = np.zeros(rows, dtype=np.int32) # next slot to write
+        self._tick_filled = np.zeros(rows, dtype=np.int32)
+        self._rollups = {"minute": _Rollup(rows, minute_slots, _ROLLUP_SECONDS["minute"]),
+                         "hour": _Rollup(rows, hour_slots, _ROLLUP_SECONDS["hour"])}
+        self._rows: Dict[Key, int] = {} # {(campaign id, group id): row}
+        self._free: List[int] = list(range(rows - 1, -1, -1))
+        self.dropped = 0 # points not recorded because max_series was reached
+        self._lock = Lock()
+
+    @property
+    def bytes_per_series(self) -> int:
+        return (self._tick_counts.itemsize + self._tick_ts.itemsize) * self.tick_slots \
+            + sum(r.counts.itemsize * r.slots for r in self._rollups.values())
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held by the slabs"""
+        arrays = [self._tick_counts, self._tick_ts, self._tick_head, self._tick_filled]
+        for r in self._rollups.values():
+            arrays += [r.counts, r.newest, r.filled]
+        return sum(a.nbytes for a in arrays)
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def _row(self, key: Key) -> Optional[int]:
+        row = self._rows.get(key)
+        if row is not None:
+            return row
+        if not self._free:
+            rows = len(self._tick_head)
+            if rows >= self.max_series:
+                return None
+            self._grow(min(rows + self._chunk, self.max_series))
+        row = self._free.pop()
+        self._rows[key] = row
+        return row
+
+    def _grow(self, rows: int):
+        old = len(self._tick_head)
+        extra = rows - old
+        self._tick_counts = np.vstack([self._tick_counts, np.zeros((extra, self.tick_slots), dtype=np.int64)])
+        self._tick_ts = np.vstack([self._tick_ts, np.zeros((extra, self.tick_slots), dtype=np.float64)])
+        self._tick_head = np.concatenate([self._tick_head, np.zeros(extra, dtype=np.int32)])
+        self._tick_filled = np.concatenate([self._tick_filled, np.zeros(extra, dtype=np.int32)])
+        for r in self._rollups.values():
+            r.grow(rows)
+        self._free.extend(range(rows - 1, old - 1, -1))
+
+    def record_many(self, keys: Sequence[Key], counts: Sequence[int], ts: Optional[float] = None):
+        """Record one point per series at the same timestamp
+
+        Args:
+            keys (Sequence[Key]): the (campaign id, group id) of each point, without repeats
+            counts (Sequence[int]): the impressions of each point
+            ts (float, optional): epoch seconds, defaults to now
+        """
+        ts = time.time() if ts is None else ts
+        with self._lock:
+            rows, kept = [], []
+            for i, key in enumerate(keys):
+                row = self._row(key)
+                if row is None:
+                    self.dropped += 1
+                else:
+                    rows.append(row)
+                    kept.append(i)
+            if not rows:
+                return
+            rows = np.asarray(rows, dtype=np.int64)
+            counts = np.asarray(counts, dtype=np.int64)[kept]
+
+            head = self._tick_head[rows]
+            self._tick_counts[rows, head] = counts
+            self._tick_ts[rows, head] = ts
+            self._tick_head[rows] = (head + 1) % self.tick_slots
+            self._tick_filled[rows] = np.minimum(self._tick_filled[rows] + 1, self.tick_slots)
+            for r in self._rollups.values():
+                r.add(rows, counts, ts)
+
+    def drop(self, keys: Iterable[Key]):
+        """Drop series, their rows are reused by new series"""
+        with self._lock:
+            for key in keys:
+                row = self._rows.pop(key, None)
+                if row is not None:
+                    self._clear_row(row)
+                    self._free.append(row)
+
+    def clear(self, keys: Iterable[Key]):
+        """Empty series but keep their rows"""
+        with self._lock:
+            for key in keys:
+                row = self._rows.get(key)
+                if row is not None:
+                    self._clear_row(row)
+
+    def _clear_row(self, row: int):
+        self._tick_counts[row] = 0
+        self._tick_ts[row] = 0
+        self._tick_head[row] = 0
+        self._tick_filled[row] = 0
+        for r in self._rollups.values():
+            r.clear(row)
+
+    def points(self, key: Key, resolution: str = "tick") -> List[Tuple[float, int]]:
+        """Get a series as (timestamp, impressions) points, oldest first.
+        Rollup timestamps are the start of each bucket.
+        """
+        with self._lock:
+            row = self._rows.get(key)
+            if row is None:
+                return []
+            if resolution != "tick":
+                return self._rollups[resolution].points(row)
+            filled, head = int(self._tick_filled[row]), int(self._tick_head[row])
+            slots = [(head - filled + i) % self.tick_slots for i in range(filled)]
+            return [(float(self._tick_ts[row, s]), int(self._tick_counts[row, s])) for s in slots]
@@ -0,0 +1,98 @@
+# app/api_client.py - The Streamlit app's API client: pooled keep-alive connections, cached reads, concurrent fetches
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Tuple
+
+import requests
+import streamlit as st
+from requests.adapters import HTTPAdapter
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+
+API_URL = os.environ.get("API_URL", "http://localhost:8000")
+CACHE_TTL = float(os.environ.get("UI_CACHE_TTL", "2")) # seconds a read is served from the cache, the app's own writes clear it
+POOL_SIZE = 8 # keep-alive connections, and threads fetching concurrently
+TIMEOUT = 10 # seconds
+
+Read = Tuple[str, Dict[str, Any]] # (path, query parameters)
+
+
+@st.cache_resource
+def _session() -> requests.Session:
+    """One keep-alive session shared by every rerun and browser tab, instead of a new connection per request"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+@st.cache_resource
+def _executor() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=POOL_SIZE, thread_name_prefix="api_client")
+
+@st.cache_data(ttl=CACHE_TTL, show_spinner=False)
+def _get(path: str, params: Tuple[Tuple[str, Any], ...]) -> Any:
+    response = _session().get(f"{API_URL}{path}", params=list(params), timeout=TIMEOUT)
+    response.raise_for_status()
+    return response.json()
+
+def _freeze(params: Dict[str, Any]) -> Tuple[Tuple[str, Any], ...]:
+    """Hashable query parameters for the cache key, lists become repeated parameters"""
+    items = []
+    for name, value in sorted(params.items()):
+        if value is None:
+            continue
+        values = value if isinstance(value, (list, tuple)) else [value]
+        items.extend((name, v) for v in values)
+    return tuple(items)
+
+
+def get(path: str, **params) -> Any:
+    """GET a resource, served from the cache for CACHE_TTL seconds
+
+    Raises:
+        requests.HTTPError: on an error status
+
+    Returns:
+        The decoded JSON body
+    """
+    return _get(path, _freeze(params))
+
+def get_many(reads: Dict[str, Read]) -> Dict[str, Any]:
+    """GET independent resources concurrently, each one cached as by `get`
+
+    Args:
+        reads (Dict[str, Read]): {name: (path, query parameters)}
+
+    Returns:
+        Dict[str, Any]: {name: decoded JSON body}
+    """
+    ctx = get_script_run_ctx(suppress_warning=True)
+    def fetch(read: Read) -> Any:
+        # st.cache_data looks for the script run of the page being rendered
+        add_script_run_ctx(threading.current_thread(), ctx)
+        path, params = read
+        return get(path, **params)
+
+    futures = {name: _executor().submit(fetch, read) for name, read in reads.items()}
+    return {name: future.result() for name, future in futures.items()}
+
+def post(path: str, **params) -> requests.Response:
+    """POST a mutation, then drop every cached read so the next render sees it
+
+    Returns:
+        The response, errors included
+    """
+    try:
+        return _session().post(f"{API_URL}{path}", params=_freeze(params), timeout=TIMEOUT)
+    finally:
+        invalidate()
+
+def stream(path: str, timeout: float = 60) -> requests.Response:
+    """GET a streaming response, use it as a context manager to give the connection back"""
+    return _session().get(f"{API_URL}{path}", stream=True, timeout=timeout)
+
+def invalidate():
+    """Drop every cached read, e.g. for a Refresh button"""
+    _get.clear()
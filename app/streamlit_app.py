@@ -4,12 +4,21 @@ import os
 # Add project root to Python path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+import json
 import streamlit as st
-import requests
+from app import api_client
 from shared.models import CampaignStateStrEnum
 
 
-API_URL = "http://localhost:8000"
+def search_read(q: str, kind: str, limit: int = 20) -> api_client.Read:
+    """Typeahead: ask the API for the best matches of what was typed instead of loading every entity"""
+    return "/search", {"q": q, "kind": kind, "limit": limit}
+
+def search(q: str, kind: str, limit: int = 20) -> list:
+    if not q:
+        return []
+    path, params = search_read(q, kind, limit)
+    return api_client.get(path, **params)
 
 st.title("Mocking Moloco Ad")
 st.sidebar.title("Ad Manager")
@@ -34,7 +43,7 @@ if page == 'Upload Creative':
 
        if submitted and title and type:
            query = {"title": title, "type": type}
-           response = requests.post(f"{API_URL}/creatives", params=query)
+           response = api_client.post("/creatives", **query)
            if response.ok:
                st.success(f"{response.json()['title']} uploaded (ID {response.json()['id']})")
            else:
@@ -42,19 +51,24 @@ if page == 'Upload Creative':
 
 elif page == "Create Group":
     st.header("Create Group")
+    # The picked creatives stay selectable while other searches are typed
+    picked = st.session_state.setdefault("picked_creatives", {})
+    creative_query = st.text_input("Search Creatives", placeholder="Type a creative title")
+    options = dict(picked, **{f"{c['title']} (ID {c['id']})": c['id'] for c in search(creative_query, "creative")})
+    selected = st.multiselect("Select Creatives", list(options.keys()), default=list(picked))
+    st.session_state.picked_creatives = {s: options[s] for s in selected}
+
     with st.form("creative_group_form"):
-        creatives = requests.get(f"{API_URL}/creatives").json()
-        options = {f"{c['title']} (ID {c['id']})": c['id'] for c in creatives}
         group_title = st.text_input("Group Title")
         description = st.text_input("Description")
-        selected = st.multiselect("Select Creatives", list(options.keys()))
         submitted = st.form_submit_button("Add Group")
         if submitted and group_title:
             if len(selected) > 0:
                 # Query Parameters for the API call
                 data = {"title": group_title, "description": description, "creative_ids": [options[s] for s in selected]}
-                response = requests.post(f"{API_URL}/creative-groups", params=data)
+                response = api_client.post("/creative-groups", **data)
                 if response.ok:
+                    st.session_state.picked_creatives = {}
                     st.success("Group created successfully.")
                 else:
                     st.error(response.text)
@@ -63,11 +77,13 @@ elif page == "Create Group":
 
 elif page == 'Manage Campaigns':
     st.header("Manage Campaigns")
-    groups = requests.get(f"{API_URL}/creative-groups").json()
-    group_opts = {g['id']: g for g in groups}
-    group_title_to_id = {g['title']: g['id'] for g in groups}
-
-    campaigns = requests.get(f"{API_URL}/campaigns").json()
+    # The campaigns and the group search below are independent, fetch them together
+    group_query = st.session_state.get("group_query", "")
+    reads = {"campaigns": ("/campaigns", {"expand": "groups"})}
+    if group_query:
+        reads["groups"] = search_read(group_query, "creative_group")
+    fetched = api_client.get_many(reads)
+    campaigns = fetched["campaigns"]
     campaign_opts = {c['id']: c for c in campaigns}
     campaign_title_to_id = {c['title']: c['id'] for c in campaigns}
 
@@ -77,24 +93,25 @@ elif page == 'Manage Campaigns':
     # Show the groups in the selected campaign
     st.write("Groups:")
     col1, col2 = st.columns(2)
-    for gid in campaign_opts[select_campaign_id]['groups']:
+    for g in campaign_opts[select_campaign_id]['group_details']:
         with col1:
-            st.write(f"{g['title']}" for g in groups if g.get('id') == gid)
+            st.write(g['title'])
         with col2:
-            if st.button("Remove", key=f"{select_campaign_id}_{gid}"):
-                requests.post(f"{API_URL}/campaigns/{select_campaign_id}/remove", params={"group_id": gid})
+            if st.button("Remove", key=f"{select_campaign_id}_{g['id']}"):
+                api_client.post(f"/campaigns/{select_campaign_id}/remove", group_id=g['id'])
                 st.rerun()
                 st.success(f"Removed group")
 
     # Only show the groups not in the selected campaign in the selectbox
-    filtered_group_ids = [g for g in group_opts.keys() if g not in campaign_opts[select_campaign_id]['groups']]
-    filtered_groups = {k: v for k, v in group_opts.items() if k in filtered_group_ids}
-    select_group_title = st.selectbox("Group to Attach", [g['title'] for g in filtered_groups.values()])
+    attached = set(campaign_opts[select_campaign_id]['groups'])
+    st.text_input("Search Groups to Attach", placeholder="Type a group title", key="group_query")
+    group_title_to_id = {g['title']: g['id'] for g in fetched.get("groups", []) if g['id'] not in attached}
+    select_group_title = st.selectbox("Group to Attach", list(group_title_to_id))
     if select_group_title:
         select_group_id = group_title_to_id[select_group_title]
 
-    if st.button("Attach Group"):
-        response = requests.post(f"{API_URL}/campaigns/{select_campaign_id}/attach", params={"group_id": select_group_id})
+    if st.button("Attach Group") and select_group_title:
+        response = api_client.post(f"/campaigns/{select_campaign_id}/attach", group_id=select_group_id)
         if response.ok:
             st.success(f"Group {select_group_title} attached to {select_campaign_title}")
         else:
@@ -105,31 +122,28 @@ elif page == 'Manage Campaigns':
 elif page == "Creatives":
     # List the creatives
     st.header("Current Creatives")
-    response = requests.get(f"{API_URL}/creatives")
-    for i, r in enumerate(response.json()):
+    for i, r in enumerate(api_client.get("/creatives")):
         st.write(f"{i+1}. {r['title']} ({r['filename']}) (ID {r['id']})")
 
 elif page == "Creative Groups":
     # List the Creative Groups
     st.header("Current Creative Groups")
-    groups = requests.get(f"{API_URL}/creative-groups")
-    creatives = requests.get(f"{API_URL}/creatives").json()
-    for i, group in enumerate(groups.json()):
+    groups = api_client.get("/creative-groups", expand="creatives")
+    for i, group in enumerate(groups):
         expander = st.expander(f"{i+1}. {group['title']} (ID {group['id']})")
         expander.write("Creatives:")
-        for cid in group['creative_ids']:
-            expander.write(c['title'] for c in creatives if c.get('id') == cid)
+        for c in group['creative_details']:
+            expander.write(c['title'])
 
 elif page == "Campaigns":
     # List the Campaigns, and add Launch/Pause and Reset buttons for each campaign
     st.header("Current Campaigns")
-    campaigns = requests.get(f"{API_URL}/campaigns")
-    groups = requests.get(f"{API_URL}/creative-groups").json()
-    for i, campaign in enumerate(campaigns.json()):
+    campaigns = api_client.get("/campaigns", expand="groups")
+    for i, campaign in enumerate(campaigns):
         expander = st.expander(f"{i+1}. {campaign['title']} ({campaign['state']})")
         expander.write("Groups (impressions):")
-        for gid in campaign['groups']:
-            expander.write(f"{g['title']} ({campaign['impressions'][gid]})" for g in groups if g.get('id') == gid)
+        for g in campaign['group_details']:
+            expander.write(f"{g['title']} ({campaign['impressions'][g['id']]})")
 
         col1, col2= st.columns(2)
         with col1:
@@ -137,27 +151,48 @@ elif page == "Campaigns":
                 if len(campaign['groups']) == 0:
                     st.error("No groups in the campaign")
                 elif campaign['state'] == CampaignStateStrEnum.PAUSED:
-                    requests.post(f"{API_URL}/campaigns/{campaign['id']}/launch")
+                    api_client.post(f"/campaigns/{campaign['id']}/launch")
                     st.rerun()
-                elif campaign['state'] == CampaignStateStrEnum.ACTIVE:
-                    requests.post(f"{API_URL}/campaigns/{campaign['id']}/pause")
+                elif campaign['state'] in (CampaignStateStrEnum.ACTIVE, CampaignStateStrEnum.QUEUED):
+                    api_client.post(f"/campaigns/{campaign['id']}/pause")
                     st.rerun()
         with col2:
             if st.button("Reset", key=f"reset_{campaign['id']}"):
-                requests.post(f"{API_URL}/campaigns/{campaign['id']}/reset")
-                requests.post(f"{API_URL}/campaigns/{campaign['id']}/pause")
+                api_client.post(f"/campaigns/{campaign['id']}/reset")
+                api_client.post(f"/campaigns/{campaign['id']}/pause")
                 st.rerun()
                 st.success(f"Reset {campaign['title']}")
 
     # Refresh button for monitoring latest impressions
     if st.button("Refresh", key="Refresh"):
+        api_client.invalidate()
         st.rerun()
 
+    # Follow one campaign over the stream endpoint instead of re-fetching every campaign
+    st.subheader("Live Impressions")
+    live_campaigns = {c['title']: c for c in campaigns}
+    live_title = st.selectbox("Campaign to follow", list(live_campaigns.keys()))
+    if live_title and st.toggle("Auto-update", key="auto_update"):
+        live_campaign = live_campaigns[live_title]
+        group_titles = {g['id']: g['title'] for g in live_campaign['group_details']}
+        placeholder = st.empty()
+        with api_client.stream(f"/campaigns/{live_campaign['id']}/stream") as stream:
+            for line in stream.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data: "):
+                    continue
+                frame = json.loads(line[len("data: "):])
+                with placeholder.container():
+                    st.write(f"State: {frame['state']}")
+                    for gid, impressions in frame['impressions'].items():
+                        st.write(f"{group_titles.get(gid, gid)}: {impressions} (+{frame['delta'].get(gid, 0)})")
+                # The stream keeps going, but a campaign that isn't running or about to has nothing more to show
+                if frame['state'] not in (CampaignStateStrEnum.ACTIVE, CampaignStateStrEnum.QUEUED):
+                    break
+
 elif page == "Champion Groups":
     # List the champioin creative groups
     st.header("Champion Groups")
-    groups = requests.get(f"{API_URL}/creative-groups").json()
-    champion_group_ids = requests.get(f"{API_URL}/champions").json()
-    for i, gid in enumerate(champion_group_ids):
-        st.write(f"{i+1}. {g['title']} (ID {g['id']})" for g in groups if g.get('id') == gid)
+    champion_groups = api_client.get("/champions", expand="group")
+    for i, g in enumerate(champion_groups):
+        st.write(f"{i+1}. {g['title']} (ID {g['id']})")
     
\ No newline at end of file
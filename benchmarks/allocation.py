@@ -0,0 +1,51 @@
+# benchmarks/allocation.py - Compare the impression allocation policies on simulated campaigns
+#
+# Fast-forwards the same campaigns under each policy, then reports the impressions spent,
+# the ticks until the champion is known, and how often the champion is the group with the
+# best latent click rate.
+#
+#   python benchmarks/allocation.py --campaigns 2000 --groups 4
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.allocation import UniformPolicy, ThompsonPolicy, latent_click_rate
+from api.simulator import fast_forward
+from shared.models import Campaign
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the impression allocation policies")
+    parser.add_argument("--campaigns", type=int, default=2000)
+    parser.add_argument("--groups", type=int, default=4, help="groups per campaign")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    campaigns = [Campaign(id=f"c{i}", title=f"campaign_{i}", groups=[f"c{i}_g{j}" for j in range(args.groups)])
+                 for i in range(args.campaigns)]
+    best_rate = {c.id: max(latent_click_rate(gid) for gid in c.groups) for c in campaigns}
+
+    print(f"{args.campaigns} campaigns of {args.groups} groups")
+    print(f"{'policy':<10} {'impressions':>12} {'mean ticks':>11} {'max ticks':>10} {'best found':>11} {'rate lost':>10} {'run s':>7}")
+    for policy in (UniformPolicy(), ThompsonPolicy()):
+        start = time.perf_counter()
+        run = fast_forward(campaigns, seed=args.seed, policy=policy)
+        elapsed = time.perf_counter() - start
+
+        spent = sum(sum(result.impressions.values()) for result in run.campaigns)
+        ticks = [result.completed_tick for result in run.campaigns]
+        found, lost = 0, 0.0
+        for result in run.campaigns:
+            # Ties are rare, count the first winner
+            rate = latent_click_rate(result.champion_group_ids[0])
+            found += rate == best_rate[result.campaign_id]
+            lost += (best_rate[result.campaign_id] - rate) / best_rate[result.campaign_id]
+        print(f"{policy.name:<10} {spent / len(campaigns):>12.0f} {sum(ticks) / len(ticks):>11.2f} {max(ticks):>10} "
+              f"{found / len(campaigns):>10.1%} {lost / len(campaigns):>9.2%} {elapsed:>7.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+# benchmarks/common.py - Helpers shared by the HTTP benchmarks: a local uvicorn server and latency stats
+import http.client
+import os
+import socket
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def wait_ready(port: int, timeout: float = 30):
+    """Poll the server until it answers, it has `timeout` seconds to start"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            conn.request("GET", "/campaigns?limit=1")
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("The server didn't start")
+
+@contextmanager
+def local_server(port: int, env: Optional[Dict[str, str]] = None, workers: int = 1, timeout: float = 30) -> Iterator[subprocess.Popen]:
+    """Run `uvicorn api.mock_api:app` on localhost for the duration of the block, it has `timeout` seconds to start"""
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api.mock_api:app", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning", "--no-access-log"],
+        cwd=ROOT, env=dict(os.environ, **(env or {})))
+    try:
+        wait_ready(port, timeout)
+        yield server
+    finally:
+        server.terminate()
+        server.wait()
+
+def percentile(ordered: List[float], q: float) -> float:
+    """Nearest-rank percentile of an ascending list, 0 if it's empty"""
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
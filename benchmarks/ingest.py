@@ -0,0 +1,85 @@
+# benchmarks/ingest.py - Impression ingestion throughput, from the NDJSON body to the updated campaigns
+#
+# Streams an NDJSON body of impression events through the same steps as POST /impressions:ingest:
+# parsing, aggregating each batch per group, and applying it to the campaigns and their time series.
+#
+#   python benchmarks/ingest.py --events 1000000 --campaigns 1000 --groups 4
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from typing import Dict, Tuple
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api import config
+from api.ingest import aggregate, apply_counts, ndjson_batches, orjson
+from api.store import IndexedStore
+from api.timeseries import TimeSeriesStore
+from shared.models import Campaign
+
+
+async def _chunks(body: bytes, size: int = 1 << 16):
+    for i in range(0, len(body), size):
+        yield body[i:i + size]
+
+async def ingest(body: bytes, batch_size: int, campaigns: IndexedStore, series: TimeSeriesStore) -> Tuple[Dict[str, float], int]:
+    """Ingest the body one batch at a time like the endpoint, and time each step"""
+    seconds = dict.fromkeys(("parse", "aggregate", "apply"), 0.0)
+    batches = ndjson_batches(_chunks(body), batch_size)
+    applied = 0
+    while True:
+        start = time.perf_counter()
+        events = await anext(batches, None)
+        parsed = time.perf_counter()
+        if events is None:
+            break
+        totals, _, latest = aggregate(events)
+        summed = time.perf_counter()
+        applied += apply_counts(campaigns, totals, lambda _: None, lambda _: None, series, latest)[0]
+        done = time.perf_counter()
+        seconds["parse"] += parsed - start
+        seconds["aggregate"] += summed - parsed
+        seconds["apply"] += done - summed
+    seconds["total"] = sum(seconds.values())
+    return seconds, applied
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the impression ingestion steps")
+    parser.add_argument("--events", type=int, default=1_000_000)
+    parser.add_argument("--campaigns", type=int, default=1000)
+    parser.add_argument("--groups", type=int, default=4, help="groups per campaign")
+    parser.add_argument("--batch-size", type=int, default=config.INGEST_BATCH_SIZE)
+    parser.add_argument("--form", default="object", choices=["object", "array"], help="the form of the events in the body")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    campaigns = IndexedStore("Campaign")
+    for c in range(args.campaigns):
+        campaigns[f"c{c}"] = Campaign(id=f"c{c}", title=f"campaign_{c}", groups=[f"c{c}g{g}" for g in range(args.groups)])
+    series = TimeSeriesStore(max_series=args.campaigns * args.groups)
+    lines = []
+    for i in range(args.events):
+        c = rng.randrange(args.campaigns)
+        campaign_id, group_id, ts = f"c{c}", f"c{c}g{rng.randrange(args.groups)}", i // 1000
+        event = {"campaign_id": campaign_id, "group_id": group_id, "count": 1, "ts": ts} if args.form == "object" else [campaign_id, group_id, 1, ts]
+        lines.append(json.dumps(event))
+    body = "\n".join(lines).encode()
+    del lines
+
+    seconds, applied = asyncio.run(ingest(body, args.batch_size, campaigns, series))
+
+    print(f"{args.events} {args.form} events, {args.campaigns} campaigns x {args.groups} groups, "
+          f"batches of {args.batch_size}, orjson {'installed' if orjson else 'not installed'}")
+    print(f"{'step':<10} {'s':>7} {'events/s':>10}")
+    for step, step_seconds in seconds.items():
+        print(f"{step:<10} {step_seconds:>7.2f} {args.events / step_seconds:>10,.0f}")
+    assert applied == args.events
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,332 @@
+# benchmarks/load.py - HTTP load test of the API, with per-endpoint latency and throughput
+#
+# Starts `api.mock_api:app` on a local uvicorn (or in this process with --in-process), seeds
+# it over HTTP, then runs a workload from concurrent client threads over keep-alive
+# connections. Everything runs on localhost with the standard library and uvicorn, no network
+# access needed. Results can be saved as JSON baselines and compared on a later commit:
+#
+#   python benchmarks/load.py --workload all --save-baseline
+#   python benchmarks/load.py --workload all --compare # exit code 1 on a regression
+#   python benchmarks/load.py --workload dashboard --env FAST_JSON=1 --duration 20
+#   python benchmarks/load.py --workload dashboard --seed-profile large # on top of 1M creatives, see api/seeding.py
+#
+# Workloads:
+#   dashboard   read-heavy mix of the list, expand, champion and time series endpoints
+#   onboarding  bulk creation: creatives, groups and campaigns through the batch endpoints
+#   launches    many clients launching, pausing and resetting campaigns while they simulate
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, Generator, List, Optional, Tuple
+
+from common import ROOT, free_port, local_server, percentile, wait_ready
+
+BASELINES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines")
+SEED_TIMEOUT = 600 # seconds a server has to start when it generates --seed-profile
+
+# (endpoint label, method, path, JSON body or None)
+Request = Tuple[str, str, str, Optional[object]]
+# (status, parsed JSON body or None)
+Reply = Tuple[int, Optional[object]]
+Session = Generator[Request, Reply, None]
+
+
+class Client:
+    """A keep-alive JSON client for one thread"""
+
+    def __init__(self, port: int):
+        self.port = port
+        self.conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+
+    def call(self, method: str, path: str, body: Optional[object] = None) -> Reply:
+        payload = None if body is None else json.dumps(body).encode()
+        headers = {} if payload is None else {"Content-Type": "application/json"}
+        try:
+            self.conn.request(method, path, payload, headers)
+            response = self.conn.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException):
+            self.conn.close() # reconnect on the next call
+            return 0, None
+        try:
+            return response.status, json.loads(data) if data else None
+        except ValueError:
+            return response.status, None
+
+
+### Workloads ###
+
+def _seed_groups(client: Client, prefix: str, n_groups: int, creatives_per_group: int) -> List[str]:
+    """Create groups of fresh video creatives through the batch endpoints, return the group ids"""
+    items = [{"title": f"{prefix}_creative_{i}", "type": "VIDEO"} for i in range(n_groups * creatives_per_group)]
+    _, created = client.call("POST", "/creatives:batch", items)
+    ids = [r["id"] for r in created]
+    groups = [{"title": f"{prefix}_group_{g}", "creative_ids": ids[g * creatives_per_group:(g + 1) * creatives_per_group]}
+              for g in range(n_groups)]
+    _, created = client.call("POST", "/creative-groups:batch", groups)
+    return [r["id"] for r in created]
+
+def _seed_campaigns(client: Client, prefix: str, group_ids: List[str], groups_per_campaign: int) -> List[str]:
+    campaign_ids = []
+    for c in range(len(group_ids) // groups_per_campaign):
+        query = "".join(f"&group_ids={gid}" for gid in group_ids[c * groups_per_campaign:(c + 1) * groups_per_campaign])
+        _, created = client.call("POST", f"/campaigns?title={prefix}_campaign_{c}&description={query}")
+        campaign_ids.append(created["id"])
+    return campaign_ids
+
+
+class Workload(ABC):
+    name = ""
+
+    def setup(self, client: Client, rng: random.Random):
+        """Seed the data the sessions need, before timing starts"""
+
+    @abstractmethod
+    def session(self, rng: random.Random, worker: int) -> Session:
+        """Yield requests forever, each one is sent the reply of the previous request"""
+
+
+class Dashboard(Workload):
+    """Read-heavy: what the Streamlit pages poll, while a tenth of the campaigns simulate"""
+    name = "dashboard"
+
+    def setup(self, client: Client, rng: random.Random):
+        self.group_ids = _seed_groups(client, "dash", 100, 5)
+        self.campaign_ids = _seed_campaigns(client, "dash", self.group_ids, 3)
+        self.campaign_groups = {cid: self.group_ids[3 * i:3 * i + 3] for i, cid in enumerate(self.campaign_ids)}
+        for cid in self.campaign_ids[::10]:
+            client.call("POST", f"/campaigns/{cid}/launch")
+
+    def session(self, rng: random.Random, worker: int) -> Session:
+        weighted = [("GET /campaigns", 35), ("GET /campaigns expand", 15), ("GET /creative-groups expand", 15),
+                    ("GET /creatives fields", 15), ("GET /champions", 10), ("GET /campaigns/{id}/timeseries", 10)]
+        labels, weights = zip(*weighted)
+        while True:
+            label = rng.choices(labels, weights)[0]
+            if label == "GET /campaigns":
+                yield label, "GET", "/campaigns?limit=100", None
+            elif label == "GET /campaigns expand":
+                yield label, "GET", "/campaigns?limit=50&expand=groups", None
+            elif label == "GET /creative-groups expand":
+                yield label, "GET", "/creative-groups?limit=50&expand=creatives", None
+            elif label == "GET /creatives fields":
+                yield label, "GET", "/creatives?limit=100&fields=id,title,type", None
+            elif label == "GET /champions":
+                yield label, "GET", "/champions?top=10&expand=group", None
+            else:
+                cid = rng.choice(self.campaign_ids[::10])
+                yield label, "GET", f"/campaigns/{cid}/timeseries?group_id={self.campaign_groups[cid][0]}", None
+
+
+class Onboarding(Workload):
+    """Bulk writes: each step creates 50 creatives, 5 groups of 10, and a campaign using them"""
+    name = "onboarding"
+
+    def session(self, rng: random.Random, worker: int) -> Session:
+        step = 0
+        while True:
+            prefix = f"onboard_{worker}_{step}"
+            _, created = yield ("POST /creatives:batch", "POST", "/creatives:batch",
+                                [{"title": f"{prefix}_creative_{i}", "type": rng.choice(["IMAGE", "VIDEO", "HTML"])} for i in range(50)])
+            ids = [r["id"] for r in created or []]
+            _, created = yield ("POST /creative-groups:batch", "POST", "/creative-groups:batch",
+                                [{"title": f"{prefix}_group_{g}", "creative_ids": ids[10 * g:10 * g + 10]} for g in range(5)])
+            group_ids = [r["id"] for r in created or []]
+            _, created = yield "POST /campaigns", "POST", f"/campaigns?title={prefix}_campaign&description=", None
+            if created and "id" in created:
+                yield "POST /campaigns/{id}/attach:batch", "POST", f"/campaigns/{created['id']}/attach:batch", group_ids
+            step += 1
+
+
+class Launches(Workload):
+    """Many concurrent launches, with pauses and resets, of campaigns the scheduler is advancing"""
+    name = "launches"
+
+    def setup(self, client: Client, rng: random.Random):
+        self.campaign_ids = _seed_campaigns(client, "launch", _seed_groups(client, "launch", 400, 2), 2)
+
+    def session(self, rng: random.Random, worker: int) -> Session:
+        weighted = [("launch", 60), ("pause", 15), ("reset", 15), ("simulations", 10)]
+        actions, weights = zip(*weighted)
+        while True:
+            action = rng.choices(actions, weights)[0]
+            if action == "simulations":
+                yield "GET /simulations", "GET", "/simulations", None
+            else:
+                yield f"POST /campaigns/{{id}}/{action}", "POST", f"/campaigns/{rng.choice(self.campaign_ids)}/{action}", None
+
+
+WORKLOADS = {w.name: w for w in (Dashboard, Onboarding, Launches)}
+
+### Workloads ###
+
+
+### Runner ###
+
+def run_workload(workload: Workload, port: int, concurrency: int, duration: float, warmup: float, seed: int) -> dict:
+    """Run the workload's sessions from `concurrency` threads, only timing requests after the warmup
+
+    Returns:
+        dict: {"endpoints": {label: stats}, "total": stats}, latencies in milliseconds
+    """
+    workload.setup(Client(port), random.Random(seed))
+    samples: Dict[str, List[float]] = {}
+    errors: Dict[str, int] = {}
+    lock = threading.Lock()
+    start = time.perf_counter()
+    measure_from, deadline = start + warmup, start + warmup + duration
+
+    def worker(i: int):
+        client = Client(port)
+        session = workload.session(random.Random(seed + 1 + i), i)
+        latencies: Dict[str, List[float]] = {}
+        failed: Dict[str, int] = {}
+        label, method, path, body = next(session)
+        while True:
+            sent = time.perf_counter()
+            if sent >= deadline:
+                break
+            status, reply = client.call(method, path, body)
+            if sent >= measure_from:
+                latencies.setdefault(label, []).append(time.perf_counter() - sent)
+                if not 200 <= status < 300:
+                    failed[label] = failed.get(label, 0) + 1
+            label, method, path, body = session.send((status, reply))
+        with lock:
+            for label, values in latencies.items():
+                samples.setdefault(label, []).extend(values)
+            for label, n in failed.items():
+                errors[label] = errors.get(label, 0) + n
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    def stats(latencies: List[float], n_errors: int) -> dict:
+        ordered = sorted(latencies)
+        return {"requests": len(ordered), "errors": n_errors, "rps": round(len(ordered) / duration, 1),
+                **{f"p{q}_ms": round(percentile(ordered, q / 100) * 1000, 3) for q in (50, 95, 99)}}
+
+    return {"endpoints": {label: stats(values, errors.get(label, 0)) for label, values in sorted(samples.items())},
+            "total": stats([x for values in samples.values() for x in values], sum(errors.values()))}
+
+def compare(result: dict, baseline: dict, tolerance: float) -> List[str]:
+    """List the endpoints whose p95 latency grew, or throughput dropped, by more than `tolerance`"""
+    regressions = []
+    for label, current in result["endpoints"].items():
+        before = baseline["endpoints"].get(label)
+        if before is None:
+            continue
+        if current["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{label}: p95 {before['p95_ms']:.2f} -> {current['p95_ms']:.2f} ms")
+        if current["rps"] < before["rps"] * (1 - tolerance):
+            regressions.append(f"{label}: {before['rps']:.0f} -> {current['rps']:.0f} req/s")
+    return regressions
+
+def print_result(name: str, result: dict):
+    print(f"\n{name}")
+    print(f"{'endpoint':<36} {'requests':>9} {'errors':>7} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for label, s in [*result["endpoints"].items(), ("total", result["total"])]:
+        print(f"{label:<36} {s['requests']:>9} {s['errors']:>7} {s['rps']:>8.1f} {s['p50_ms']:>8.2f} {s['p95_ms']:>8.2f} {s['p99_ms']:>8.2f}")
+
+def _metadata(args) -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ""
+    return {"commit": commit, "python": platform.python_version(), "cpus": os.cpu_count(),
+            "concurrency": args.concurrency, "duration": args.duration, "env": args.env, "seed_profile": args.seed_profile,
+            "server": "in-process" if args.in_process else "uvicorn", "timestamp": int(time.time())}
+
+class _InProcessServer:
+    """uvicorn serving the app from a thread of this process, sharing its GIL with the clients"""
+
+    def __init__(self, port: int, timeout: float = 30):
+        import uvicorn
+        self.timeout = timeout
+        sys.path.append(ROOT)
+        self.server = uvicorn.Server(uvicorn.Config("api.mock_api:app", port=port, log_level="warning", access_log=False))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        wait_ready(self.server.config.port, self.timeout)
+
+    def __exit__(self, *exc):
+        self.server.should_exit = True
+        self.thread.join()
+
+### Runner ###
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the API with per-endpoint latency and throughput")
+    parser.add_argument("--workload", default="all", choices=[*WORKLOADS, "all"])
+    parser.add_argument("--concurrency", type=int, default=8, help="client threads")
+    parser.add_argument("--duration", type=float, default=10.0, help="timed seconds per workload")
+    parser.add_argument("--warmup", type=float, default=2.0, help="untimed seconds before timing starts")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="server environment, e.g. FAST_JSON=1")
+    parser.add_argument("--seed-profile", choices=["small", "medium", "large"], help="load a generated dataset into each server first, see api/seeding.py")
+    parser.add_argument("--in-process", action="store_true", help="serve from a thread of this process instead of a uvicorn subprocess")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--save-baseline", action="store_true", help=f"write the results to {os.path.relpath(BASELINES, ROOT)}/<workload>.json")
+    parser.add_argument("--compare", action="store_true", help="compare with the saved baselines, exit code 1 on a regression")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative change before --compare reports a regression")
+    args = parser.parse_args()
+
+    env = dict(item.split("=", 1) for item in args.env)
+    timeout = 30
+    if args.seed_profile:
+        env["SEED_PROFILE"] = args.seed_profile
+        timeout = SEED_TIMEOUT
+    names = list(WORKLOADS) if args.workload == "all" else [args.workload]
+    results, regressions = {}, []
+    for name in names:
+        # A fresh server per workload, so one workload's data doesn't slow down the next
+        port = free_port()
+        if args.in_process:
+            os.environ.update(env)
+            server = _InProcessServer(port, timeout)
+        else:
+            server = local_server(port, env, timeout=timeout)
+        with server:
+            result = run_workload(WORKLOADS[name](), port, args.concurrency, args.duration, args.warmup, args.seed)
+        result = {"workload": name, "meta": _metadata(args), **result}
+        results[name] = result
+        print_result(name, result)
+
+        baseline_path = os.path.join(BASELINES, f"{name}.json")
+        if args.compare:
+            if not os.path.exists(baseline_path):
+                print(f"No baseline at {baseline_path}")
+            else:
+                with open(baseline_path) as f:
+                    found = compare(result, json.load(f), args.tolerance)
+                print("No regression against the baseline" if not found else "Regressions:\n  " + "\n  ".join(found))
+                regressions += found
+        if args.save_baseline:
+            os.makedirs(BASELINES, exist_ok=True)
+            with open(baseline_path, "w") as f:
+                json.dump(result, f, indent=2)
+                f.write("\n")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
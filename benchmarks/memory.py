@@ -0,0 +1,64 @@
+# benchmarks/memory.py - Bytes per creative and per group in each STORE_LAYOUT, and the cost of reading one
+#
+# Loads a generated dataset (see api/seeding.py) into the stores of each layout under
+# tracemalloc, drops the dataset, and counts what the stores keep: the entities and the
+# store's own indexes, ids and titles included.
+#
+#   python benchmarks/memory.py --creatives 200000
+import argparse
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.compact_store import create_stores
+from api.seeding import SeedProfile, generate
+
+
+def stored_bytes(layout: str, profile: SeedProfile, seed: int) -> int:
+    """Bytes the creatives' and groups' stores hold once loaded"""
+    gc.collect()
+    tracemalloc.start()
+    creatives, groups = create_stores(layout)
+    dataset = generate(profile, seed)
+    creatives.load(dataset.creatives)
+    groups.load(dataset.creative_groups)
+    del dataset
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return size
+
+def read_us(layout: str, profile: SeedProfile, seed: int, reads: int) -> float:
+    creatives, groups = create_stores(layout)
+    dataset = generate(profile, seed)
+    creatives.load(dataset.creatives)
+    keys = [the_creative.id for the_creative in dataset.creatives[:reads]]
+    start = time.perf_counter()
+    for key in keys:
+        creatives[key]
+    return (time.perf_counter() - start) / len(keys) * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the memory of the store layouts")
+    parser.add_argument("--creatives", type=int, default=200_000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    # Same shape as the seed profiles: 1 group per 10 creatives, each with 2 to 6 of them
+    creatives_only = SeedProfile(args.creatives, 0, 0, (2, 6), (2, 6))
+    both = SeedProfile(args.creatives, args.creatives // 10, 0, (2, 6), (2, 6))
+    print(f"{args.creatives} creatives, {both.groups} groups")
+    print(f"{'layout':<8} {'B/creative':>11} {'B/group':>9} {'total MiB':>10} {'read us':>8}")
+    for layout in ("models", "compact"):
+        creative_bytes = stored_bytes(layout, creatives_only, args.seed)
+        total = stored_bytes(layout, both, args.seed)
+        print(f"{layout:<8} {creative_bytes / args.creatives:>11.0f} {(total - creative_bytes) / both.groups:>9.0f} "
+              f"{total / 2**20:>10.1f} {read_us(layout, creatives_only, args.seed, 10_000):>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+# benchmarks/recovery.py - Time recovering the stores from an SQLite snapshot in each STORE_LAYOUT
+#
+# Writes a generated dataset (see api/seeding.py) to an SQLite snapshot, then restarts once per
+# layout in a fresh process and times what restore_state does with it: reading the snapshot,
+# decoding the rows and loading them into the stores.
+#
+#   python benchmarks/recovery.py --profile large
+import argparse
+import gc
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.compact_store import create_stores
+from api.repository import SQLiteRepository
+from api.seeding import PROFILES, generate, rss_bytes
+from api.store import IndexedStore
+from shared.models import Campaign, Creative, CreativeGroup
+
+
+def open_stores(path: str, layout: str):
+    creatives, groups = create_stores(layout)
+    campaigns = IndexedStore("Campaign")
+    repository = SQLiteRepository(path)
+    stores = {"creative": creatives, "creative_group": groups, "campaign": campaigns}
+    for kind, model, store in (("creative", Creative, creatives), ("creative_group", CreativeGroup, groups), ("campaign", Campaign, campaigns)):
+        repository.register(kind, model, store)
+    return repository, stores
+
+def write(path: str, profile: str, seed: int):
+    """Persist a generated dataset and fold it into the snapshot, as a long-running server would have"""
+    repository, stores = open_stores(path, "models")
+    dataset = generate(PROFILES[profile], seed)
+    for kind, entities in (("creative", dataset.creatives), ("creative_group", dataset.creative_groups), ("campaign", dataset.campaigns)):
+        stores[kind].load(entities)
+        repository.changed(kind, tuple(stores[kind]))
+    repository.flush()
+    repository.close()
+
+def recover(path: str, layout: str):
+    memory = rss_bytes()
+    start = time.perf_counter()
+    gc.disable() # as restore_state does
+    repository, stores = open_stores(path, layout)
+    loaded = repository.load()
+    decoded = time.perf_counter()
+    for kind, (entities, seqs) in loaded.items():
+        stores[kind].load(entities, seqs)
+    del loaded
+    done = time.perf_counter()
+    gc.enable()
+    counts = ", ".join(f"{len(store)} {kind}" for kind, store in stores.items())
+    print(f"{layout:<8} {decoded - start:>9.1f} {done - decoded:>7.1f} {done - start:>7.1f} {(rss_bytes() - memory) / 2**20:>8.0f}   {counts}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Time recovering the stores from SQLite")
+    parser.add_argument("--profile", default="medium", choices=list(PROFILES))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--layouts", default="models,compact", help="comma-separated STORE_LAYOUT values")
+    parser.add_argument("--recover", help=argparse.SUPPRESS) # internal: recover PATH in this process
+    parser.add_argument("--layout", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.recover:
+        gc.freeze() # like the server, whose modules are loaded long before
+        recover(args.recover, args.layout)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "state.db")
+        start = time.perf_counter()
+        write(path, args.profile, args.seed)
+        print(f"Wrote profile {args.profile!r} in {time.perf_counter() - start:.1f}s, {os.path.getsize(path) / 2**20:.0f} MiB")
+        print(f"{'layout':<8} {'read+dec s':>9} {'load s':>7} {'total s':>7} {'+MiB':>8}")
+        for layout in args.layouts.split(","):
+            # A fresh process per layout, so neither inherits the other's memory
+            subprocess.run([sys.executable, __file__, "--recover", path, "--layout", layout], check=True)
+
+
+if __name__ == "__main__":
+    main()
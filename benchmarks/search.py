@@ -0,0 +1,65 @@
+# benchmarks/search.py - Time search queries and incremental updates over a large title index
+#
+#   python benchmarks/search.py --titles 1000000
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.store import IndexedStore
+from api.search import SearchIndex, TextIndex
+from shared.models import Campaign
+
+WORDS = ["summer", "winter", "sale", "launch", "video", "banner", "promo", "brand", "retarget", "install",
+         "holiday", "flash", "premium", "casual", "puzzle", "racing", "shooter", "story", "music", "fitness"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the search index")
+    parser.add_argument("--titles", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    store = IndexedStore("Campaign")
+    index = TextIndex(store, "campaign")
+    search = SearchIndex([index])
+    store.load(Campaign(id=f"{i:08d}", title=f"{' '.join(rng.sample(WORDS, 3))} {i}",
+                        description=" ".join(rng.sample(WORDS, 4))) for i in range(args.titles))
+    start = time.perf_counter()
+    index.rebuild()
+    print(f"{args.titles} titles indexed in {time.perf_counter() - start:.1f}s")
+
+    queries = {
+        "exact": [store[f"{rng.randrange(args.titles):08d}"].title for _ in range(args.queries)],
+        "prefix": [f"{rng.choice(WORDS)} {rng.choice(WORDS)[:3]}" for _ in range(args.queries)],
+        "words": [f"{rng.choice(WORDS)} {rng.randrange(args.titles)}" for _ in range(args.queries)],
+        "rare word": [str(rng.randrange(args.titles)) for _ in range(args.queries)],
+        "no match": [f"zz{i}" for i in range(args.queries)],
+    }
+    print(f"{'query':<10} {'mean us':>8} {'p99 us':>8} {'hits':>6}")
+    for name, batch in queries.items():
+        timings, hits = [], 0
+        for q in batch:
+            start = time.perf_counter()
+            hits += len(search.search(q, limit=args.limit))
+            timings.append(time.perf_counter() - start)
+        timings.sort()
+        print(f"{name:<10} {sum(timings) / len(timings) * 1e6:>8.1f} {timings[int(0.99 * len(timings))] * 1e6:>8.1f} {hits / len(batch):>6.1f}")
+
+    timings = []
+    for i in range(args.queries):
+        key = f"new_{i}"
+        start = time.perf_counter()
+        store[key] = Campaign(id=key, title=f"{rng.choice(WORDS)} new {i}", description="")
+        del store[key]
+        timings.append(time.perf_counter() - start)
+    print(f"insert + remove: {sum(timings) / len(timings) * 1e6:.1f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+# benchmarks/seeding.py - Time generating and bulk loading a seed profile, and the memory it takes
+#
+# Loads the profile into the app's stores in this process, with its reverse and search
+# indexes, as `python api/mock_api.py --seed-profile large` does before serving.
+#
+#   python benchmarks/seeding.py --profile large
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.seeding import PROFILES
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time generating and loading a seed profile")
+    parser.add_argument("--profile", default="medium", choices=list(PROFILES))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--queries", type=int, default=1000, help="reads timed on the loaded stores")
+    args = parser.parse_args()
+
+    from api import mock_api
+    report = mock_api.seed_profile(args.profile, args.seed)
+    print(report)
+
+    # A few reads that touch every index, to see they stay fast at this scale
+    creative_ids = list(mock_api.creatives.keys())[::max(1, len(mock_api.creatives) // args.queries)][:args.queries]
+    reads = {
+        "creative usage": lambda i: mock_api._creative_usage(creative_ids[i]),
+        "search": lambda i: mock_api.search_index.search(f"summer sale creative {i}", kind="creative"),
+        "list page": lambda i: mock_api.creatives.page(100, i * 100),
+    }
+    print(f"{'read':<16} {'mean us':>8}")
+    for name, read in reads.items():
+        start = time.perf_counter()
+        for i in range(len(creative_ids)):
+            read(i)
+        print(f"{name:<16} {(time.perf_counter() - start) / len(creative_ids) * 1e6:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
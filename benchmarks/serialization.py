@@ -0,0 +1,47 @@
+# benchmarks/serialization.py - Compare the standard and FAST_JSON list serialization paths
+#
+#   python benchmarks/serialization.py --creatives 100000
+import argparse
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api import config, serialization
+from shared.models import CreativeTypeStrEnum, Creative
+
+
+def best_of(fn, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the list serialization paths")
+    parser.add_argument("--creatives", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    types = list(CreativeTypeStrEnum)
+    now = datetime.now()
+    items = [Creative(id=f"{i:08d}", title=f"creative_{i}", filename=f"creative_{i}.mp4",
+                      type=types[i % len(types)], updated_at=now) for i in range(args.creatives)]
+    projected = [c.model_dump(include={"id", "title", "type"}) for c in items]
+
+    print(f"{args.creatives} creatives, orjson {'installed' if serialization.orjson else 'not installed'}")
+    print(f"{'body':<12} {'standard ms':>12} {'fast ms':>10} {'speedup':>8}")
+    for name, data, model in (("models", items, Creative), ("projected", projected, None)):
+        config.FAST_JSON = False
+        standard = best_of(lambda: serialization.dumps(data, model), args.repeat)
+        config.FAST_JSON = True
+        fast = best_of(lambda: serialization.dumps(data, model), args.repeat)
+        print(f"{name:<12} {standard * 1000:>12.0f} {fast * 1000:>10.0f} {standard / fast:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
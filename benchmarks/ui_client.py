@@ -0,0 +1,84 @@
+# benchmarks/ui_client.py - Time the API reads behind each Streamlit page render
+#
+# Starts a local server, seeds it, then renders each page's reads repeatedly, as widget
+# interactions rerun the page:
+#   requests   a fresh connection per request, one request after the other (the app before app/api_client.py)
+#   pooled     app/api_client.py with its cache cleared before every render: keep-alive and concurrency only
+#   cached     app/api_client.py as the app uses it, reruns within UI_CACHE_TTL hit the cache
+#
+#   python benchmarks/ui_client.py --renders 50
+import argparse
+import logging
+import os
+import sys
+import time
+
+import requests
+
+from common import ROOT, free_port, local_server, percentile
+
+sys.path.append(ROOT)
+
+
+def seed(base: str, n: int):
+    session = requests.Session()
+    creatives = session.post(f"{base}/creatives:batch",
+                             json=[{"title": f"ui_creative_{i}", "type": "VIDEO"} for i in range(2 * n)]).json()
+    groups = session.post(f"{base}/creative-groups:batch",
+                          json=[{"title": f"ui_group_{i}", "description": "", "creative_ids": [creatives[2 * i]["id"], creatives[2 * i + 1]["id"]]}
+                                for i in range(n)]).json()
+    for i in range(n // 4):
+        session.post(f"{base}/campaigns", params={"title": f"ui_campaign_{i}", "description": "",
+                                                   "group_ids": [groups[j]["id"] for j in range(4 * i, 4 * i + 4)]})
+
+PAGES = {
+    "Manage Campaigns": {"campaigns": ("/campaigns", {"expand": "groups"}),
+                         "groups": ("/search", {"q": "ui_group_1", "kind": "creative_group", "limit": 20})},
+    "Creative Groups": {"groups": ("/creative-groups", {"expand": "creatives"})},
+    "Campaigns": {"campaigns": ("/campaigns", {"expand": "groups"})},
+    "Champion Groups": {"champions": ("/champions", {"expand": "group"})},
+}
+
+def render_requests(base: str, reads: dict):
+    for path, params in reads.values():
+        requests.get(f"{base}{path}", params=params).json()
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the API reads behind each Streamlit page render")
+    parser.add_argument("--renders", type=int, default=50, help="renders per page and mode")
+    parser.add_argument("--groups", type=int, default=400, help="groups seeded, with 2 creatives each and 4 per campaign")
+    args = parser.parse_args()
+
+    port = free_port()
+    base = f"http://127.0.0.1:{port}"
+    os.environ["API_URL"] = base
+    import streamlit # creates its loggers
+    # Outside `streamlit run` there's no script run, and Streamlit warns about it
+    for name in list(logging.root.manager.loggerDict):
+        if name.startswith("streamlit"):
+            logging.getLogger(name).disabled = True
+    from app import api_client
+
+    with local_server(port):
+        seed(base, args.groups)
+        modes = {
+            "requests": lambda reads: render_requests(base, reads),
+            "pooled": lambda reads: (api_client.invalidate(), api_client.get_many(reads)),
+            "cached": api_client.get_many,
+        }
+        print(f"{args.groups} groups, {args.renders} renders per page, UI_CACHE_TTL={api_client.CACHE_TTL:g}s")
+        print(f"{'page':<18} {'mode':<10} {'mean ms':>8} {'p50 ms':>8} {'p95 ms':>8}")
+        for page, reads in PAGES.items():
+            for mode, render in modes.items():
+                timings = []
+                for _ in range(args.renders):
+                    start = time.perf_counter()
+                    render(reads)
+                    timings.append(time.perf_counter() - start)
+                timings.sort()
+                print(f"{page:<18} {mode:<10} {sum(timings) / len(timings) * 1000:>8.2f} "
+                      f"{percentile(timings, 0.5) * 1000:>8.2f} {percentile(timings, 0.95) * 1000:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+# benchmarks/workers.py - Measure how GET /campaigns throughput scales with uvicorn workers
+#
+# Seeds a SQLite database, then for each worker count starts `uvicorn --workers N` on it and
+# hammers GET /campaigns from several client processes over keep-alive connections.
+#
+#   python benchmarks/workers.py --workers 1,2,4,8 --clients 16 --duration 10
+#
+# Clients run on the same box as the server, so give them spare cores: scaling flattens once
+# the server workers and the clients together use up every core.
+import argparse
+import http.client
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+from common import ROOT, local_server, percentile
+
+sys.path.append(ROOT)
+
+
+def seed(path: str, n_campaigns: int):
+    """Fill a fresh database with campaigns, each with one group of two creatives"""
+    os.environ["STORAGE_BACKEND"] = "sqlite"
+    os.environ["STORAGE_PATH"] = path
+    from api import mock_api
+    from shared.models import CreativeTypeStrEnum
+
+    mock_api.restore_state()
+    for i in range(n_campaigns):
+        creative_ids = [mock_api.create_creative(f"bench_creative_{i}_{j}", CreativeTypeStrEnum.VIDEO).id for j in range(2)]
+        group = mock_api.create_group(f"bench_group_{i}", "", creative_ids)
+        mock_api.create_campaign(f"bench_campaign_{i}", "", [group.id])
+    mock_api.repository.close()
+
+def client(port: int, path: str, deadline: float, results):
+    conn = http.client.HTTPConnection("127.0.0.1", port)
+    latencies = []
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        conn.request("GET", path)
+        response = conn.getresponse()
+        response.read()
+        latencies.append(time.perf_counter() - start)
+    conn.close()
+    results.put(latencies)
+
+def run(workers: int, db: str, args) -> dict:
+    env = {"STORAGE_BACKEND": "sqlite", "STORAGE_PATH": db, "SIM_TICK_INTERVAL": "1.0"}
+    with local_server(args.port, env, workers):
+        time.sleep(1) # let every worker finish its restore
+        results = multiprocessing.Queue()
+        deadline = time.perf_counter() + args.duration
+        clients = [multiprocessing.Process(target=client, args=(args.port, args.path, deadline, results))
+                   for _ in range(args.clients)]
+        for p in clients:
+            p.start()
+        latencies = sorted(x for _ in clients for x in results.get())
+        for p in clients:
+            p.join()
+
+    return {"workers": workers, "rps": len(latencies) / args.duration,
+            "p50": percentile(latencies, 0.50) * 1000, "p99": percentile(latencies, 0.99) * 1000}
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure GET /campaigns throughput per number of uvicorn workers")
+    parser.add_argument("--workers", default="1,2,4", help="comma-separated worker counts")
+    parser.add_argument("--clients", type=int, default=8, help="client processes")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per worker count")
+    parser.add_argument("--campaigns", type=int, default=1000, help="campaigns seeded")
+    parser.add_argument("--path", default="/campaigns?limit=100", help="request path")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = os.path.join(tmp, "bench.db")
+        seed(db, args.campaigns)
+        print(f"{os.cpu_count()} cores, {args.clients} clients, GET {args.path}")
+        print(f"{'workers':>8} {'req/s':>10} {'speedup':>8} {'p50 ms':>8} {'p99 ms':>8}")
+        base = None
+        for workers in (int(w) for w in args.workers.split(",")):
+            result = run(workers, db, args)
+            base = base or result["rps"]
+            print(f"{workers:>8} {result['rps']:>10.0f} {result['rps'] / base:>7.2f}x {result['p50']:>8.2f} {result['p99']:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -34,6 +34,9 @@ class CreativeTypeStrEnum(str, Enum):
     VIDEO = "VIDEO"
     HTML = "HTML" 
 
+# The Creative field holding each type's media, and the extension of the filename a new creative gets
+MEDIA = {CreativeTypeStrEnum.VIDEO: ("video", "mp4"), CreativeTypeStrEnum.IMAGE: ("image", "jpg"), CreativeTypeStrEnum.HTML: ("html", "html")}
+
 class CreativeGroupStatusStrEnum(str, Enum):
     UNKNOWN_STATUS = 'UNKNOWN_STATUS'
     DRAFT = 'DRAFT' 
@@ -66,11 +69,22 @@ class CampaignStateStrEnum(str, Enum):
     READY = 'READY'
     UPCOMING = 'UPCOMING'
     ACTIVE = 'ACTIVE'
+    QUEUED = 'QUEUED' # launched, waiting for a simulation slot, see SIM_MAX_ACTIVE_CAMPAIGNS
     PAUSED = 'PAUSED'
     SUSPENDED = 'SUSPENDED'
     VIOLATED = 'VIOLATED'
     COMPLETED = 'COMPLETED'
 
+class SearchMatchStrEnum(str, Enum):
+    # Ranked best first
+    EXACT = 'EXACT' # the title is the query
+    PREFIX = 'PREFIX' # the title starts with the query
+    TITLE = 'TITLE' # the title has every word of the query
+    DESCRIPTION = 'DESCRIPTION' # the description has every word of the query
+
+class SimulationModeStrEnum(str, Enum):
+    FAST = 'fast' # fast-forward every tick at once, offline
+
 ###### Enums ######
     
 
@@ -172,10 +186,15 @@ class Campaign(BaseModel):
     groups: List[str] = [] # group ids
 
     impressions: Dict[str, int] = {} # {group id: num of impression}
+    clicks: Dict[str, int] = {} # {group id: num of simulated clicks}
 
     def __init__(self, **data):
         super().__init__(**data)
-        self.impressions = {gid: 0 for gid in self.groups}
+        # Groups are an insertion-ordered set, `impressions` doubles as its O(1) membership index
+        self.groups = list(dict.fromkeys(self.groups))
+        # Keep the counters passed in (e.g. when restoring from storage), 0 for the other groups
+        self.impressions = {gid: self.impressions.get(gid, 0) for gid in self.groups}
+        self.clicks = {gid: self.clicks.get(gid, 0) for gid in self.groups}
 
 
     # type: CampaignTypeEnum = CampaignTypeEnum.UNKNOWN_CAMPAIGN_TYPE
@@ -198,4 +217,80 @@ class Campaign(BaseModel):
     def pause(self):
         return self.change_state(CampaignStateStrEnum.PAUSED)
 
-###### Moloco Entities ######
\ No newline at end of file
+###### Moloco Entities ######
+
+
+
+###### Request Bodies ######
+
+class CreativeCreate(BaseModel):
+    title: str = Field(..., min_length=1)
+    type: CreativeTypeStrEnum
+
+class CreativeGroupCreate(BaseModel):
+    title: str = Field(..., min_length=1)
+    description: str = ''
+    creative_ids: List[str]
+
+###### Request Bodies ######
+
+
+
+###### Responses ######
+
+class SearchHit(BaseModel):
+    kind: str # "creative", "creative_group" or "campaign"
+    id: str
+    title: str
+    match: SearchMatchStrEnum
+
+class CreativeUsage(BaseModel):
+    creative_id: str
+    group_ids: List[str] = [] # the groups containing the creative
+    campaign_ids: List[str] = [] # the campaigns running any of these groups
+    active_campaign_ids: List[str] = [] # the subset of campaign_ids that is ACTIVE or QUEUED
+
+class Champion(BaseModel):
+    group_id: str
+    campaign_id: str # the finished campaign the group won
+    impressions: int # the group's impressions when the campaign finished
+    selected_at: datetime = Field(default_factory=datetime.now)
+
+class IngestResult(BaseModel):
+    events: int = 0 # events read from the body
+    batches: int = 0
+    applied: int = 0 # impressions added to campaigns
+    rejected_events: int = 0 # malformed events
+    unknown_impressions: int = 0 # impressions for campaigns or groups that don't exist
+    completed: List[str] = [] # campaigns completed by the ingested impressions
+
+class BatchItemResult(BaseModel):
+    index: int # position of the item in the request body
+    id: Optional[str] = None # the created (or attached) entity id
+    error: Optional[str] = None
+
+###### Responses ######
+
+
+
+###### Simulation ######
+
+class Simulation(BaseModel):
+    campaign_id: str
+    started_at: datetime = Field(default_factory=datetime.now)
+    ticks: int = 0 # number of scheduler ticks that advanced this campaign
+
+class SimulatedCampaign(BaseModel):
+    campaign_id: str
+    completed_tick: Optional[int] = None # the tick all its groups reached the target, None for a campaign without groups
+    impressions: Dict[str, int] = {} # per group, when the campaign completed
+    clicks: Dict[str, int] = {} # per group, when the campaign completed
+    champion_group_ids: List[str] = [] # the groups that would be selected as champion
+    trajectory: Optional[Dict[str, List[int]]] = None # per group impressions after each tick, up to completion
+
+class SimulationRun(BaseModel):
+    seed: int # replays the same run, in fast mode or in the real-time scheduler
+    ticks: int # ticks until every campaign completed
+    campaigns: List[SimulatedCampaign] = []
+
+###### Simulation ######
\ No newline at end of file
@@ -40,4 +40,11 @@ def sample_campaign(client, sample_group):
     """Create sample campaign"""
     group_id = sample_group['id']
     response = client.post(f"/campaigns?title=creative_testing_campaign&description=&group_ids={group_id}")
-    return response.json()
\ No newline at end of file
+    return response.json()
+
+@pytest.fixture
+def uniform_policy(monkeypatch):
+    """Run the app's scheduler under the uniform allocation policy, whatever SIM_ALLOCATION_POLICY says"""
+    from api import mock_api
+    from api.allocation import UniformPolicy
+    monkeypatch.setattr(mock_api.scheduler, "policy", UniformPolicy())
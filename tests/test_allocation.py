@@ -0,0 +1,52 @@
+# tests/test_allocation.py - Test the impression allocation policies
+import pytest
+from api.allocation import ThompsonPolicy, UniformPolicy, create_policy, latent_click_rate
+from api.simulator import fast_forward
+from api import config
+from shared.models import Campaign
+
+
+@pytest.fixture
+def campaigns():
+    return [Campaign(id=f"c{i}", title=f"campaign_{i}", groups=[f"c{i}_g{j}" for j in range(4)]) for i in range(200)]
+
+def test_create_policy():
+    """Test policies are created by name"""
+    assert isinstance(create_policy("uniform"), UniformPolicy)
+    assert isinstance(create_policy("thompson"), ThompsonPolicy)
+    with pytest.raises(ValueError):
+        create_policy("greedy")
+
+def test_latent_click_rate_is_stable():
+    """Test a group always gets the same click rate, within the configured range"""
+    assert latent_click_rate("g1") == latent_click_rate("g1")
+    assert config.CLICK_RATE_MIN <= latent_click_rate("g1") < config.CLICK_RATE_MAX
+
+def test_thompson_spends_less_and_finds_better_groups(campaigns):
+    """Test Thompson sampling stops earlier than uniform and mostly picks the group with the best click rate"""
+    uniform = fast_forward(campaigns, seed=0, policy=UniformPolicy())
+    thompson = fast_forward(campaigns, seed=0, policy=ThompsonPolicy())
+
+    def spent(run):
+        return sum(sum(result.impressions.values()) for result in run.campaigns)
+    def found(run):
+        return sum(latent_click_rate(result.champion_group_ids[0]) == max(map(latent_click_rate, result.impressions))
+                   for result in run.campaigns)
+    assert spent(thompson) < 0.75 * spent(uniform)
+    assert thompson.ticks <= uniform.ticks
+    assert found(thompson) > 0.8 * len(campaigns) > found(uniform)
+    for result in thompson.campaigns:
+        assert 0 < sum(result.clicks.values()) < sum(result.impressions.values())
+
+def test_thompson_stops_at_the_uniform_budget():
+    """Test a campaign of identical groups stops once it spent the uniform policy's budget"""
+    the_campaign = Campaign(id="c", title="twins", groups=["g", "g2"], impressions={"g": 0, "g2": 0})
+    run = fast_forward([the_campaign], seed=0, policy=ThompsonPolicy(confidence=1.01))
+    assert sum(run.campaigns[0].impressions.values()) >= 2 * config.IMPRESSION_TARGET
+
+def test_thompson_explores_before_stopping():
+    """Test a single-group campaign, always the best, still gets the minimum impressions before it stops"""
+    the_campaign = Campaign(id="c", title="single", groups=["g"])
+    run = fast_forward([the_campaign], seed=0, policy=ThompsonPolicy(min_impressions=1000))
+    [result] = run.campaigns
+    assert result.impressions["g"] >= 1000 and result.champion_group_ids == ["g"]
@@ -1,4 +1,5 @@
 # tests/test_backend.py - Test FastAPI endpoints
+import json
 import pytest
 from fastapi.testclient import TestClient
 from shared.models import CreativeTypeStrEnum, CampaignStateStrEnum
@@ -78,4 +79,306 @@ def test_launch_empty_campaign(client):
     camp_id = empty_campaign['id']
     response = client.post(f"/campaigns/{camp_id}/launch")
     assert empty_campaign['state'] == CampaignStateStrEnum.PAUSED
-    assert response.status_code == 400
\ No newline at end of file
+    assert response.status_code == 400
+
+def test_get_creative_by_title(client):
+    """Test looking up a creative through the title index"""
+    created = client.post("/creatives?title=test_by_title_video&type=VIDEO").json()
+    response = client.get("/creatives/by-title/test_by_title_video")
+    assert response.status_code == 200
+    assert response.json()['id'] == created['id']
+
+    response = client.get("/creatives/by-title/no_such_creative")
+    assert response.status_code == 404
+
+    created = client.post("/creatives", params={"title": "test_by_title/with/slashes", "type": "VIDEO"}).json()
+    assert client.get("/creatives/by-title/test_by_title/with/slashes").json()['id'] == created['id']
+    assert client.get("/creatives/by-title/test_by_title%2Fwith%2Fslashes").json()['id'] == created['id']
+
+def test_create_creative_duplicate_title(client):
+    """Test duplicate creative title creation"""
+    client.post("/creatives?title=test_duplicate_video&type=VIDEO")
+    response = client.post("/creatives?title=test_duplicate_video&type=VIDEO")
+    assert response.status_code == 400
+
+def test_launch_is_idempotent(client, sample_group):
+    """Test launching twice registers one simulation, and pausing cancels it"""
+    gid = sample_group['id']
+    camp_id = client.post(f"/campaigns?title=test_launch_twice&description=&group_ids={gid}").json()['id']
+    assert client.post(f"/campaigns/{camp_id}/launch").status_code == 200
+    response = client.post(f"/campaigns/{camp_id}/launch")
+    assert response.status_code == 200
+    assert response.json()['state'] == CampaignStateStrEnum.ACTIVE
+
+    running = [s['campaign_id'] for s in client.get("/simulations").json()]
+    assert running.count(camp_id) == 1
+
+    client.post(f"/campaigns/{camp_id}/pause")
+    running = [s['campaign_id'] for s in client.get("/simulations").json()]
+    assert camp_id not in running
+
+def test_create_creatives_batch(client):
+    """Test batch creative creation commits every item"""
+    items = [{"title": f"test_batch_video_{i}", "type": "VIDEO"} for i in range(5)]
+    response = client.post("/creatives:batch", json=items)
+    assert response.status_code == 200
+    results = response.json()
+    assert [r['index'] for r in results] == list(range(5))
+    assert all(r['id'] and r['error'] is None for r in results)
+    assert client.get("/creatives/by-title/test_batch_video_4").json()['id'] == results[4]['id']
+
+def test_create_creatives_batch_is_all_or_nothing(client):
+    """Test a batch with a duplicate title inside it creates nothing"""
+    items = [{"title": "test_batch_atomic", "type": "IMAGE"},
+             {"title": "test_batch_atomic_2", "type": "IMAGE"},
+             {"title": "test_batch_atomic", "type": "IMAGE"}]
+    response = client.post("/creatives:batch", json=items)
+    assert response.status_code == 400
+    errors = [r['error'] for r in response.json()['detail']]
+    assert errors[0] is None and errors[1] is None and errors[2] is not None
+    assert client.get("/creatives/by-title/test_batch_atomic").status_code == 404
+
+    response = client.post("/creatives:batch", json=[{"title": "test_batch_unknown", "type": "UNKNOWN"}])
+    assert response.status_code == 400 and response.json()['detail'][0]['error'] is not None
+    assert client.post("/creatives?title=test_unknown&type=UNKNOWN").status_code == 400
+
+def test_create_groups_batch_and_attach_batch(client, sample_creatives):
+    """Test batch group creation and batch attach to a campaign"""
+    portrait, landscape = sample_creatives
+    items = [{"title": f"test_batch_group_{i}", "creative_ids": [portrait['id'], landscape['id']]} for i in range(3)]
+    response = client.post("/creative-groups:batch", json=items)
+    assert response.status_code == 200
+    group_ids = [r['id'] for r in response.json()]
+
+    response = client.post("/creative-groups:batch", json=[{"title": "test_batch_group_missing", "creative_ids": ["no_such_creative"]}])
+    assert response.status_code == 400
+    response = client.post("/creative-groups:batch", json=[{"title": "", "creative_ids": [portrait['id']]}])
+    assert response.status_code == 422
+
+    camp_id = client.post("/campaigns?title=test_attach_batch_campaign&description=").json()['id']
+    response = client.post(f"/campaigns/{camp_id}/attach:batch", json=group_ids + [group_ids[0]])
+    assert response.status_code == 400
+    response = client.post(f"/campaigns/{camp_id}/attach:batch", json=group_ids)
+    assert response.status_code == 200
+    campaign = [c for c in client.get("/campaigns").json() if c['id'] == camp_id][0]
+    assert campaign['groups'] == group_ids
+    assert campaign['impressions'] == {gid: 0 for gid in group_ids}
+
+def test_get_creatives_paginated(client):
+    """Test cursor pagination walks every creative exactly once"""
+    client.post("/creatives:batch", json=[{"title": f"test_page_{i}", "type": "HTML"} for i in range(7)])
+    everything = [c['id'] for c in client.get("/creatives").json()]
+
+    seen = []
+    params = {"limit": 3}
+    while True:
+        response = client.get("/creatives", params=params)
+        assert response.status_code == 200
+        seen += [c['id'] for c in response.json()]
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+        params["after"] = cursor
+    assert seen == everything
+
+def test_get_creatives_filter_and_fields(client):
+    """Test filtering by type and projecting fields"""
+    client.post("/creatives?title=test_filter_image&type=IMAGE")
+    response = client.get("/creatives", params={"type": "IMAGE", "fields": "id,title"})
+    assert response.status_code == 200
+    data = response.json()
+    assert "test_filter_image" in [c['title'] for c in data]
+    assert all(set(c) == {"id", "title"} for c in data)
+
+    assert client.get("/creatives", params={"fields": "id,no_such_field"}).status_code == 400
+    assert client.get("/creatives", params={"after": "not_a_cursor"}).status_code == 400
+
+def test_get_campaigns_filter_by_state(client):
+    """Test filtering campaigns by state"""
+    response = client.get("/campaigns", params={"state": "PAUSED"})
+    assert response.status_code == 200
+    assert all(c['state'] == CampaignStateStrEnum.PAUSED for c in response.json())
+
+def test_list_etag_not_modified(client, sample_campaign):
+    """Test a matching If-None-Match gets 304 until the collection is written"""
+    response = client.get("/campaigns")
+    etag = response.headers["ETag"]
+    assert client.get("/campaigns").content == response.content
+
+    response = client.get("/campaigns", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+
+    # A different query is a different representation
+    assert client.get("/campaigns?fields=id", headers={"If-None-Match": etag}).status_code == 200
+
+    # Any write to the campaigns invalidates the ETag
+    client.post(f"/campaigns/{sample_campaign['id']}/pause")
+    response = client.get("/campaigns", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+def test_expand_joins_referenced_entities(client, sample_creatives, sample_group, sample_campaign):
+    """Test expanded list views join titles server-side"""
+    campaigns = client.get("/campaigns?expand=groups").json()
+    campaign = [c for c in campaigns if c['id'] == sample_campaign['id']][0]
+    assert sample_group['title'] in [g['title'] for g in campaign['group_details']]
+
+    groups = client.get("/creative-groups?expand=creatives").json()
+    group = [g for g in groups if g['id'] == sample_group['id']][0]
+    assert [c['title'] for c in group['creative_details']] == [c['title'] for c in sample_creatives]
+
+    assert client.get("/campaigns?expand=nothing").status_code == 422
+    assert isinstance(client.get("/champions?expand=group").json(), list)
+
+def test_champions_leaderboard(client, sample_creatives, uniform_policy):
+    """Test champions are ranked, limited with top, and removed when their group is disabled"""
+    from api.mock_api import campaigns, _complete_campaign
+    portrait, _ = sample_creatives
+    items = [{"title": f"test_champion_group_{i}", "creative_ids": [portrait['id']]} for i in range(3)]
+    gids = [r['id'] for r in client.post("/creative-groups:batch", json=items).json()]
+    camp_id = client.post("/campaigns", params={"title": "test_champion_campaign", "description": "", "group_ids": gids}).json()['id']
+
+    campaigns.update(camp_id, lambda the_campaign: setattr(the_campaign, "impressions", {gids[0]: 10500, gids[1]: 19000, gids[2]: 19000}))
+    _complete_campaign(camp_id)
+    top_two = client.get("/champions?top=2&expand=group").json()
+    assert [c['id'] for c in top_two] == [gids[1], gids[2]]
+    assert top_two[0]['impressions'] == 19000
+
+    client.post(f"/creative-groups/{gids[1]}/disable")
+    assert gids[1] not in client.get("/champions").json()
+    assert gids[2] in client.get("/champions?top=1").json()
+
+def test_ingest_impressions(client, sample_group):
+    """Test NDJSON impression ingestion adds to the campaign counters"""
+    gid = sample_group['id']
+    camp_id = client.post(f"/campaigns?title=test_ingest_campaign&description=&group_ids={gid}").json()['id']
+    body = "\n".join(json.dumps({"campaign_id": camp_id, "group_id": gid, "count": 3, "ts": i}) for i in range(100))
+    response = client.post("/impressions:ingest", content=body, headers={"Content-Type": "application/x-ndjson"})
+    assert response.status_code == 200
+    result = response.json()
+    assert result['events'] == 100 and result['applied'] == 300
+    campaign = [c for c in client.get("/campaigns").json() if c['id'] == camp_id][0]
+    assert campaign['impressions'][gid] == 300
+
+    response = client.post("/impressions:ingest", content=b"{not json", headers={"Content-Type": "application/x-ndjson"})
+    assert response.status_code == 400
+
+def test_ingest_completes_campaigns_on_the_event_loop(client, sample_group, monkeypatch):
+    """Test a campaign completed by ingestion is paused outside the threadpool, where the metrics can't be updated"""
+    import threading
+    from api import mock_api
+    gid = sample_group['id']
+    camp_id = client.post("/campaigns", params={"title": "test_ingest_completion", "description": "", "group_ids": gid}).json()['id']
+    threads = []
+    complete = mock_api._complete_campaign
+    monkeypatch.setattr(mock_api, "_complete_campaign", lambda cid: (threads.append(threading.current_thread().name), complete(cid)))
+
+    body = json.dumps({"campaign_id": camp_id, "group_id": gid, "count": 10000, "ts": 0})
+    assert client.post("/impressions:ingest", content=body).json()['completed'] == [camp_id]
+    assert len(threads) == 1 and "worker" not in threads[0].lower()
+    assert [c for c in client.get("/campaigns").json() if c['id'] == camp_id][0]['state'] == 'PAUSED'
+
+def test_campaign_timeseries(client, sample_group):
+    """Test ingested impressions show up in the group's time series"""
+    gid = sample_group['id']
+    camp_id = client.post(f"/campaigns?title=test_timeseries_campaign&description=&group_ids={gid}").json()['id']
+    body = json.dumps({"campaign_id": camp_id, "group_id": gid, "count": 42, "ts": 120.0})
+    client.post("/impressions:ingest", content=body, headers={"Content-Type": "application/x-ndjson"})
+
+    response = client.get(f"/campaigns/{camp_id}/timeseries", params={"group_id": gid})
+    assert response.status_code == 200
+    assert response.json() == {gid: [[120.0, 42]]}
+    assert client.get(f"/campaigns/{camp_id}/timeseries", params={"resolution": "minute"}).json()[gid] == [[120, 42]]
+    assert client.get(f"/campaigns/{camp_id}/timeseries", params={"resolution": "day"}).status_code == 422
+
+def test_run_simulation_fast(client, sample_group, uniform_policy):
+    """Test a fast-forward run completes the campaigns without touching them, and replays with its seed"""
+    gid = sample_group['id']
+    camp_id = client.post(f"/campaigns?title=test_fast_simulation&description=&group_ids={gid}").json()['id']
+    response = client.post(f"/simulations:run?mode=fast&campaign_ids={camp_id}&trajectories=true")
+    assert response.status_code == 200
+    run = response.json()
+    [result] = run['campaigns']
+    assert result['completed_tick'] == run['ticks'] == len(result['trajectory'][gid])
+    assert result['impressions'][gid] >= 10000 and result['champion_group_ids'] == [gid]
+
+    again = client.post(f"/simulations:run?mode=fast&campaign_ids={camp_id}&seed={run['seed']}&trajectories=true").json()
+    assert again == run
+    campaign = [c for c in client.get("/campaigns").json() if c['id'] == camp_id][0]
+    assert campaign['impressions'][gid] == 0 and campaign['state'] != 'ACTIVE'
+
+    assert client.post("/simulations:run?mode=fast&campaign_ids=missing").status_code == 400
+    assert client.post("/simulations:run?mode=slow").status_code == 422
+
+def test_creative_usage_and_disable_cascade(client):
+    """Test the usage endpoints follow attach/remove, and disabling a creative checks ACTIVE campaigns first"""
+    cid = client.post("/creatives?title=test_usage_creative&type=VIDEO").json()['id']
+    gid = client.post(f"/creative-groups?title=test_usage_group&description=&creative_ids={cid}").json()['id']
+    camp_id = client.post(f"/campaigns?title=test_usage_campaign&description=&group_ids={gid}").json()['id']
+
+    usage = client.get(f"/creatives/{cid}/usage").json()
+    assert usage['group_ids'] == [gid] and usage['campaign_ids'] == [camp_id] and usage['active_campaign_ids'] == []
+    assert [c['id'] for c in client.get(f"/creative-groups/{gid}/campaigns").json()] == [camp_id]
+    assert client.get("/creatives/missing/usage").status_code == 404
+
+    client.post(f"/campaigns/{camp_id}/launch")
+    assert client.get(f"/creatives/{cid}/usage").json()['active_campaign_ids'] == [camp_id]
+    assert client.post(f"/creatives/{cid}/disable").status_code == 400
+    assert client.post(f"/creatives/{cid}/disable?force=true").json()['enabling_state'] == 'DISABLED'
+
+    client.post(f"/campaigns/{camp_id}/reset")
+    client.post(f"/campaigns/{camp_id}/remove?group_id={gid}")
+    assert client.get(f"/creative-groups/{gid}/campaigns").json() == []
+    assert client.get(f"/creatives/{cid}/usage").json()['campaign_ids'] == []
+
+def test_search(client):
+    """Test /search finds new entities by title prefix and words"""
+    client.post("/creatives?title=test_search_needle&type=VIDEO")
+    client.post("/campaigns?title=Needle in a haystack&description=")
+    hits = client.get("/search", params={"q": "test_search_nee"}).json()
+    assert [(hit['kind'], hit['title'], hit['match']) for hit in hits] == [("creative", "test_search_needle", "PREFIX")]
+    assert [hit['title'] for hit in client.get("/search", params={"q": "haystack", "kind": "campaign"}).json()] == ["Needle in a haystack"]
+    assert client.get("/search", params={"q": "needle", "kind": "ad_account"}).status_code == 422
+
+def test_launch_over_the_cap_is_queued(client, sample_group, monkeypatch):
+    """Test launches over SIM_MAX_ACTIVE_CAMPAIGNS are QUEUED, and start once a running campaign pauses"""
+    from api import mock_api
+    monkeypatch.setattr(mock_api.scheduler, "max_active_campaigns", len(mock_api.scheduler.simulations()) + 1)
+    gid = sample_group['id']
+    first, second = (client.post(f"/campaigns?title=test_admission_{i}&description=&group_ids={gid}").json()['id'] for i in range(2))
+    assert client.post(f"/campaigns/{first}/launch").json()['state'] == CampaignStateStrEnum.ACTIVE
+    assert client.post(f"/campaigns/{second}/launch").json()['state'] == CampaignStateStrEnum.QUEUED
+    assert client.post(f"/campaigns/{second}/launch").json()['state'] == CampaignStateStrEnum.QUEUED
+    assert client.get("/simulations/queue").json() == [second]
+
+    client.post(f"/campaigns/{first}/pause")
+    states = {c['id']: c['state'] for c in client.get("/campaigns").json()}
+    assert states[second] == CampaignStateStrEnum.ACTIVE
+    assert client.get("/simulations/queue").json() == []
+    client.post(f"/campaigns/{second}/pause")
+
+def test_queued_campaign_completed_by_ingestion_leaves_the_queue(client, sample_group, monkeypatch):
+    """Test a QUEUED campaign that ingestion completes is paused and no longer queued"""
+    from api import mock_api
+    monkeypatch.setattr(mock_api.scheduler, "max_active_campaigns", len(mock_api.scheduler.simulations()) + 1)
+    gid = sample_group['id']
+    first, second = (client.post(f"/campaigns?title=test_queued_ingest_{i}&description=&group_ids={gid}").json()['id'] for i in range(2))
+    client.post(f"/campaigns/{first}/launch")
+    assert client.post(f"/campaigns/{second}/launch").json()['state'] == CampaignStateStrEnum.QUEUED
+
+    body = json.dumps({"campaign_id": second, "group_id": gid, "count": 10000, "ts": 0})
+    assert client.post("/impressions:ingest", content=body, headers={"Content-Type": "application/x-ndjson"}).json()['completed'] == [second]
+    assert client.get("/simulations/queue").json() == []
+    states = {c['id']: c['state'] for c in client.get("/campaigns").json()}
+    assert states[second] == CampaignStateStrEnum.PAUSED
+    client.post(f"/campaigns/{first}/pause")
+
+def test_lifespan_unwatches_the_repository():
+    """Test running the app's lifespan again doesn't pile up repository listeners"""
+    from api import mock_api
+    before = len(mock_api.repository._watchers)
+    for _ in range(2):
+        with TestClient(mock_api.app):
+            assert len(mock_api.repository._watchers) == before + 1
+    assert len(mock_api.repository._watchers) == before
@@ -0,0 +1,31 @@
+# tests/test_champions.py - Test the champion leaderboard
+from api.champions import ChampionLeaderboard
+
+
+def test_top_k_ranks_by_best_impressions():
+    """Test top-k order, ties and keeping each group's best result"""
+    board = ChampionLeaderboard()
+    board.record('g1', 'c1', 12000)
+    board.record('g2', 'c1', 15000)
+    board.record('g3', 'c2', 12000) # ties with g1, recorded later
+    board.record('g4', 'c3', 11000)
+    assert not board.record('g2', 'c4', 14000) # worse than g2's best
+    assert board.record('g4', 'c5', 16000)
+
+    assert [c.group_id for c in board.top(3)] == ['g4', 'g2', 'g1']
+    assert [c.group_id for c in board.top()] == ['g4', 'g2', 'g1', 'g3']
+    assert board.top(1)[0].campaign_id == 'c5'
+    assert len(board) == 4
+
+def test_remove_drops_group():
+    """Test removed groups disappear from every top-k query"""
+    board = ChampionLeaderboard()
+    for i in range(50):
+        board.record(f"g{i}", 'c', 10000 + i)
+    for i in range(0, 50, 2):
+        assert board.remove(f"g{i}")
+    assert not board.remove('g0')
+
+    assert [c.group_id for c in board.top(3)] == ['g49', 'g47', 'g45']
+    assert [c.group_id for c in board.top(100)] == [f"g{i}" for i in range(49, 0, -2)]
+    assert 'g48' not in board and 'g47' in board
@@ -0,0 +1,95 @@
+# tests/test_compact_store.py - Test the column store of creatives and groups
+import sys
+import threading
+from datetime import datetime, timezone
+
+from api.compact_store import create_stores
+from shared.models import Creative, CreativeGroup, CreativeGroupStatusStrEnum, CreativeTypeStrEnum, EnablingStateEnum
+
+
+def test_round_trip():
+    """Test every kind of creative and group reads back equal, including ones kept as models"""
+    creatives, groups = create_stores("compact")
+    entities = [
+        Creative(id='v', title='video', type=CreativeTypeStrEnum.VIDEO, filename='video.mp4',
+                 video={'filename': 'video.mp4', 'auto_endcard': False}),
+        Creative(id='i', title='image', type=CreativeTypeStrEnum.IMAGE, filename='banner.jpg', image={'filename': 'banner.jpg'},
+                 enabling_state=EnablingStateEnum.DISABLED),
+        Creative(id='h', title='html', type=CreativeTypeStrEnum.HTML, filename='html.html', html={'filename': 'html.html'}),
+        Creative(id='u', title='no media', type=CreativeTypeStrEnum.UNKNOWN, filename='x'),
+        Creative(id='z', title='aware', type=CreativeTypeStrEnum.HTML, filename='aware.html', html={'filename': 'aware.html'},
+                 updated_at=datetime.now(timezone.utc)),
+    ]
+    for entity in entities:
+        creatives[entity.id] = entity
+    group = CreativeGroup(id='g', title='group', description='d', creative_ids=['v', 'h', 'unknown'],
+                          status=CreativeGroupStatusStrEnum.APPROVED, impressions=42)
+    groups['g'] = group
+
+    assert [creatives[e.id] for e in entities] == entities
+    assert groups['g'] == group
+    assert len(creatives) == 5 and list(creatives) == ['v', 'i', 'h', 'u', 'z']
+    assert 'unknown' not in creatives # interned by the group, not stored
+    assert creatives.fields('title', 'description', default='')[:2] == [('v', 'video', ''), ('i', 'image', '')]
+    assert creatives.fields('filename')[1] == ('i', 'banner.jpg')
+
+def test_store_writes():
+    """Test removal, re-insertion, copy-on-write updates and compare-and-swap by value"""
+    creatives, _ = create_stores("compact")
+    creatives['1'] = Creative(id='1', title='a', type=CreativeTypeStrEnum.IMAGE, filename='a.jpg', image={'filename': 'a.jpg'})
+    read = creatives['1']
+    creatives.update('1', lambda c: setattr(c, 'enabling_state', EnablingStateEnum.DISABLED))
+    assert creatives['1'].enabling_state == EnablingStateEnum.DISABLED
+    assert creatives.swap([(read, read.model_copy(update={'filename': 'b.jpg'}))]) == [] # read before the update
+
+    del creatives['1']
+    assert '1' not in creatives and creatives.get('1') is None and not creatives.has_title('a')
+    creatives['1'] = read
+    assert creatives.get_by_title('a') == read and len(creatives) == 1
+
+def test_reads_never_see_half_written_entities():
+    """Test concurrent readers see each version whole while a writer flips it"""
+    _, groups = create_stores("compact")
+    versions = [CreativeGroup(id='g', title='g', description=str(i) * 50, creative_ids=[str(i)] * 3) for i in range(2)]
+    groups['g'] = versions[0]
+    stop, torn = threading.Event(), []
+
+    def read():
+        while not stop.is_set():
+            group = groups['g']
+            if group.creative_ids != [group.description[0]] * 3:
+                torn.append(group)
+
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6) # switch threads as often as possible, in the middle of writes
+    readers = [threading.Thread(target=read) for _ in range(2)]
+    try:
+        for reader in readers:
+            reader.start()
+        for i in range(30000):
+            groups['g'] = versions[i % 2]
+    finally:
+        stop.set()
+        for reader in readers:
+            reader.join()
+        sys.setswitchinterval(interval)
+    assert not torn
+
+def test_decode_persisted_json():
+    """Test entities recovered from their JSON read back equal, whether they went into the columns or stayed models"""
+    creatives, groups = create_stores("compact")
+    entities = [
+        Creative(id='v', title='video', type=CreativeTypeStrEnum.VIDEO, filename='clip.mp4',
+                 video={'filename': 'clip.mp4', 'auto_endcard': True}),
+        Creative(id='u', title='no media', type=CreativeTypeStrEnum.UNKNOWN, filename='x'),
+        Creative(id='z', title='aware', type=CreativeTypeStrEnum.HTML, filename='aware.html', html={'filename': 'aware.html'},
+                 updated_at=datetime.now(timezone.utc)),
+    ]
+    group = CreativeGroup(id='g', title='group', description='d', creative_ids=['v', 'u'], impressions=7)
+
+    decoded = creatives.decode_json([entity.model_dump_json().encode() for entity in entities])
+    assert [isinstance(entity, Creative) for entity in decoded] == [False, True, True] # only the ones the columns can't hold are validated
+    creatives.load(decoded, [3, 4, 5])
+    groups.load(groups.decode_json([group.model_dump_json().encode()]))
+    assert [creatives[e.id] for e in entities] == entities and creatives.get_id_by_title('video') == 'v'
+    assert groups['g'] == group
@@ -0,0 +1,167 @@
+# tests/test_concurrency.py - Stress the campaign endpoints against a running simulation
+import sys
+import threading
+import time
+from fastapi import HTTPException
+from api import mock_api
+from shared.models import CreativeCreate, CreativeTypeStrEnum, CampaignStateStrEnum, CurrencyStrEnum
+
+
+def test_attach_remove_reset_during_simulation():
+    """Test concurrent attach/remove/reset/launch and scheduler ticks lose no update and raise no KeyError"""
+    creative = mock_api.create_creative(title='stress_creative', type=CreativeTypeStrEnum.VIDEO)
+    groups = [mock_api.create_group(title=f'stress_group_{i}', description='', creative_ids=[creative.id]).id for i in range(17)]
+    base, owned = groups[0], [groups[1 + 4 * t: 5 + 4 * t] for t in range(4)] # 4 threads, 4 groups each
+    campaign_id = mock_api.create_campaign(title='stress_campaign', description='', group_ids=[base]).id
+
+    stop = threading.Event()
+    errors = []
+    def run(step):
+        def loop():
+            try:
+                while not stop.is_set():
+                    step()
+            except Exception as e:
+                errors.append(e)
+                stop.set()
+        return threading.Thread(target=loop)
+
+    def attach_remove(mine):
+        def step():
+            for gid in mine:
+                mock_api.attach_group_to_campaign(campaign_id, gid)
+            for gid in mine[1:]: # keep the first one attached between steps
+                mock_api.remove_group_from_campaign(campaign_id, gid)
+            mock_api.remove_group_from_campaign(campaign_id, mine[0])
+        return step
+
+    def launch_reset():
+        mock_api.launch_campaign(campaign_id)
+        time.sleep(0.001)
+        after_reset = mock_api.reset_campaign(campaign_id)
+        current = mock_api.campaigns[campaign_id]
+        # Only this thread launches, so no tick may bring the reset campaign back to life
+        assert current.state == CampaignStateStrEnum.PAUSED
+        assert set(after_reset.impressions.values()) == {0}
+        assert set(current.impressions.values()) == {0}
+
+    def tick():
+        mock_api.scheduler.tick()
+
+    def read():
+        for the_campaign in mock_api.campaigns.page()[0]:
+            assert list(the_campaign.impressions) == the_campaign.groups
+
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-5) # switch threads often to hit more interleavings
+    threads = [run(attach_remove(mine)) for mine in owned] + [run(launch_reset), run(tick), run(read)]
+    try:
+        for t in threads:
+            t.start()
+        time.sleep(1.5)
+    finally:
+        stop.set()
+        for t in threads:
+            t.join()
+        sys.setswitchinterval(switch_interval)
+    assert errors == []
+
+    # Every attach and remove landed: each thread's groups were all removed last
+    the_campaign = mock_api.campaigns[campaign_id]
+    assert the_campaign.groups == [base]
+    assert list(the_campaign.impressions) == [base]
+
+def test_batch_create_races_single_create():
+    """Test a batch racing single creates for the same titles is all-or-nothing, and only fails with a 400"""
+    errors, outcomes = [], []
+    def single():
+        for i in range(200):
+            try:
+                mock_api.create_creative(title=f'race_creative_{i}', type=CreativeTypeStrEnum.IMAGE)
+            except HTTPException as e:
+                assert e.status_code == 400
+            except Exception as e:
+                errors.append(e)
+    def batch():
+        for i in range(200):
+            items = [CreativeCreate(title=f'race_creative_{i}_b', type=CreativeTypeStrEnum.VIDEO),
+                     CreativeCreate(title=f'race_creative_{i}', type=CreativeTypeStrEnum.VIDEO)]
+            try:
+                mock_api.create_creatives_batch(items)
+                outcomes.append((i, True))
+            except HTTPException as e:
+                assert e.status_code == 400
+                outcomes.append((i, False))
+            except Exception as e:
+                errors.append(e)
+
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    threads = [threading.Thread(target=single), threading.Thread(target=batch)]
+    try:
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    finally:
+        sys.setswitchinterval(switch_interval)
+    assert errors == []
+    for i, committed in outcomes:
+        # The batch's first creative exists only if the whole batch was committed
+        assert mock_api.creatives.has_title(f'race_creative_{i}_b') == committed
+        assert mock_api.creatives.has_title(f'race_creative_{i}')
+
+def test_concurrent_campaign_creates_with_one_title():
+    """Test concurrent creates of a campaign title store exactly one, and the others get a 400"""
+    created, errors = [], []
+    barrier = threading.Barrier(4)
+    def create():
+        for n in range(100):
+            barrier.wait() # every thread creates the same title at once
+            try:
+                created.append(mock_api.create_campaign(title=f'race_campaign_{n}', description='', group_ids=[]).title)
+            except HTTPException as e:
+                assert e.status_code == 400
+            except Exception as e:
+                errors.append(e)
+
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    threads = [threading.Thread(target=create) for _ in range(barrier.parties)]
+    try:
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    finally:
+        sys.setswitchinterval(switch_interval)
+    assert errors == []
+    assert sorted(created) == sorted(f'race_campaign_{n}' for n in range(100))
+
+def test_concurrent_ad_account_creates_with_one_title():
+    """Test concurrent creates of an Ad account title store exactly one, and the others get a 409"""
+    created, statuses, errors = [], set(), []
+    barrier = threading.Barrier(4)
+    def create():
+        for n in range(100):
+            barrier.wait() # every thread creates the same title at once
+            try:
+                created.append(mock_api.create_ad_account(title=f'race_ad_account_{n}', description='', timezone='UTC',
+                                                          currency=CurrencyStrEnum.USD).title)
+            except HTTPException as e:
+                statuses.add(e.status_code)
+            except Exception as e:
+                errors.append(e)
+
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    threads = [threading.Thread(target=create) for _ in range(barrier.parties)]
+    try:
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    finally:
+        sys.setswitchinterval(switch_interval)
+    assert errors == [] and statuses == {409}
+    assert sorted(created) == sorted(f'race_ad_account_{n}' for n in range(100))
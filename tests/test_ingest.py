@@ -0,0 +1,106 @@
+# tests/test_ingest.py - Test impression event parsing and aggregation
+import asyncio
+import json
+import struct
+import pytest
+from api.ingest import IngestError, ndjson_batches, framed_batches, aggregate, apply_counts
+from api.store import IndexedStore
+from shared.models import Campaign
+
+
+async def _chunks(body: bytes, size: int):
+    for i in range(0, len(body), size):
+        yield body[i:i + size]
+
+async def _collect(batches):
+    return [batch async for batch in batches]
+
+def test_ndjson_batches_across_chunk_boundaries():
+    """Test lines split over chunks are reassembled and batched"""
+    events = [{"campaign_id": "c", "group_id": f"g{i % 3}", "count": 1, "ts": i} for i in range(10)]
+    body = b"\n".join(json.dumps(e).encode() for e in events) + b"\n\n"
+    batches = asyncio.run(_collect(ndjson_batches(_chunks(body, 7), batch_size=4)))
+    assert [len(b) for b in batches] == [4, 4, 2]
+    assert [e for b in batches for e in b] == events
+
+    with pytest.raises(IngestError):
+        asyncio.run(_collect(ndjson_batches(_chunks(b'{"campaign_id": \n', 5))))
+
+def test_framed_batches():
+    """Test length-prefixed frames are parsed, and a truncated frame is rejected"""
+    frames = [[["c", "g1", 5, 0], ["c", "g2", 1, 0]], [["c", "g1", 2, 1]]]
+    body = b"".join(struct.pack(">I", len(p)) + p for p in (json.dumps(f).encode() for f in frames))
+    batches = asyncio.run(_collect(framed_batches(_chunks(body, 3), batch_size=1)))
+    assert batches == frames
+
+    with pytest.raises(IngestError):
+        asyncio.run(_collect(framed_batches(_chunks(body[:-1], 3))))
+
+def test_aggregate_and_apply_completes_once():
+    """Test counts are summed per group, and completion runs once when the batch crosses the target"""
+    store = IndexedStore("Campaign")
+    store['c'] = Campaign(id='c', title='ingest_campaign', groups=['g1', 'g2'])
+    totals, rejected, latest = aggregate([["c", "g1", 6000, 5], {"campaign_id": "c", "group_id": "g1", "count": 4000, "ts": 9},
+                                          ["c", "g2", 10000, 0], ["c", "g3", 7, 0], ["c", "g2", -1, 0], ["broken"]])
+    assert rejected == 2
+    assert latest == 9
+
+    completed, changed = [], []
+    applied, unknown, done = apply_counts(store, totals, completed.append, changed.append)
+    assert (applied, unknown, done) == (20000, 7, ['c'])
+    assert store['c'].impressions == {'g1': 10000, 'g2': 10000}
+    assert completed == ['c'] and len(changed) == 1
+
+    # Already complete: more impressions don't complete it again
+    apply_counts(store, {('c', 'g1'): 5}, completed.append, changed.append)
+    assert completed == ['c']
+
+def test_apply_counts_to_campaign_detached_meanwhile():
+    """Test impressions for a campaign whose groups were all detached after the pre-check count as unknown"""
+    class StaleStore(IndexedStore):
+        def get(self, key, default=None): # the version read before the groups were detached
+            return Campaign(id='c', title='campaign', groups=['g1'])
+    store = StaleStore("Campaign")
+    store['c'] = Campaign(id='c', title='campaign', groups=[])
+    completed, changed = [], []
+    assert apply_counts(store, {('c', 'g1'): 5}, completed.append, changed.append) == (0, 5, [])
+    assert completed == [] and changed == []
+
+def test_aggregate_rejects_a_non_numeric_timestamp():
+    """Test an event whose ts isn't a number is rejected, even after one that is"""
+    totals, rejected, latest = aggregate([["c", "g1", 1, 5], {"campaign_id": "c", "group_id": "g1", "count": 1, "ts": "oops"},
+                                          ["c", "g1", 1, True]])
+    assert (dict(totals), rejected, latest) == ({('c', 'g1'): 1}, 2, 5)
+
+def test_aggregate_rejects_non_string_ids():
+    """Test an event whose campaign or group id isn't a string is rejected instead of used as a key"""
+    totals, rejected, _ = aggregate([{"campaign_id": ["a"], "group_id": "g1", "count": 1}, ["c", {"g": 1}, 1], ["c", "g1", 2], ["c", 7, 1]])
+    assert (dict(totals), rejected) == ({('c', 'g1'): 2}, 3)
+
+def test_series_failure_applies_nothing():
+    """Test counts over MAX_EVENT_COUNT are rejected, and a batch whose points can't be recorded leaves the campaigns untouched"""
+    from api.ingest import MAX_EVENT_COUNT
+    _, rejected, _ = aggregate([["c", "g1", MAX_EVENT_COUNT, 0], ["c", "g1", MAX_EVENT_COUNT + 1, 0], ["c", "g1", 2**40, 0]])
+    assert rejected == 2
+
+    class BrokenSeries:
+        def record_many(self, keys, counts, ts=None):
+            raise OverflowError
+    store = IndexedStore("Campaign")
+    store['c'] = Campaign(id='c', title='campaign', groups=['g1'])
+    with pytest.raises(OverflowError):
+        apply_counts(store, {('c', 'g1'): 5}, lambda _: None, lambda _: None, BrokenSeries())
+    assert store['c'].impressions == {'g1': 0}
+
+def test_non_finite_numbers_are_malformed_without_orjson(monkeypatch):
+    """Test the json fallback rejects NaN, Infinity and overflowing numbers like orjson, and aggregate rejects such timestamps"""
+    import api.ingest
+    monkeypatch.setattr(api.ingest, "_loads", api.ingest._json_loads)
+    for ts in (b"Infinity", b"NaN", b"1e400"):
+        body = b'{"campaign_id": "c", "group_id": "g1", "count": 1, "ts": 5}\n{"campaign_id": "c", "group_id": "g1", "count": 1, "ts": ' + ts + b'}'
+        with pytest.raises(IngestError):
+            asyncio.run(_collect(ndjson_batches(_chunks(body, 16))))
+    assert asyncio.run(_collect(ndjson_batches(_chunks(b'["c", "g1", 1, 2.5]', 4)))) == [[["c", "g1", 1, 2.5]]]
+
+    _, rejected, latest = aggregate([["c", "g1", 1, 5], ["c", "g1", 1, float("inf")], ["c", "g1", 1, float("nan")], ["c", "g1", 1, 10**400]])
+    assert (rejected, latest) == (3, 5)
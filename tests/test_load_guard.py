@@ -0,0 +1,53 @@
+# tests/test_load_guard.py - Test the load guard backing the simulations off
+import os
+import subprocess
+import sys
+import textwrap
+from api.load_guard import LoadGuard
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_share_halves_under_load_and_recovers():
+    """Test the share is halved down to its floor while overloaded, then grows back additively"""
+    guard = LoadGuard(max_lag=0.1, max_p99=0, window=10, min_share=1 / 8, recovery=1 / 4)
+    assert [guard.update(lag=0.5, now=0) for _ in range(4)] == [0.5, 0.25, 0.125, 0.125]
+    assert guard.limit(100) == 13 and guard.limit(0) == 1
+    assert [guard.update(lag=0.01, now=0) for _ in range(4)] == [0.375, 0.625, 0.875, 1.0]
+
+def test_p99_over_the_window():
+    """Test the p99 only counts the responses of the last window seconds"""
+    guard = LoadGuard(max_lag=0, max_p99=0.25, window=10)
+    for i in range(100):
+        guard.observe(0.01 if i else 2.0, now=i / 10) # one slow response at t=0
+    assert guard.p99(now=10) == 2.0
+    assert guard.overloaded(lag=5.0, now=10) # the lag is ignored, the p99 isn't
+    assert guard.p99(now=10.05) == 0.01
+    assert not guard.overloaded(lag=5.0, now=10.05)
+    assert guard.p99(now=100) == 0.0
+
+def test_guard_sees_responses_without_metrics():
+    """Test the API's response times reach the guard with METRICS_ENABLED off, and shrink the scheduler's batch"""
+    # In a new process: the middleware stack is built from the config when mock_api is imported
+    script = textwrap.dedent("""
+        from fastapi.testclient import TestClient
+        from api import mock_api
+        client = TestClient(mock_api.app)
+        creative = client.post("/creatives?title=guard_creative&type=IMAGE").json()['id']
+        group = client.post(f"/creative-groups?title=guard_group&description=&creative_ids={creative}").json()['id']
+        ids = [client.post(f"/campaigns?title=guard_campaign_{i}&description=&group_ids={group}").json()['id'] for i in range(4)]
+        for cid in ids:
+            client.post(f"/campaigns/{cid}/launch")
+        assert [m.cls.__name__ for m in mock_api.app.user_middleware] == ["ResponseTimer"]
+        assert mock_api.load_guard.p99() > mock_api.load_guard.max_p99
+        assert mock_api.load_guard.update(lag=0.0) == 0.5
+        mock_api.scheduler.tick()
+        advanced = [cid for cid in ids if mock_api.campaigns[cid].impressions[group] > 0]
+        assert len(advanced) == 2, advanced
+    """)
+    # Not inherited, the caller's scheduler settings (e.g. SIM_MAX_ACTIVE_CAMPAIGNS) would change what's advanced
+    env = {"PATH": os.environ.get("PATH", ""), "METRICS_ENABLED": "0", "SIM_GUARD_MAX_P99": "1e-9", "SIM_GUARD_MAX_LAG": "0",
+           "SIM_MAX_ACTIVE_CAMPAIGNS": "0", "SIM_MAX_CAMPAIGNS_PER_TICK": "0", "SIM_ALLOCATION_POLICY": "uniform",
+           "STORAGE_BACKEND": "memory", "STORE_LAYOUT": "models"}
+    result = subprocess.run([sys.executable, "-c", script], cwd=ROOT, env=env, capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
@@ -0,0 +1,50 @@
+# tests/test_metrics.py - Test the metric families and the /metrics endpoint
+from fastapi.testclient import TestClient
+from starlette.middleware import Middleware
+from api import mock_api
+from api.metrics import Counter, Gauge, Histogram, MetricsRegistry, MetricsMiddleware
+from shared.models import CreativeTypeStrEnum
+
+
+def test_render_text_format():
+    """Test counters, gauges and cumulative histogram buckets render in the Prometheus text format"""
+    registry = MetricsRegistry()
+    counter = registry.register(Counter("jobs_total", "Jobs", ("kind",)))
+    registry.register(Gauge("queue_size", "Queued jobs", collect=lambda: {(): 3}))
+    histogram = registry.register(Histogram("job_seconds", "Job time", buckets=(0.1, 1.0)))
+    counter.inc("a")
+    counter.inc("a", amount=2)
+    for value in (0.05, 0.5, 0.5, 2.0):
+        histogram.observe(value)
+
+    lines = registry.render().splitlines()
+    assert "# TYPE jobs_total counter" in lines
+    assert 'jobs_total{kind="a"} 3' in lines
+    assert "queue_size 3" in lines
+    assert 'job_seconds_bucket{le="0.1"} 1' in lines
+    assert 'job_seconds_bucket{le="1"} 3' in lines
+    assert 'job_seconds_bucket{le="+Inf"} 4' in lines
+    assert "job_seconds_count 4" in lines
+    assert "job_seconds_sum 3.05" in lines
+
+
+def test_metrics_endpoint_labels_route_templates(monkeypatch):
+    """Test requests are counted under the matched route template rather than the raw path"""
+    # The middleware is added on import unless METRICS_ENABLED=0, rebuild the stack with it either way
+    others = [m for m in mock_api.app.user_middleware if m.cls is not MetricsMiddleware]
+    monkeypatch.setattr(mock_api.app, "user_middleware", [Middleware(MetricsMiddleware, metrics=mock_api.http_metrics)] + others)
+    monkeypatch.setattr(mock_api.app, "middleware_stack", None)
+    creative = mock_api.create_creative(title='metrics_creative', type=CreativeTypeStrEnum.VIDEO)
+    group = mock_api.create_group(title='metrics_group', description='', creative_ids=[creative.id])
+    campaign = mock_api.create_campaign(title='metrics_campaign', description='', group_ids=[group.id])
+
+    client = TestClient(mock_api.app)
+    assert client.get(f"/campaigns/{campaign.id}/timeseries").status_code == 200
+    assert client.get("/campaigns/missing/timeseries").status_code == 400
+    body = client.get("/metrics").text
+
+    assert 'http_requests_total{method="GET",route="/campaigns/{campaign_id}/timeseries",status="200"}' in body
+    assert 'http_requests_total{method="GET",route="/campaigns/{campaign_id}/timeseries",status="400"}' in body
+    assert campaign.id not in body
+    assert 'store_entities{store="campaigns"}' in body
+    assert "http_requests_in_flight 1" in body # the /metrics request itself
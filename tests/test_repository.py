@@ -0,0 +1,126 @@
+# tests/test_repository.py - Test persisting the stores to SQLite
+from api.repository import SQLiteRepository
+from api.store import IndexedStore
+from api.champions import ChampionLeaderboard
+from shared.models import CreativeTypeStrEnum, CampaignStateStrEnum, Creative, Campaign, Champion
+
+
+def _open(path, **kwargs):
+    creatives, campaigns, champions = IndexedStore("Creative"), IndexedStore("Campaign"), ChampionLeaderboard()
+    repository = SQLiteRepository(str(path), **kwargs)
+    repository.register("creative", Creative, creatives)
+    repository.register("campaign", Campaign, campaigns)
+    repository.register("champion", Champion, champions)
+    loaded = repository.load()
+    for kind, store in (("creative", creatives), ("campaign", campaigns)):
+        if kind in loaded:
+            store.load(*loaded[kind])
+    if "champion" in loaded:
+        champions.load(*loaded["champion"])
+    return repository, creatives, campaigns, champions
+
+def test_recover_from_log_and_snapshot(tmp_path):
+    """Test writes survive a restart, before and after being folded into the snapshot"""
+    path = tmp_path / "state.db"
+    repository, creatives, campaigns, champions = _open(path, checkpoint_rows=1_000_000)
+    for i in range(5):
+        creatives[f"c{i}"] = Creative(id=f"c{i}", title=f"t{i}", filename=f"t{i}.jpg", type=CreativeTypeStrEnum.IMAGE)
+    campaigns['k'] = Campaign(id='k', title='persisted_campaign', groups=['g1', 'g2'])
+    campaigns['k'].impressions['g1'] = 1234
+    campaigns.touch('k')
+    champions.record('g1', 'k', 12000)
+    repository.flush()
+
+    del creatives['c1']
+    creatives['c0'] = Creative(id='c0', title='renamed', filename='renamed.jpg', type=CreativeTypeStrEnum.IMAGE)
+    repository.flush() # only in the log, the process "crashes" without closing
+
+    _, creatives, campaigns, champions = _open(path)
+    assert list(creatives) == ['c0', 'c2', 'c3', 'c4']
+    assert creatives.get_id_by_title('renamed') == 'c0'
+    assert campaigns['k'].impressions == {'g1': 1234, 'g2': 0}
+    assert champions.top(1)[0].impressions == 12000
+
+def test_checkpoint_keeps_insertion_order(tmp_path):
+    """Test the snapshot keeps the insertion order, so pagination cursors survive restarts"""
+    path = tmp_path / "state.db"
+    repository, creatives, _, _ = _open(path, checkpoint_rows=2)
+    for i in range(6):
+        creatives[f"c{i}"] = Creative(id=f"c{i}", title=f"t{i}", filename=f"t{i}.jpg", type=CreativeTypeStrEnum.IMAGE)
+    _, cursor = creatives.page(limit=3)
+    repository.flush()
+    creatives.touch('c1') # rewrite an early entity after the checkpoint
+    repository.close()
+
+    _, creatives, _, _ = _open(path)
+    rest, _ = creatives.page(after=cursor)
+    assert [c.id for c in rest] == ['c3', 'c4', 'c5']
+
+def test_reopen_after_close(tmp_path):
+    """Test a closed repository opens again and keeps persisting, and closing twice does nothing"""
+    path = tmp_path / "state.db"
+    repository, creatives, _, _ = _open(path)
+    creatives['c0'] = Creative(id='c0', title='t0', filename='t0.jpg', type=CreativeTypeStrEnum.IMAGE)
+    repository.close()
+    repository.close()
+
+    repository.elect(lambda leading: None)
+    repository.start()
+    assert repository.leading
+    creatives['c1'] = Creative(id='c1', title='t1', filename='t1.jpg', type=CreativeTypeStrEnum.IMAGE)
+    repository.close()
+
+    _, creatives, _, _ = _open(path)
+    assert list(creatives) == ['c0', 'c1']
+
+def test_workers_share_writes(tmp_path):
+    """Test writes made by one worker show up in another, with the same pagination cursors"""
+    path = tmp_path / "state.db"
+    worker_a, creatives_a, _, _ = _open(path)
+    worker_b, creatives_b, _, _ = _open(path)
+    creatives_a['a'] = Creative(id='a', title='from_a', filename='a.jpg', type=CreativeTypeStrEnum.IMAGE)
+    creatives_b['b'] = Creative(id='b', title='from_b', filename='b.jpg', type=CreativeTypeStrEnum.IMAGE)
+    worker_a.flush()
+    worker_b.flush()
+    worker_a.flush()
+    assert [c.id for c in creatives_a.page()[0]] == [c.id for c in creatives_b.page()[0]] == ['a', 'b']
+    assert creatives_a.seq_of('b') == creatives_b.seq_of('b')
+
+    del creatives_b['a']
+    worker_b.flush()
+    worker_a.flush()
+    assert list(creatives_a) == ['b']
+    assert not creatives_a.has_title('from_a')
+
+def test_follower_write_wins_over_leader(tmp_path):
+    """Test a pause made in a follower isn't overwritten by a concurrent simulator tick in the leader"""
+    path = tmp_path / "state.db"
+    leader, _, campaigns_l, _ = _open(path)
+    follower, _, campaigns_f, _ = _open(path)
+    leader.elect(lambda leading: None)
+    follower.elect(lambda leading: None)
+    assert leader.leading and not follower.leading
+
+    campaigns_l['k'] = Campaign(id='k', title='shared_campaign', groups=['g1'], state=CampaignStateStrEnum.ACTIVE)
+    leader.flush()
+    follower.flush()
+    campaigns_l['k'].impressions['g1'] = 700 # a tick in the leader...
+    campaigns_l.touch('k')
+    campaigns_f['k'].state = CampaignStateStrEnum.PAUSED # ...while the follower pauses the campaign
+    campaigns_f.touch('k')
+    leader.flush()
+    follower.flush()
+    leader.flush()
+    assert campaigns_l['k'].state == campaigns_f['k'].state == CampaignStateStrEnum.PAUSED
+
+def test_lease_moves_to_another_worker(tmp_path):
+    """Test the simulator lease goes to another worker once the leader leaves"""
+    path = tmp_path / "state.db"
+    worker_a, *_ = _open(path)
+    worker_b, *_ = _open(path)
+    changes = []
+    worker_a.elect(lambda leading: changes.append(('a', leading)))
+    worker_b.elect(lambda leading: changes.append(('b', leading)))
+    worker_a.close()
+    worker_b._beat()
+    assert changes == [('a', True), ('b', True)]
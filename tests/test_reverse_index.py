@@ -0,0 +1,34 @@
+# tests/test_reverse_index.py - Test the reverse indexes kept in step with a store
+from api.store import IndexedStore
+from api.reverse_index import ReverseIndex
+from shared.models import Campaign
+
+
+def test_follows_inserts_updates_and_removals():
+    """Test the index follows every kind of store write"""
+    store = IndexedStore("Campaign")
+    index = ReverseIndex(store, lambda c: c.groups)
+    store['c1'] = Campaign(id='c1', title='one', groups=['g1', 'g2'])
+    store['c2'] = Campaign(id='c2', title='two', groups=['g2'])
+    assert index.referencing('g2') == ['c1', 'c2']
+
+    store.update('c1', lambda c: (c.groups.remove('g2'), c.groups.append('g3')))
+    assert index.referencing('g2') == ['c2']
+    assert index.referencing('g3') == ['c1']
+
+    del store['c2']
+    assert index.referencing('g2') == [] and not index.is_referenced('g2')
+    store.clear()
+    assert index.referencing('g1') == []
+
+def test_rebuild_after_load():
+    """Test loaded entities, which don't notify listeners, are indexed by rebuild"""
+    store = IndexedStore("Campaign")
+    index = ReverseIndex(store, lambda c: c.groups)
+    store.load([Campaign(id=f'c{i}', title=f'campaign_{i}', groups=['g', 'g']) for i in range(3)])
+    assert index.referencing('g') == []
+    index.rebuild()
+    assert index.referencing('g') == ['c0', 'c1', 'c2']
+    store.unload(['c1'])
+    index.rebuild()
+    assert index.referencing('g') == ['c0', 'c2']
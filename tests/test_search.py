@@ -0,0 +1,39 @@
+# tests/test_search.py - Test the title and description search index
+from api.store import IndexedStore
+from api.search import SearchIndex, TextIndex
+from shared.models import Campaign, Creative, CreativeTypeStrEnum, SearchMatchStrEnum
+
+
+def make_index():
+    campaigns = IndexedStore("Campaign")
+    creatives = IndexedStore("Creative")
+    index = SearchIndex([TextIndex(creatives, "creative"), TextIndex(campaigns, "campaign")])
+    for i, (title, description) in enumerate([("Summer Sale", "beach video"), ("Summer", ""), ("Winter sale", "summer leftovers"),
+                                              ("Big summer sale", "")]):
+        campaigns[f"c{i}"] = Campaign(id=f"c{i}", title=title, description=description)
+    creatives["v1"] = Creative(id="v1", title="summer_video", type=CreativeTypeStrEnum.VIDEO, filename="summer.mp4")
+    return index, campaigns
+
+def test_ranking():
+    """Test exact titles rank first, then title prefixes, title words and description words"""
+    index, _ = make_index()
+    hits = index.search("summer", kind="campaign")
+    assert [(hit.id, hit.match) for hit in hits] == [
+        ("c1", SearchMatchStrEnum.EXACT), ("c0", SearchMatchStrEnum.PREFIX),
+        ("c3", SearchMatchStrEnum.TITLE), ("c2", SearchMatchStrEnum.DESCRIPTION)]
+    assert [hit.title for hit in index.search("SUMMER SA", kind="campaign")] == ["Summer Sale", "Big summer sale"]
+    assert {hit.kind for hit in index.search("summ")} == {"campaign", "creative"}
+    assert len(index.search("summer", limit=2)) == 2
+    assert index.search("autumn") == []
+
+def test_follows_store_writes():
+    """Test renames and removals update the index, and rebuild matches incremental updates"""
+    index, campaigns = make_index()
+    campaigns.update("c1", lambda c: setattr(c, "title", "Autumn"))
+    del campaigns["c0"]
+    assert [hit.id for hit in index.search("summer", kind="campaign")] == ["c3", "c2"]
+    assert [hit.id for hit in index.search("aut")] == ["c1"]
+
+    incremental = [index.search(q) for q in ("summer", "sale", "w", "leftover")]
+    index.rebuild()
+    assert [index.search(q) for q in ("summer", "sale", "w", "leftover")] == incremental
@@ -0,0 +1,35 @@
+# tests/test_seeding.py - Test the generated seed datasets
+from api.seeding import SeedProfile, generate
+from shared.models import CreativeTypeStrEnum
+
+PROFILE = SeedProfile(creatives=300, groups=40, campaigns=8, creatives_per_group=(2, 5), groups_per_campaign=(1, 4))
+
+
+def test_same_seed_same_dataset():
+    """Test a seed reproduces ids, titles and memberships, and another seed doesn't"""
+    def snapshot(dataset):
+        return [(e.id, e.title, getattr(e, "creative_ids", None), getattr(e, "groups", None))
+                for kind in dataset for e in kind]
+
+    assert snapshot(generate(PROFILE, 7)) == snapshot(generate(PROFILE, 7))
+    assert snapshot(generate(PROFILE, 7)) != snapshot(generate(PROFILE, 8))
+
+def test_dataset_is_consistent():
+    """Test the counts, unique titles, media of every type, and references to generated entities"""
+    creatives, groups, campaigns = generate(PROFILE, 0)
+    assert (len(creatives), len(groups), len(campaigns)) == (300, 40, 8)
+    for kind in (creatives, groups, campaigns):
+        assert len({e.title for e in kind}) == len(kind)
+
+    assert {c.type for c in creatives} == {CreativeTypeStrEnum.VIDEO, CreativeTypeStrEnum.IMAGE, CreativeTypeStrEnum.HTML}
+    for c in creatives:
+        media = {CreativeTypeStrEnum.VIDEO: c.video, CreativeTypeStrEnum.IMAGE: c.image, CreativeTypeStrEnum.HTML: c.html}[c.type]
+        assert media.filename == c.filename
+
+    creative_ids = {c.id for c in creatives}
+    for g in groups:
+        assert 1 <= len(g.creative_ids) <= 5 and set(g.creative_ids) <= creative_ids
+    group_ids = {g.id for g in groups}
+    for c in campaigns:
+        assert 1 <= len(c.groups) <= 4 and set(c.groups) <= group_ids
+        assert c.impressions == dict.fromkeys(c.groups, 0) and c.clicks == dict.fromkeys(c.groups, 0)
@@ -0,0 +1,26 @@
+# tests/test_serialization.py - Test the fast JSON path renders the same bodies as the standard one
+from datetime import datetime
+from api import config, serialization
+from shared.models import CreativeTypeStrEnum, Creative, Campaign
+
+
+def _items():
+    return [Creative(id=f"c{i}", title=f"créa {i}", filename=f"c{i}.mp4", type=t, updated_at=datetime(2025, 1, 2, 3, 4, 5, 678))
+            for i, t in enumerate(CreativeTypeStrEnum)]
+
+def test_fast_models_match_standard(monkeypatch):
+    """Test pydantic-core renders model lists byte for byte like jsonable_encoder + json.dumps"""
+    campaign = Campaign(id='k', title='k', groups=['g1', 'g2'])
+    for model, items in ((Creative, _items()), (Campaign, [campaign])):
+        monkeypatch.setattr(config, "FAST_JSON", False)
+        standard = serialization.dumps(items, model)
+        monkeypatch.setattr(config, "FAST_JSON", True)
+        assert serialization.dumps(items, model) == standard
+
+def test_fast_dicts_match_standard(monkeypatch):
+    """Test projected and expanded items, which are plain dicts, render like the standard path"""
+    items = [c.model_dump(include={"id", "type", "updated_at"}) | {"details": [{"state": c.enabling_state}]} for c in _items()]
+    monkeypatch.setattr(config, "FAST_JSON", False)
+    standard = serialization.dumps(items)
+    monkeypatch.setattr(config, "FAST_JSON", True)
+    assert serialization.dumps(items) == standard
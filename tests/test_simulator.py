@@ -0,0 +1,182 @@
+# tests/test_simulator.py - Test the central impression scheduler
+import pytest
+from api.store import IndexedStore
+from api.simulator import ImpressionScheduler, fast_forward
+from api.allocation import UniformPolicy, ThompsonPolicy
+from api import config
+from shared.models import Campaign, CampaignStateStrEnum
+
+
+@pytest.fixture
+def campaign_store():
+    store = IndexedStore("Campaign")
+    for i in range(3):
+        store[f"c{i}"] = Campaign(id=f"c{i}", title=f"campaign_{i}", groups=[f"c{i}_g1", f"c{i}_g2"])
+    return store
+
+def test_tick_advances_only_active_campaigns(campaign_store):
+    """Test a tick increments every group of the ACTIVE campaigns only"""
+    scheduler = ImpressionScheduler(campaign_store, on_complete=lambda cid: None, seed=0)
+    for cid in ('c0', 'c2'):
+        campaign_store[cid].state = CampaignStateStrEnum.ACTIVE
+        scheduler.start_simulation(cid)
+    scheduler.tick()
+
+    for cid in ('c0', 'c2'):
+        for n in campaign_store[cid].impressions.values():
+            assert config.IMPRESSION_INCREMENT_MIN <= n <= config.IMPRESSION_INCREMENT_MAX
+    assert set(campaign_store['c1'].impressions.values()) == {0}
+
+def test_tick_reports_completed_campaigns(campaign_store):
+    """Test campaigns are completed once all their groups pass the target"""
+    completed = []
+    def on_complete(cid):
+        completed.append(cid)
+        campaign_store[cid].state = CampaignStateStrEnum.PAUSED
+
+    scheduler = ImpressionScheduler(campaign_store, on_complete=on_complete, seed=0)
+    for c in campaign_store.values():
+        c.state = CampaignStateStrEnum.ACTIVE
+        scheduler.start_simulation(c.id)
+    campaign_store['c1'].impressions = {'c1_g1': config.IMPRESSION_TARGET, 'c1_g2': config.IMPRESSION_TARGET - 1}
+
+    assert scheduler.tick() == ['c1']
+    for _ in range(20):
+        scheduler.tick()
+    assert sorted(completed) == ['c0', 'c1', 'c2']
+    assert all(c.state == CampaignStateStrEnum.PAUSED for c in campaign_store.values())
+    assert scheduler.simulations() == []
+
+def test_max_campaigns_per_tick_round_robin(campaign_store):
+    """Test the per-tick cap serves campaigns in turn"""
+    scheduler = ImpressionScheduler(campaign_store, on_complete=lambda cid: None, max_campaigns_per_tick=2, seed=0)
+    for c in campaign_store.values():
+        c.state = CampaignStateStrEnum.ACTIVE
+        scheduler.start_simulation(c.id)
+    scheduler.tick()
+    scheduler.tick()
+    # 4 campaign slots over 3 campaigns: everyone was advanced at least once
+    assert all(min(c.impressions.values()) > 0 for c in campaign_store.values())
+
+def test_registry_is_idempotent_and_cancellable(campaign_store):
+    """Test a campaign has at most one simulation, and cancelling stops it before the next tick"""
+    scheduler = ImpressionScheduler(campaign_store, on_complete=lambda cid: None, seed=0)
+    campaign_store['c0'].state = CampaignStateStrEnum.ACTIVE
+    assert scheduler.start_simulation('c0')
+    assert not scheduler.start_simulation('c0')
+    scheduler.tick()
+    assert [(s.campaign_id, s.ticks) for s in scheduler.simulations()] == [('c0', 1)]
+
+    assert scheduler.cancel_simulation('c0')
+    before = dict(campaign_store['c0'].impressions)
+    scheduler.tick()
+    assert campaign_store['c0'].impressions == before
+    assert scheduler.simulations() == []
+
+def test_tick_records_increments_in_series(campaign_store):
+    """Test each tick records the per-group increments"""
+    from api.timeseries import TimeSeriesStore
+    series = TimeSeriesStore(max_series=16, tick_slots=8)
+    scheduler = ImpressionScheduler(campaign_store, on_complete=lambda cid: None, series=series, seed=0)
+    campaign_store['c0'].state = CampaignStateStrEnum.ACTIVE
+    scheduler.start_simulation('c0')
+    scheduler.tick()
+    scheduler.tick()
+    for gid, total in campaign_store['c0'].impressions.items():
+        points = series.points(('c0', gid))
+        assert len(points) == 2
+        assert sum(n for _, n in points) == total
+
+@pytest.mark.parametrize("policy", [UniformPolicy(), ThompsonPolicy()], ids=["uniform", "thompson"])
+@pytest.mark.parametrize("cap, admitted", [(0, 0), (7, 0), (3, 5)])
+def test_fast_forward_matches_real_time_scheduler(cap, admitted, policy):
+    """Test the fast-forward run completes every campaign on the same tick with the same impressions as the scheduler"""
+    store = IndexedStore("Campaign")
+    for i in range(40):
+        groups = [f"c{i}_g{j}" for j in range(1 + i % 4)]
+        store[f"c{i}"] = Campaign(id=f"c{i}", title=f"campaign_{i}", groups=groups, state=CampaignStateStrEnum.ACTIVE)
+    store['c3'].impressions['c3_g0'] = 9000 # mid-way campaigns resume from their current impressions
+    run = fast_forward(store.values(), seed=7, max_campaigns_per_tick=cap, max_active_campaigns=admitted, policy=policy)
+
+    completed = {}
+    def admit(cid):
+        while (next_id := scheduler.next_admission()) is not None:
+            scheduler.start_simulation(next_id)
+    scheduler = ImpressionScheduler(store, on_complete=admit, policy=policy, max_campaigns_per_tick=cap,
+                                    max_active_campaigns=admitted, seed=7)
+    for c in store.values():
+        if scheduler.has_capacity():
+            scheduler.start_simulation(c.id)
+        else:
+            scheduler.enqueue(c.id)
+    tick = 0
+    while scheduler.simulations():
+        tick += 1
+        for cid in scheduler.tick():
+            completed[cid] = tick
+
+    assert run.seed == 7 and run.ticks == tick
+    for result in run.campaigns:
+        assert result.completed_tick == completed[result.campaign_id]
+        assert result.impressions == store[result.campaign_id].impressions
+        assert result.clicks == store[result.campaign_id].clicks
+        assert result.champion_group_ids == policy.champions(result.impressions, result.clicks)
+
+def test_fast_forward_trajectories(campaign_store):
+    """Test trajectories hold the impressions after each tick up to completion"""
+    run = fast_forward(campaign_store.values(), seed=0, trajectories=True, is_eligible=lambda gid: gid != 'c0_g1')
+    for result in run.campaigns:
+        for gid, points in result.trajectory.items():
+            assert len(points) == result.completed_tick
+            assert points[-1] == result.impressions[gid]
+            assert points == sorted(points)
+        assert 'c0_g1' not in result.champion_group_ids
+    # Nothing was written to the campaigns
+    assert all(set(c.impressions.values()) == {0} for c in campaign_store.values())
+
+def test_admission_queue_and_load_guard(campaign_store):
+    """Test launches over the cap are admitted first queued first, and the guard shrinks the batch"""
+    from api.load_guard import LoadGuard
+    guard = LoadGuard(max_lag=0.1, max_p99=0)
+    scheduler = ImpressionScheduler(campaign_store, on_complete=lambda cid: None, guard=guard, max_active_campaigns=1, seed=0)
+    assert scheduler.has_capacity()
+    scheduler.start_simulation('c0')
+    assert not scheduler.has_capacity()
+    for cid in ('c2', 'c1', 'c2'):
+        scheduler.enqueue(cid)
+    assert scheduler.queued() == ['c2', 'c1']
+    assert scheduler.next_admission() is None
+
+    scheduler.cancel_simulation('c0')
+    assert not scheduler.has_capacity() # queued launches go first
+    assert scheduler.next_admission() == 'c2'
+    scheduler.start_simulation('c2')
+    assert scheduler.dequeue('c1') and scheduler.queued() == []
+
+    scheduler.max_active_campaigns = 0
+    for c in campaign_store.values():
+        c.state = CampaignStateStrEnum.ACTIVE
+        scheduler.start_simulation(c.id)
+    guard.update(lag=1.0)
+    guard.update(lag=1.0)
+    scheduler.tick()
+    assert sum(min(c.impressions.values()) > 0 for c in campaign_store.values()) == 1
+
+def test_stale_simulation_frees_its_slot(campaign_store):
+    """Test a campaign paused without cancelling its simulation is dropped at tick time, and a queued one takes its slot"""
+    admitted = []
+    def admit():
+        while (cid := scheduler.next_admission()) is not None:
+            campaign_store[cid].state = CampaignStateStrEnum.ACTIVE
+            scheduler.start_simulation(cid)
+            admitted.append(cid)
+    scheduler = ImpressionScheduler(campaign_store, on_complete=lambda cid: None, on_release=admit, max_active_campaigns=1, seed=0)
+    campaign_store['c0'].state = CampaignStateStrEnum.ACTIVE
+    scheduler.start_simulation('c0')
+    scheduler.enqueue('c1')
+    campaign_store['c0'].state = CampaignStateStrEnum.PAUSED
+
+    scheduler.tick()
+    assert not scheduler.is_running('c0') and admitted == ['c1'] and scheduler.queued() == []
+    scheduler.tick()
+    assert min(campaign_store['c1'].impressions.values()) > 0
@@ -0,0 +1,66 @@
+# tests/test_store.py - Test the indexed entity store
+import pytest
+from api.store import IndexedStore
+from shared.models import CreativeTypeStrEnum, Creative
+
+
+def _creative(id, title):
+    return Creative(id=id, title=title, filename=f"{title}.mp4", type=CreativeTypeStrEnum.VIDEO)
+
+def test_title_index_follows_insert_and_removal():
+    """Test the title index is kept in sync with the store"""
+    store = IndexedStore("Creative")
+    store['1'] = _creative('1', 'a')
+    store['2'] = _creative('2', 'b')
+    assert store.has_title('a')
+    assert store.get_id_by_title('b') == '2'
+    assert store.get_by_title('a').id == '1'
+
+    del store['1']
+    assert not store.has_title('a')
+    assert store.get_id_by_title('a') is None
+    assert len(store) == 1
+
+def test_replace_reindexes_title():
+    """Test replacing an entity under the same id moves its title entry"""
+    store = IndexedStore("Creative")
+    store['1'] = _creative('1', 'old')
+    store['1'] = _creative('1', 'new')
+    assert not store.has_title('old')
+    assert store.get_id_by_title('new') == '1'
+
+def test_duplicate_title_rejected():
+    """Test a title can only be owned by one id"""
+    store = IndexedStore("Creative")
+    store['1'] = _creative('1', 'a')
+    with pytest.raises(ValueError):
+        store['2'] = _creative('2', 'a')
+    assert '2' not in store
+
+def test_page_cursor_is_stable_across_removals():
+    """Test a cursor keeps its position when earlier entities are removed"""
+    store = IndexedStore("Creative")
+    for i in range(6):
+        store[str(i)] = _creative(str(i), f"t{i}")
+
+    first, cursor = store.page(limit=2)
+    assert [c.id for c in first] == ['0', '1']
+    for key in ('0', '1', '2', '3'):
+        del store[key]
+    rest, cursor = store.page(limit=2, after=cursor)
+    assert [c.id for c in rest] == ['4', '5']
+
+    evens, _ = store.page(predicate=lambda c: int(c.id) % 2 == 0)
+    assert [c.id for c in evens] == ['4']
+
+def test_version_bumps_on_every_write():
+    """Test inserts, removals and touch() all bump the store version"""
+    store = IndexedStore("Creative")
+    versions = [store.version]
+    store['1'] = _creative('1', 'a')
+    versions.append(store.version)
+    store.touch()
+    versions.append(store.version)
+    del store['1']
+    versions.append(store.version)
+    assert versions == sorted(set(versions))
@@ -0,0 +1,38 @@
+# tests/test_streaming.py - Test campaign update streaming
+import asyncio
+import json
+from api.streaming import CampaignBroadcaster, sse_frames
+from shared.models import Campaign, CampaignStateStrEnum
+
+
+def _parse(event: str) -> dict:
+    data_line = [line for line in event.splitlines() if line.startswith("data: ")][0]
+    return json.loads(data_line[len("data: "):])
+
+def test_slow_consumer_gets_latest_frame_with_full_delta():
+    """Test intermediate frames are dropped and the delta covers everything since the last frame read"""
+    async def scenario():
+        broadcaster = CampaignBroadcaster()
+        campaign = Campaign(id='c1', title='stream_campaign', groups=['g1', 'g2'])
+        subscription = broadcaster.subscribe('c1')
+        events = sse_frames(subscription)
+
+        broadcaster.publish([campaign])
+        first = _parse(await events.__anext__())
+        assert first['impressions'] == {'g1': 0, 'g2': 0}
+
+        campaign.state = CampaignStateStrEnum.ACTIVE
+        for n in (100, 250, 700):
+            campaign.impressions = {'g1': n, 'g2': 2 * n}
+            broadcaster.publish([campaign])
+        latest = _parse(await events.__anext__())
+        assert latest['state'] == CampaignStateStrEnum.ACTIVE
+        assert latest['impressions'] == {'g1': 700, 'g2': 1400}
+        assert latest['delta'] == {'g1': 700, 'g2': 1400}
+        assert latest['dropped'] == 2
+
+        broadcaster.unsubscribe('c1', subscription)
+        broadcaster.publish([campaign])
+        assert subscription._pending is None
+
+    asyncio.run(scenario())
@@ -0,0 +1,43 @@
+# tests/test_timeseries.py - Test the impression time series ring buffers
+from api.timeseries import TimeSeriesStore
+
+
+def test_tick_ring_keeps_latest_points():
+    """Test the raw ring keeps the last tick_slots points, oldest first"""
+    store = TimeSeriesStore(max_series=4, tick_slots=3, chunk=2)
+    for t in range(5):
+        store.record_many([('c', 'g')], [t + 1], ts=1000.0 + t)
+    assert store.points(('c', 'g')) == [(1002.0, 3), (1003.0, 4), (1004.0, 5)]
+    assert store.points(('c', 'other')) == []
+
+def test_rollups_sum_buckets_and_skip_gaps():
+    """Test minute rollups sum points per bucket, zero skipped buckets and stay bounded"""
+    store = TimeSeriesStore(max_series=4, tick_slots=3, minute_slots=3)
+    store.record_many([('c', 'g')], [1], ts=0)
+    store.record_many([('c', 'g')], [2], ts=30)
+    store.record_many([('c', 'g')], [4], ts=125) # skips minute 1
+    assert store.points(('c', 'g'), "minute") == [(0, 3), (60, 0), (120, 4)]
+
+    store.record_many([('c', 'g')], [8], ts=190)
+    assert store.points(('c', 'g'), "minute") == [(60, 0), (120, 4), (180, 8)]
+    assert store.points(('c', 'g'), "hour") == [(0, 15)]
+
+def test_rows_are_bounded_and_recycled():
+    """Test series beyond max_series are dropped, and dropped rows are reused"""
+    store = TimeSeriesStore(max_series=2, tick_slots=2, chunk=1)
+    store.record_many([('c', 'g1'), ('c', 'g2'), ('c', 'g3')], [1, 2, 3], ts=0)
+    assert len(store) == 2 and store.dropped == 1
+    nbytes = store.nbytes
+
+    store.drop([('c', 'g1')])
+    store.record_many([('c', 'g3')], [3], ts=1)
+    assert store.points(('c', 'g3')) == [(1.0, 3)]
+    assert store.nbytes == nbytes
+
+def test_counts_beyond_int32():
+    """Test counts over 2**31 are kept, and summed into rollups without wrapping around"""
+    store = TimeSeriesStore(max_series=1)
+    store.record_many([('c', 'g')], [2**31], ts=0)
+    store.record_many([('c', 'g')], [2**40], ts=1)
+    assert store.points(('c', 'g')) == [(0.0, 2**31), (1.0, 2**40)]
+    assert store.points(('c', 'g'), "minute") == [(0, 2**31 + 2**40)]